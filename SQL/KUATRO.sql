@@ -21,4 +21,66 @@ CREATE TABLE Partidas(
     FechaCreacion TIMESTAMP DEFAULT SYSTIMESTAMP,
     CONSTRAINT fk_partida_jugador FOREIGN KEY (IDJUGADOR) REFERENCES Jugadores(JugadorID),
     CONSTRAINT fk_partida_rival FOREIGN KEY (IDRival) REFERENCES Jugadores(JugadorID)
-);
\ No newline at end of file
+);
+
+-- Historial de jugadas (solo inserción). La foto del tablero está en
+-- Partidas.Tablero (ver abajo) y se actualiza cada KUATRO_SNAPSHOT_CADA
+-- jugadas y al terminar la partida.
+CREATE TABLE Jugadas (
+    PartidaID NUMBER,
+    Numero NUMBER(2),
+    Columna NUMBER(1),
+    CONSTRAINT pk_jugadas PRIMARY KEY (PartidaID, Numero),
+    CONSTRAINT fk_jugadas_partida FOREIGN KEY (PartidaID) REFERENCES Partidas(PartidaID)
+) ORGANIZATION INDEX;
+
+-- Foto compacta del tablero: 42 símbolos ('.', '0', '1') desde la fila de
+-- arriba. Partida queda en NULL para filas nuevas o migradas con
+-- `flask --app app migrar-tableros`.
+ALTER TABLE Partidas ADD (Tablero VARCHAR2(42));
+
+-- Jugador reservado para la computadora (ver ia.JUGADOR_IA)
+INSERT INTO Jugadores (Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas)
+VALUES ('Computadora', 0, 0, 0, 0, 0);
+COMMIT;
+
+-- Índices para el listado paginado de partidas (llave FechaCreacion, PartidaID)
+-- y para buscar la partida en progreso entre dos jugadores
+CREATE INDEX ix_partidas_fecha ON Partidas (FechaCreacion, PartidaID);
+CREATE INDEX ix_partidas_estado_fecha ON Partidas (Estado, FechaCreacion, PartidaID);
+CREATE INDEX ix_partidas_jugador_fecha ON Partidas (IDJUGADOR, FechaCreacion, PartidaID);
+CREATE INDEX ix_partidas_rival_fecha ON Partidas (IDRival, FechaCreacion, PartidaID);
+CREATE INDEX ix_partidas_en_progreso ON Partidas (Estado, IDJUGADOR, IDRival, FechaCreacion);
+CREATE INDEX ix_jugadores_nombre ON Jugadores (Nombre);
+
+-- Registro de resultados: una fila por partida terminada (Ganador 0/1,
+-- NULL si fue empate). La llave PartidaID hace que un resultado repetido no
+-- vuelva a sumar. `flask --app app reagregar-estadisticas` recalcula
+-- Jugadores desde aquí.
+CREATE TABLE Resultados (
+    PartidaID NUMBER PRIMARY KEY REFERENCES Partidas (PartidaID),
+    IDJUGADOR NUMBER NOT NULL REFERENCES Jugadores (JugadorID),
+    IDRival NUMBER NOT NULL REFERENCES Jugadores (JugadorID),
+    Ganador NUMBER(1) CHECK (Ganador IN (0, 1)),
+    FechaRegistro TIMESTAMP DEFAULT SYSTIMESTAMP
+);
+
+-- Rating Elo de cada jugador; lo mueve el registro de resultados y se
+-- recalcula desde Resultados con `flask --app app recalcular-ratings`
+ALTER TABLE Jugadores ADD (Rating NUMBER DEFAULT 1500 NOT NULL);
+
+-- Resumen de todas las partidas terminadas que calcula
+-- `flask --app app analizar-partidas` (JSON); /api/estadisticas_globales lo
+-- sirve tal cual sin leer Partidas
+CREATE TABLE EstadisticasGlobales (
+    Clave VARCHAR2(30) PRIMARY KEY,
+    Datos CLOB CHECK (Datos IS JSON),
+    FechaCalculo TIMESTAMP DEFAULT SYSTIMESTAMP
+);
+
+-- Nombre (sin distinguir mayúsculas) e Identificacion únicos. El registro
+-- inserta directo y un ORA-00001 significa que ya existe; antes contaba con
+-- LOWER(Nombre) = LOWER(:nombre), que recorría toda la tabla. Si hay
+-- duplicados viejos, hay que resolverlos antes de crear los índices.
+CREATE UNIQUE INDEX ux_jugadores_nombre ON Jugadores (LOWER(Nombre));
+CREATE UNIQUE INDEX ux_jugadores_identificacion ON Jugadores (Identificacion);
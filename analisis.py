@@ -0,0 +1,171 @@
+# Estadísticas globales de las partidas terminadas.
+#
+# `flask --app app analizar-partidas` recorre Partidas con un cursor, de a
+# ANALISIS_LOTE partidas: los tableros finales se decodifican de una vez en un
+# arreglo de NumPy de forma (partidas, 6, 7) y todo se calcula con
+# operaciones sobre el arreglo completo, sin un ciclo de Python por partida:
+#
+#   - quién ganó (cuatro en línea buscado con cortes del arreglo), victorias
+#     del que mueve primero, empates y partidas abandonadas;
+#   - mapa de calor de casillas ocupadas y fichas por columna;
+#   - duración de las partidas (histograma y promedio);
+#   - columnas de apertura y cómo le fue al primero con cada una;
+#   - para los ANALISIS_JUGADORES jugadores con más partidas, sus aperturas y
+#     la matriz de enfrentamientos (victorias y empates de cada uno contra
+#     cada otro).
+#
+# El resultado se guarda como JSON en EstadisticasGlobales y
+# /api/estadisticas_globales lo sirve sin tocar Partidas. NumPy solo hace
+# falta para calcular (pip install numpy); la aplicación arranca sin él.
+import itertools
+import json
+import os
+
+import click
+
+from motor import COLUMNAS, FILAS
+from repositorio import obtener_repositorio
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ANALISIS_LOTE = int(os.environ.get('KUATRO_ANALISIS_LOTE', '50000'))
+ANALISIS_JUGADORES = int(os.environ.get('KUATRO_ANALISIS_JUGADORES', '20'))
+CLAVE_RESUMEN = 'partidas'
+CASILLAS = FILAS * COLUMNAS
+
+# Sin ganador, gana el que movió primero (IDJUGADOR) o el segundo (IDRival)
+NADIE, PRIMERO, SEGUNDO = 0, 1, 2
+
+
+def decodificar_tableros(codigos):
+    # Códigos de motor.codificar ('.', '0', '1' desde la fila de arriba) -> (n, 6, 7) con 0, PRIMERO, SEGUNDO
+    valores = np.zeros(256, dtype=np.int8)
+    valores[ord('0')], valores[ord('1')] = PRIMERO, SEGUNDO
+    bytes_ = np.frombuffer(''.join(codigos).encode('ascii'), dtype=np.uint8)
+    return valores[bytes_].reshape(-1, FILAS, COLUMNAS)
+
+
+def ganadores(tableros):
+    # (n,) con el ganador de cada tablero: las cuatro direcciones como cortes desplazados del arreglo
+    resultado = np.full(len(tableros), NADIE, dtype=np.int8)
+    for ficha in (PRIMERO, SEGUNDO):
+        m = tableros == ficha
+        cuatro = (
+            (m[:, :, :-3] & m[:, :, 1:-2] & m[:, :, 2:-1] & m[:, :, 3:]).any(axis=(1, 2))
+            | (m[:, :-3, :] & m[:, 1:-2, :] & m[:, 2:-1, :] & m[:, 3:, :]).any(axis=(1, 2))
+            | (m[:, :-3, :-3] & m[:, 1:-2, 1:-2] & m[:, 2:-1, 2:-1] & m[:, 3:, 3:]).any(axis=(1, 2))
+            | (m[:, 3:, :-3] & m[:, 2:-1, 1:-2] & m[:, 1:-2, 2:-1] & m[:, :-3, 3:]).any(axis=(1, 2))
+        )
+        resultado[cuatro] = ficha
+    return resultado
+
+
+class Acumulado:
+    # Sumas de todos los lotes; lo que es por jugador se guarda por partida (unos bytes cada una)
+    def __init__(self):
+        self.ocupadas = np.zeros((FILAS, COLUMNAS), dtype=np.int64)
+        self.duraciones = np.zeros(CASILLAS + 1, dtype=np.int64)
+        self._jugador1, self._jugador2, self._ganador, self._llena, self._primera = [], [], [], [], []
+
+    def agregar(self, filas):
+        jugador1, jugador2, codigos, primeras = zip(*filas)
+        tableros = decodificar_tableros(codigos)
+        ocupadas = tableros != 0
+        fichas = ocupadas.sum(axis=(1, 2))
+        self.ocupadas += ocupadas.sum(axis=0)
+        self.duraciones += np.bincount(fichas, minlength=CASILLAS + 1)
+        self._jugador1.append(np.array(jugador1, dtype=np.int64))
+        self._jugador2.append(np.array(jugador2, dtype=np.int64))
+        self._ganador.append(ganadores(tableros))
+        self._llena.append(fichas == CASILLAS)
+        self._primera.append(np.array([-1 if c is None else c for c in primeras], dtype=np.int8))
+
+    def resumen(self, nombres, cantidad_jugadores=ANALISIS_JUGADORES):
+        if not self._ganador:
+            return {'partidas': 0}
+        jugador1, jugador2 = np.concatenate(self._jugador1), np.concatenate(self._jugador2)
+        ganador, llena = np.concatenate(self._ganador), np.concatenate(self._llena)
+        primera = np.concatenate(self._primera)
+        partidas = len(ganador)
+        empate = (ganador == NADIE) & llena
+        con_resultado = (ganador != NADIE) | empate
+        victorias_primero = int((ganador == PRIMERO).sum())
+        decididas = int(con_resultado.sum())
+
+        # Aperturas: columna de la primera jugada, si se conoce el historial
+        conocida = primera >= 0
+        aperturas = np.bincount(primera[conocida], minlength=COLUMNAS)
+        ganadas_apertura = np.bincount(primera[conocida & (ganador == PRIMERO)], minlength=COLUMNAS)
+        decididas_apertura = np.bincount(primera[conocida & con_resultado], minlength=COLUMNAS)
+
+        # Jugadores: índices densos y los que más partidas tienen
+        ids, indices = np.unique(np.concatenate([jugador1, jugador2]), return_inverse=True)
+        indice1, indice2 = indices[:partidas], indices[partidas:]
+        por_jugador = np.bincount(indices, minlength=len(ids))
+        elegidos = np.argsort(-por_jugador, kind='stable')[:cantidad_jugadores]
+        lugar = np.full(len(ids), -1)
+        lugar[elegidos] = np.arange(len(elegidos))
+        n = len(elegidos)
+
+        aperturas_jugador = np.bincount(indice1[conocida] * COLUMNAS + primera[conocida],
+                                        minlength=len(ids) * COLUMNAS).reshape(len(ids), COLUMNAS)[elegidos]
+        a, b = lugar[indice1], lugar[indice2]
+        entre_elegidos = (a >= 0) & (b >= 0)
+        # victorias[i][j]: partidas que el jugador i le ganó al j
+        gano1, gano2 = entre_elegidos & (ganador == PRIMERO), entre_elegidos & (ganador == SEGUNDO)
+        victorias = (np.bincount(a[gano1] * n + b[gano1], minlength=n * n)
+                     + np.bincount(b[gano2] * n + a[gano2], minlength=n * n)).reshape(n, n)
+        empatadas = entre_elegidos & empate
+        empates = np.bincount(a[empatadas] * n + b[empatadas], minlength=n * n).reshape(n, n)
+        empates = empates + empates.T
+
+        return {
+            'partidas': partidas,
+            'victorias_primero': victorias_primero,
+            'victorias_segundo': int((ganador == SEGUNDO).sum()),
+            'empates': int(empate.sum()),
+            'abandonadas': partidas - decididas,
+            'tasa_victoria_primero': round(victorias_primero / decididas, 4) if decididas else None,
+            'duracion_promedio': round(float((self.duraciones * np.arange(CASILLAS + 1)).sum()) / partidas, 2),
+            'duraciones': self.duraciones.tolist(),
+            'mapa_calor': self.ocupadas.tolist(),
+            'fichas_por_columna': self.ocupadas.sum(axis=0).tolist(),
+            'aperturas': aperturas.tolist(),
+            'tasa_victoria_apertura': [round(int(g) / int(d), 4) if d else None
+                                       for g, d in zip(ganadas_apertura, decididas_apertura)],
+            'jugadores': [{'JugadorID': int(ids[i]), 'Nombre': nombres.get(int(ids[i])),
+                           'partidas': int(por_jugador[i]), 'aperturas': aperturas_jugador[k].tolist()}
+                          for k, i in enumerate(elegidos)],
+            'enfrentamientos': {'victorias': victorias.tolist(), 'empates': empates.tolist()},
+        }
+
+
+def analizar(repositorio, lote=ANALISIS_LOTE, cantidad_jugadores=ANALISIS_JUGADORES):
+    acumulado = Acumulado()
+    partidas = repositorio.partidas_terminadas(lote)
+    while True:
+        filas = list(itertools.islice(partidas, lote))
+        if not filas:
+            break
+        acumulado.agregar(filas)
+    nombres = {jugador_id: nombre for jugador_id, nombre, _ in repositorio.ratings()}
+    return acumulado.resumen(nombres, cantidad_jugadores)
+
+
+#################################################################
+@click.command('analizar-partidas')
+@click.option('--lote', default=ANALISIS_LOTE, show_default=True,
+              help='Partidas por arreglo (y filas por viaje a la base)')
+@click.option('--jugadores', default=ANALISIS_JUGADORES, show_default=True,
+              help='Jugadores con más partidas que entran en aperturas y enfrentamientos')
+def analizar_partidas_comando(lote, jugadores):
+    """Calcula las estadísticas globales de las partidas terminadas."""
+    if np is None:
+        raise click.ClickException('analizar-partidas necesita NumPy: pip install numpy')
+    repositorio = obtener_repositorio()
+    resumen = analizar(repositorio, lote, jugadores)
+    repositorio.guardar_estadisticas_globales(CLAVE_RESUMEN, json.dumps(resumen, ensure_ascii=False))
+    click.echo(f"Partidas analizadas: {resumen['partidas']}")
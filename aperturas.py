@@ -0,0 +1,167 @@
+# Libro de aperturas precalculado.
+#
+# El archivo es una secuencia ordenada de registros de ancho fijo
+# (llave, valor, columna) donde la llave es la posición canónica: entre la
+# posición y su reflejo horizontal se usa la de llave menor, así cada par de
+# posiciones simétricas ocupa un solo registro. Se consulta con búsqueda
+# binaria sobre un mmap, de modo que varios procesos comparten la misma copia
+# en la caché de páginas del sistema y abrirlo no cuesta nada.
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from motor import ALTO, COLUMNAS, Posicion
+
+# llave (u64), valor para el jugador en turno (i16), columna (i8), relleno
+REGISTRO = struct.Struct('<Qhbx')
+
+RUTA_LIBRO = os.environ.get('KUATRO_LIBRO', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aperturas.bin'))
+
+
+def espejo(bits):
+    reflejo = 0
+    for c in range(COLUMNAS):
+        reflejo |= ((bits >> (c * ALTO)) & ((1 << ALTO) - 1)) << ((COLUMNAS - 1 - c) * ALTO)
+    return reflejo
+
+
+def llave_canonica(posicion):
+    # Devuelve (llave, reflejada); si reflejada, las columnas van invertidas
+    actual = posicion.piezas[posicion.turno]
+    llave = actual + posicion.mascara
+    llave_espejo = espejo(actual) + espejo(posicion.mascara)
+    if llave_espejo < llave:
+        return llave_espejo, True
+    return llave, False
+
+
+class LibroAperturas:
+    def __init__(self, ruta):
+        self.archivo = open(ruta, 'rb')
+        tamano = os.fstat(self.archivo.fileno()).st_size
+        if tamano % REGISTRO.size:
+            self.archivo.close()
+            raise ValueError(f'{ruta} no tiene registros de {REGISTRO.size} bytes')
+        self.registros = tamano // REGISTRO.size
+        self.datos = mmap.mmap(self.archivo.fileno(), 0, access=mmap.ACCESS_READ) if tamano else b''
+
+    def buscar(self, posicion):
+        # (columna, valor) para la posición o None si no está en el libro
+        llave, reflejada = llave_canonica(posicion)
+        bajo, alto = 0, self.registros
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            actual, valor, columna = REGISTRO.unpack_from(self.datos, medio * REGISTRO.size)
+            if actual < llave:
+                bajo = medio + 1
+            elif actual > llave:
+                alto = medio
+            else:
+                return (COLUMNAS - 1 - columna if reflejada else columna), valor
+        return None
+
+    def cerrar(self):
+        if self.registros:
+            self.datos.close()
+        self.archivo.close()
+
+
+_libro = None
+_libro_cargado = False
+_lock = threading.Lock()
+
+
+def obtener_libro():
+    # Se abre una vez por proceso; sin archivo simplemente no hay libro
+    global _libro, _libro_cargado
+    if not _libro_cargado:
+        with _lock:
+            if not _libro_cargado:
+                try:
+                    _libro = LibroAperturas(RUTA_LIBRO)
+                except (OSError, ValueError):
+                    _libro = None
+                _libro_cargado = True
+    return _libro
+
+
+def consultar_libro(posicion):
+    libro = obtener_libro()
+    if libro is None:
+        return None
+    return libro.buscar(posicion)
+
+
+##################################################################
+# Generación del libro (fuera de línea)
+def posiciones_hasta(ply):
+    # Todas las posiciones canónicas no terminadas con hasta `ply` fichas
+    vistas = set()
+    nivel = [Posicion()]
+    resultado = []
+    for _ in range(ply + 1):
+        siguiente = []
+        for posicion in nivel:
+            llave, _ = llave_canonica(posicion)
+            if llave in vistas or posicion.terminada:
+                continue
+            vistas.add(llave)
+            resultado.append(posicion)
+            for col in posicion.jugadas_legales():
+                hija = posicion.copia()
+                hija.jugar(col)
+                siguiente.append(hija)
+        nivel = siguiente
+    return resultado
+
+
+_buscador_libro = None
+
+
+def _evaluar(piezas, profundidad, segundos):
+    # Corre en los procesos del generador; cada uno conserva su tabla
+    from ia import Buscador
+    global _buscador_libro
+    if _buscador_libro is None:
+        _buscador_libro = Buscador()
+    posicion = Posicion(piezas)
+    columna, valor, _ = _buscador_libro.buscar(posicion, profundidad, segundos)
+    llave, reflejada = llave_canonica(posicion)
+    return llave, valor, (COLUMNAS - 1 - columna if reflejada else columna)
+
+
+def generar_libro(ruta, ply, profundidad, segundos, procesos=None):
+    posiciones = posiciones_hasta(ply)
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        registros = list(ejecutor.map(
+            _evaluar,
+            [p.piezas for p in posiciones],
+            [profundidad] * len(posiciones),
+            [segundos] * len(posiciones),
+            chunksize=64
+        ))
+    registros.sort()
+    # Se escribe aparte y se reemplaza de un golpe: los procesos que tengan el
+    # archivo viejo mapeado siguen leyendo su copia
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as salida:
+        for llave, valor, columna in registros:
+            salida.write(REGISTRO.pack(llave, valor, columna))
+    os.replace(temporal, ruta)
+    return len(registros)
+
+
+@click.command('generar-aperturas')
+@click.option('--ply', default=8, show_default=True, help='Fichas máximas de las posiciones incluidas')
+@click.option('--profundidad', default=16, show_default=True, help='Profundidad máxima de la búsqueda por posición')
+@click.option('--segundos', default=1.0, show_default=True, help='Tiempo de búsqueda por posición')
+@click.option('--procesos', default=None, type=int, help='Procesos en paralelo (por defecto, todos los núcleos)')
+@click.option('--salida', default=RUTA_LIBRO, show_default=True, help='Archivo a generar')
+def generar_aperturas_comando(ply, profundidad, segundos, procesos, salida):
+    """Evalúa las aperturas hasta --ply fichas y escribe el libro binario."""
+    total = generar_libro(salida, ply, profundidad, segundos, procesos)
+    click.echo(f'{total} posiciones escritas en {salida}')
@@ -1,29 +1,116 @@
 from flask import json
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, jsonify
-import oracledb
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, g
+from flask import before_render_template, template_rendered, got_request_exception
+import hashlib
+import itertools
+import logging
 import os
+import threading
+import time
+from datetime import datetime
+
+from db import PoolAgotado, estadisticas_pool, verificar_salud, POOL_WAIT_MS
+from motor import Posicion, JugadaInvalida, COLUMNAS, VACIO, codificar, partida_json_desde_codigo
+from jugadas import migrar_tableros_comando
+from jugadores import IndiceNombres
+import ia
+from aperturas import consultar_libro, generar_aperturas_comando
+from cache import CacheTTL
+from exportacion import lineas_ndjson, exportacion_permitida, exportar_comando, importar_comando
+from rango import IndiceRango, RATING_INICIAL, recalcular_ratings_comando
+from emparejamiento import emparejador
+from torneo import torneo_comando
+from analisis import CLAVE_RESUMEN, analizar_partidas_comando
+from recursos import Recursos
+import metricas
+from repositorio import (obtener_repositorio as repositorio, SinConexion, JugadorDuplicado, JugadorNoEncontrado,
+                         PartidaNoEncontrada, PartidaNoEnProgreso, TurnoIncorrecto, PartidaCambio,
+                         reagregar_estadisticas_comando)
+from transmision import suscribir, transmitir, notificar, estadisticas_transmision
 
 app = Flask(__name__)
+log = logging.getLogger(__name__)
 app.secret_key = 'mi_clave_secreta'
+app.cli.add_command(migrar_tableros_comando)
+app.cli.add_command(generar_aperturas_comando)
+app.cli.add_command(reagregar_estadisticas_comando)
+app.cli.add_command(exportar_comando)
+app.cli.add_command(importar_comando)
+app.cli.add_command(recalcular_ratings_comando)
+app.cli.add_command(torneo_comando)
+app.cli.add_command(analizar_partidas_comando)
+
+# Escalafón completo en memoria; se invalida al cambiar estadísticas o registrar jugadores
+ESCALAFON_TTL = int(os.environ.get('KUATRO_ESCALAFON_TTL', '30'))
+escalafon_cache = CacheTTL(ESCALAFON_TTL)
+# Lugar de cada jugador por rating; se rearma con el mismo TTL porque otros procesos también registran resultados
+rangos = IndiceRango()
+# Nombres ordenados para autocompletar; mismo TTL y se actualiza con cada registro
+nombres = IndiceNombres()
+
+# Partidas terminadas ya renderizadas (/ver_partida); 0 desactiva la caché
+TERMINADAS_TTL = int(os.environ.get('KUATRO_TERMINADAS_TTL', '60'))
+partidas_terminadas = CacheTTL(TERMINADAS_TTL)
+
+# Resumen de `flask analizar-partidas`; se relee de la base cada ESTADISTICAS_TTL segundos
+ESTADISTICAS_TTL = int(os.environ.get('KUATRO_ESTADISTICAS_TTL', '60'))
+estadisticas_cache = CacheTTL(ESTADISTICAS_TTL)
 
 ##ESTO PARA EL LOGO Y ASSETS
+# Se leen una vez al arrancar; las plantillas usan recurso('Logo.png') (ver recursos.py)
+recursos = Recursos(os.path.join(app.root_path, 'Assets'))
+app.add_template_global(recursos.url, 'recurso')
+
 @app.route('/Assets/<path:filename>')
 def serve_assets(filename):
-    assets_dir = os.path.join(app.root_path, 'Assets')
-    if not os.path.exists(assets_dir):
-        os.makedirs(assets_dir) 
-    return send_from_directory(assets_dir, filename)
-
-def get_db_connection():
-    try:
-        return oracledb.connect(
-            user='KUATRO',
-            password='KUATRO',
-            dsn='localhost:1521/xe'
-        )
-    except oracledb.DatabaseError as e:
-        print(f"Error de conexión: {e}")
-        return None
+    return recursos.responder(filename)
+
+# Si el pool no entrega conexión a tiempo respondemos 503 de inmediato
+@app.errorhandler(PoolAgotado)
+def pool_agotado(e):
+    respuesta = jsonify({'success': False, 'error': 'Servidor ocupado, intente de nuevo'})
+    respuesta.status_code = 503
+    respuesta.headers['Retry-After'] = str(max(1, POOL_WAIT_MS // 1000))
+    return respuesta
+
+# Duración y código de cada petición por regla de ruta (GET /metrics). Con el
+# encabezado X-Kuatro-Perfil igual a KUATRO_PERFIL_TOKEN la petición además se
+# perfila por muestreo y la respuesta indica dónde quedó el perfil.
+def _ruta_actual():
+    return request.url_rule.rule if request.url_rule else 'sin_ruta'
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+    if metricas.perfil_solicitado(request.headers.get('X-Kuatro-Perfil')):
+        g.muestreador = metricas.Muestreador(threading.get_ident()).iniciar()
+
+@app.after_request
+def registrar_medicion(respuesta):
+    ruta = _ruta_actual()
+    inicio = g.get('inicio_peticion')
+    if inicio is not None:
+        metricas.PETICIONES.observar(time.perf_counter() - inicio, ruta, request.method)
+    metricas.RESPUESTAS.sumar(ruta, request.method, respuesta.status_code)
+    muestreador = g.pop('muestreador', None)
+    if muestreador is not None:
+        archivo, muestras = muestreador.detener(request.endpoint or 'sin_ruta')
+        respuesta.headers['X-Kuatro-Perfil'] = f'{archivo}; muestras={muestras}'
+    return respuesta
+
+@got_request_exception.connect_via(app)
+def contar_excepcion(sender, exception, **extra):
+    metricas.EXCEPCIONES.sumar(_ruta_actual(), type(exception).__name__)
+
+@before_render_template.connect_via(app)
+def iniciar_plantilla(sender, template, context, **extra):
+    g.inicio_plantilla = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def medir_plantilla(sender, template, context, **extra):
+    inicio = g.pop('inicio_plantilla', None)
+    if inicio is not None:
+        metricas.FASES.observar(time.perf_counter() - inicio, f'plantilla:{template.name}')
 
 #################################################################
 #############################RUTAS###############################
@@ -43,94 +130,46 @@ def registro():
         if not nombre or not identificacion:
             return jsonify({'success': False, 'message': 'Debe ingresar nombre e identificación'})
         
-        conn = get_db_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                # Verificar si ya existe
-                cursor.execute("""
-                    SELECT COUNT(*) FROM Jugadores 
-                    WHERE LOWER(Nombre) = LOWER(:nombre) OR Identificacion = :identificacion
-                """, {'nombre': nombre, 'identificacion': identificacion})
-                
-                if cursor.fetchone()[0] > 0:
-                    return jsonify({'success': False, 'message': 'El nombre o identificación ya existen'})
-                
-                # Insertar nuevo jugador
-                cursor.execute(
-                    "INSERT INTO Jugadores (Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas) "
-                    "VALUES (:nombre, :identificacion, 0, 0, 0, 0)",
-                    {'nombre': nombre, 'identificacion': identificacion}
-                )
-                conn.commit()
-                return jsonify({'success': True, 'message': f'¡{nombre} registrado con éxito!'})
-                
-            except Exception as e:
-                return jsonify({'success': False, 'message': f'Error: {str(e)}'})
-            finally:
-                cursor.close()
-                conn.close()
-        
-        return jsonify({'success': False, 'message': 'Error de conexión a la base de datos'})
+        try:
+            jugador_id = repositorio().registrar_jugador(nombre, identificacion)
+            escalafon_cache.invalidar()
+            rangos.poner(jugador_id, nombre, RATING_INICIAL)
+            nombres.poner(jugador_id, nombre)
+            return jsonify({'success': True, 'message': f'¡{nombre} registrado con éxito!'})
+        except JugadorDuplicado:
+            return jsonify({'success': False, 'message': 'El nombre o identificación ya existen'})
+        except SinConexion:
+            return jsonify({'success': False, 'message': 'Error de conexión a la base de datos'})
+        except PoolAgotado:
+            raise
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
 
 #################################################################
 # Utilidad para obtener datos de partida y stats
 def obtener_datos_partida(id_partida):
-    jugador1 = jugador2 = partida_json = estado = None
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT j1.Nombre, j2.Nombre, p.Partida, p.Estado
-                FROM Partidas p
-                JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
-                JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
-                WHERE p.PartidaID = :pid
-            ''', {'pid': id_partida})
-            row = cursor.fetchone()
-            if row:
-                jugador1, jugador2, partida_json, estado = row[0], row[1], row[2], row[3]
-                # Asegurar que los valores null/None sean consistentes
-                if partida_json:
-                    partida_data = json.loads(partida_json)
-                    if 'tablero' in partida_data:
-                        # Convertir cualquier valor que no sea 0 o 1 a None
-                        partida_data['tablero'] = [
-                            [cell if cell in [0, 1] else None for cell in row]
-                            for row in partida_data['tablero']
-                        ]
-                    partida_json = json.dumps(partida_data)
-        except Exception as e:
-            print(f"Error al cargar partida: {e}")
-        finally:
-            conn.close()
-    def get_stats(nombre):
-        conn = get_db_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT Puntuacion, Ganadas, Empatadas, Perdidas FROM Jugadores WHERE Nombre = :nombre",
-                    {'nombre': nombre}
-                )
-                result = cursor.fetchone()
-                if result:
-                    return {
-                        'Puntuacion': result[0],
-                        'Ganadas': result[1],
-                        'Empatadas': result[2],
-                        'Perdidas': result[3]
-                    }
-            except Exception as e:
-                print(f"Error al obtener estadísticas: {e}")
-            finally:
-                conn.close()
-        return None
-    stats1 = get_stats(jugador1)
-    stats2 = get_stats(jugador2)
-    return jugador1, jugador2, partida_json, estado, stats1, stats2
+    # Partida, nombres y estadísticas de ambos en una sola lectura. Las
+    # partidas terminadas no cambian y se guardan un rato en memoria.
+    en_cache = partidas_terminadas.obtener(str(id_partida))
+    if en_cache:
+        return en_cache
+    jugador1 = jugador2 = partida_json = estado = stats1 = stats2 = None
+    try:
+        vista = repositorio().cargar_vista_partida(id_partida)
+        if vista:
+            jugador1, jugador2, codigo, estado, stats1, stats2 = vista
+            if codigo:
+                with metricas.FASES.medir('partida_json'):
+                    partida_json = partida_json_desde_codigo(codigo)
+    except PoolAgotado:
+        raise
+    except Exception:
+        log.exception('Error al cargar la partida %s', id_partida)
+    datos = (jugador1, jugador2, partida_json, estado, stats1, stats2)
+    if estado == 'Terminada' and partida_json:
+        partidas_terminadas.guardar(str(id_partida), datos)
+    return datos
 
 @app.route('/juego')
 def juego():
@@ -144,7 +183,10 @@ def juego():
             jugador1_db, jugador2_db, _, _, _, _ = obtener_datos_partida(id_partida)
             if not jugador1_db or not jugador2_db:
                 return "Jugadores no encontrados para esa partida", 404
-            return redirect(url_for('juego', id_partida=id_partida, jugador1=jugador1_db, jugador2=jugador2_db))
+            return redirect(url_for('juego', id_partida=id_partida, jugador1=jugador1_db, jugador2=jugador2_db,
+                                    nivel=request.args.get('nivel')))
+        except PoolAgotado:
+            raise
         except Exception as e:
             return f"Error al obtener datos de la partida: {str(e)}", 500
 
@@ -158,47 +200,21 @@ def juego():
     # Si no hay ID de partida, crear una nueva partida
     if not id_partida:
         try:
-            conn = get_db_connection()
-            if not conn:
-                return jsonify({'success': False, 'error': 'Error de conexión a la base de datos'}), 500
-
-            cursor = conn.cursor()
-            cursor.execute("SELECT JugadorID FROM Jugadores WHERE Nombre = :nombre", {'nombre': jugador1})
-            id_jugador = cursor.fetchone()
-            cursor.execute("SELECT JugadorID FROM Jugadores WHERE Nombre = :nombre", {'nombre': jugador2})
-            id_rival = cursor.fetchone()
-
-            if not id_jugador or not id_rival:
-                return jsonify({'success': False, 'error': 'Uno o ambos jugadores no existen'}), 400
-
-            nueva_partida = {'tablero': [[None]*7 for _ in range(6)], 'turno': 0}
-            partida_id_var = cursor.var(oracledb.NUMBER)
-            cursor.execute("""
-                INSERT INTO Partidas (IDJUGADOR, IDRival, Estado, Partida)
-                VALUES (:idj, :idr, 'En progreso', :partida)
-                RETURNING PartidaID INTO :pid
-                """, {
-                    'idj': id_jugador[0],
-                    'idr': id_rival[0],
-                    'partida': json.dumps(nueva_partida),
-                    'pid': partida_id_var
-                })
-            nueva_partida_id = int(partida_id_var.getvalue()[0])
-            conn.commit()
-
-            return redirect(url_for('juego', id_partida=nueva_partida_id, jugador1=jugador1, jugador2=jugador2))
+            nueva_partida_id = repositorio().crear_partida(jugador1, jugador2, VACIO)
+            return redirect(url_for('juego', id_partida=nueva_partida_id, jugador1=jugador1, jugador2=jugador2,
+                                    nivel=request.args.get('nivel')))
+        except JugadorNoEncontrado:
+            return jsonify({'success': False, 'error': 'Uno o ambos jugadores no existen'}), 400
+        except SinConexion:
+            return jsonify({'success': False, 'error': 'Error de conexión a la base de datos'}), 500
+        except PoolAgotado:
+            raise
         except Exception as e:
-            if conn:
-                conn.rollback()
             return jsonify({'success': False, 'error': f'Error al crear partida: {str(e)}'}), 500
-        finally:
-            if conn:
-                conn.close()
 
     # Cargar partida existente
     try:
         jugador1, jugador2, partida_json, estado, stats1, stats2 = obtener_datos_partida(id_partida)
-        print(f"Partida cargada: {jugador1} vs {jugador2}, estado: {estado}")
 
         if not partida_json:
             return jsonify({'success': False, 'error': 'Partida no encontrada'}), 404
@@ -211,9 +227,13 @@ def juego():
                                jugador2=jugador2,
                                stats1=stats1,
                                stats2=stats2,
-                               partida_json=partida_json)
+                               partida_json=partida_json,
+                               jugador_ia=ia.JUGADOR_IA,
+                               nivel_ia=request.args.get('nivel') or ia.NIVEL_POR_DEFECTO)
+    except PoolAgotado:
+        raise
     except Exception as e:
-        print(f"Error al cargar partida: {str(e)}") 
+        log.exception('Error al cargar la partida %s', id_partida)
         return jsonify({'success': False, 'error': f'Error al cargar partida: {str(e)}'}), 500
 
 
@@ -229,7 +249,8 @@ def ver_partida():
                          stats1=stats1,
                          stats2=stats2,
                          partida_json=partida_json,
-                         estado=estado)
+                         estado=estado,
+                         id_partida=id_partida)
 
 #################################################################
 @app.route('/actualizar_estadisticas', methods=['POST'])
@@ -238,41 +259,18 @@ def actualizar_estadisticas():
     ganador = data.get('ganador')
     perdedor = data.get('perdedor')
     
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            
-            # Actualizar estadísticas del ganador
-            cursor.execute("""
-                UPDATE Jugadores 
-                SET 
-                    Puntuacion = Puntuacion + 1,
-                    Ganadas = Ganadas + 1
-                WHERE Nombre = :nombre
-            """, {'nombre': ganador})
-            
-            # Actualizar estadísticas del perdedor
-            cursor.execute("""
-                UPDATE Jugadores 
-                SET 
-                    Puntuacion = Puntuacion - 1,
-                    Perdidas = Perdidas + 1
-                WHERE Nombre = :nombre
-            """, {'nombre': perdedor})
-            
-            conn.commit()
-            return jsonify({'success': True})
-            
-        except Exception as e:
-            print(f"Error al actualizar estadísticas: {e}")
-            conn.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
-            
-        finally:
-            conn.close()
-    
-    return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    try:
+        repositorio().registrar_victoria(ganador, perdedor)
+        escalafon_cache.invalidar()
+        partidas_terminadas.invalidar()
+        return jsonify({'success': True})
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        log.exception('Error al actualizar estadísticas')
+        return jsonify({'success': False, 'error': str(e)}), 500
 #################################################################
 @app.route('/actualizar_empate', methods=['POST'])
 def actualizar_empate():
@@ -280,125 +278,209 @@ def actualizar_empate():
     jugador1 = data.get('jugador1')
     jugador2 = data.get('jugador2')
     
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            
-            # Actualizar estadísticas para ambos jugadores
-            cursor.execute("""
-                UPDATE Jugadores 
-                SET 
-                    Empatadas = Empatadas + 1
-                WHERE Nombre = :nombre
-            """, {'nombre': jugador1})
-            
-            cursor.execute("""
-                UPDATE Jugadores 
-                SET 
-                    Empatadas = Empatadas + 1
-                WHERE Nombre = :nombre
-            """, {'nombre': jugador2})
-            
-            conn.commit()
-            return jsonify({'success': True})
-            
-        except Exception as e:
-            print(f"Error al actualizar empate: {e}")
-            conn.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
-            
-        finally:
-            conn.close()
-    
-    return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    try:
+        repositorio().registrar_empate(jugador1, jugador2)
+        escalafon_cache.invalidar()
+        partidas_terminadas.invalidar()
+        return jsonify({'success': True})
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        log.exception('Error al actualizar empate')
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 #################################################################
+def guardar_escalafon(filas):
+    # Arma la lista y su versión (para el ETag) y la deja en caché
+    jugadores = [
+        {
+            'Identificacion': row[0],
+            'Nombre': row[1],
+            'Puntuacion': row[2],
+            'Ganadas': row[3],
+            'Empatadas': row[4],
+            'Perdidas': row[5]
+        } for row in filas
+    ]
+    version = hashlib.sha1(json.dumps(jugadores).encode()).hexdigest()[:16]
+    escalafon_cache.guardar('escalafon', (jugadores, version))
+    return jugadores, version
+
+def etag_escalafon(version, offset, limit):
+    return f'{version}-{offset}-{limit}'
+
+def cargar_escalafon():
+    # Devuelve (jugadores, version); lanza SinConexion si no hay base
+    en_cache = escalafon_cache.obtener('escalafon')
+    if en_cache:
+        return en_cache
+    return guardar_escalafon(repositorio().escalafon())
+
 @app.route('/api/escalafon')
 def api_escalafon():
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT Identificacion, Nombre, Puntuacion, Ganadas, Empatadas, Perdidas 
-                FROM Jugadores 
-                ORDER BY Puntuacion DESC, Nombre ASC
-            """)
-            jugadores = [
-                {
-                    'Identificacion': row[0],
-                    'Nombre': row[1],
-                    'Puntuacion': row[2],
-                    'Ganadas': row[3],
-                    'Empatadas': row[4],
-                    'Perdidas': row[5]
-                } for row in cursor.fetchall()
-            ]
-            return jsonify(jugadores)
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-        finally:
-            cursor.close()
-            conn.close()
-    return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if (limit is not None and limit < 0) or offset < 0:
+        return jsonify({'error': 'limit y offset deben ser enteros no negativos'}), 400
+    try:
+        jugadores, version = cargar_escalafon()
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    fin = None if limit is None else offset + limit
+    respuesta = jsonify(jugadores[offset:fin])
+    # El navegador revalida con If-None-Match y recibe 304 si nada cambió
+    respuesta.set_etag(etag_escalafon(version, offset, limit))
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
+#################################################################
+# Lugar de un jugador por rating Elo y los que tiene cerca (ver rango.py)
+RANGO_ALREDEDOR_MAX = 50
+
+def cargar_rangos():
+    if rangos.vencido(ESCALAFON_TTL):
+        # Sin la computadora, igual que el escalafón; actualizar() solo toca a los que están
+        rangos.reemplazar(fila for fila in repositorio().ratings() if fila[1] != ia.JUGADOR_IA)
+    return rangos
+
+@app.route('/api/jugador/<int:id_jugador>/rango')
+def api_rango_jugador(id_jugador):
+    alrededor = request.args.get('alrededor', 5, type=int)
+    if alrededor < 0:
+        return jsonify({'success': False, 'error': 'alrededor debe ser un entero no negativo'}), 400
+    try:
+        indice = cargar_rangos()
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    encontrado = indice.rango(id_jugador, min(alrededor, RANGO_ALREDEDOR_MAX))
+    if encontrado is None:
+        return jsonify({'success': False, 'error': 'Jugador no encontrado'}), 404
+    jugador, cercanos = encontrado
+    return jsonify({'success': True, **jugador, 'total': len(indice), 'alrededor': cercanos})
+#################################################################
+# Autocompletar jugadores por prefijo del nombre (ver jugadores.IndiceNombres)
+BUSCAR_LIMITE_MAX = 50
+
+def cargar_nombres():
+    if nombres.vencido(ESCALAFON_TTL):
+        nombres.reemplazar(repositorio().ratings())
+    return nombres
+
+@app.route('/api/jugadores/buscar')
+def api_buscar_jugadores():
+    q = request.args.get('q', '').strip()
+    limite = request.args.get('limite', 10, type=int)
+    if not q:
+        return jsonify({'success': False, 'error': 'q es requerido'}), 400
+    if limite < 1:
+        return jsonify({'success': False, 'error': 'limite debe ser un entero positivo'}), 400
+    try:
+        indice = cargar_nombres()
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    encontrados = indice.buscar(q, min(limite, BUSCAR_LIMITE_MAX))
+    return jsonify({'success': True,
+                    'jugadores': [{'JugadorID': jugador_id, 'Nombre': nombre} for jugador_id, nombre in encontrados]})
+#################################################################
+# Estadísticas globales ya calculadas (ver analisis.py): no se lee Partidas
+@app.route('/api/estadisticas_globales')
+def api_estadisticas_globales():
+    try:
+        guardado = estadisticas_cache.obtener(CLAVE_RESUMEN)
+        if guardado is None:
+            fila = repositorio().estadisticas_globales(CLAVE_RESUMEN)
+            if fila is None:
+                return jsonify({'success': False,
+                                'error': 'Todavía no se calcularon; correr flask analizar-partidas'}), 404
+            datos, fecha = fila
+            guardado = (datos, fecha, hashlib.sha1(datos.encode()).hexdigest()[:16])
+            estadisticas_cache.guardar(CLAVE_RESUMEN, guardado)
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    datos, fecha, version = guardado
+    # El JSON guardado se manda tal cual, sin volver a armarlo
+    respuesta = Response(datos, mimetype='application/json')
+    respuesta.set_etag(version)
+    respuesta.last_modified = fecha
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
+#################################################################
+# Buscar rival: entrar a la cola y esperar la partida con long-poll (ver emparejamiento.py)
+@app.route('/api/emparejamiento', methods=['POST'])
+def api_emparejamiento():
+    data = request.get_json(silent=True) or request.form
+    nombre = (data.get('jugador') or '').strip()
+    if not nombre:
+        return jsonify({'success': False, 'error': 'jugador es requerido'}), 400
+    if nombre == ia.JUGADOR_IA:
+        return jsonify({'success': False, 'error': 'La computadora no busca rival'}), 400
+    try:
+        jugador = repositorio().buscar_jugador(nombre)
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    if jugador is None:
+        return jsonify({'success': False, 'error': 'Jugador no encontrado'}), 404
+    entrada = emparejador.unirse(jugador[0], nombre, jugador[1])
+    return jsonify({'success': True, **entrada.respuesta()})
+
+@app.route('/api/emparejamiento/<ticket>')
+def api_estado_emparejamiento(ticket):
+    espera = request.args.get('espera', 0, type=float)
+    entrada = emparejador.consultar(ticket, espera)
+    if entrada is None:
+        return jsonify({'success': False, 'error': 'Ticket no encontrado'}), 404
+    return jsonify({'success': True, **entrada.respuesta()})
+
+@app.route('/api/emparejamiento/<ticket>', methods=['DELETE'])
+def api_salir_emparejamiento(ticket):
+    if not emparejador.salir(ticket):
+        return jsonify({'success': False, 'error': 'El ticket no está esperando'}), 404
+    return jsonify({'success': True})
 #################################################################
 @app.route('/api/crear_partida', methods=['POST'])
 def api_crear_partida():
     data = request.json
     jugador1 = data.get('jugador1')
     jugador2 = data.get('jugador2')
-    estado = 'En progreso'
-    partida = data.get('partida', None) or {'tablero': [[None]*7 for _ in range(6)], 'turno': 0}
+    partida = data.get('partida', None)
+    tablero = codificar(Posicion.desde_partida(partida)) if partida else VACIO
 
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            
-            # Obtener IDs de los jugadores
-            cursor.execute("SELECT JugadorID FROM Jugadores WHERE Nombre = :nombre", {'nombre': jugador1})
-            id_jugador = cursor.fetchone()
-            cursor.execute("SELECT JugadorID FROM Jugadores WHERE Nombre = :nombre", {'nombre': jugador2})
-            id_rival = cursor.fetchone()
-            
-            if not id_jugador or not id_rival:
-                return jsonify({'error': 'Jugador no encontrado'}), 400
-
-            # Insertar partida
-            cursor.execute(
-                """
-                INSERT INTO Partidas (IDJUGADOR, IDRival, Estado, Partida)
-                VALUES (:idj, :idr, :estado, :partida)
-                """,
-                {
-                    'idj': id_jugador[0],
-                    'idr': id_rival[0],
-                    'estado': estado,
-                    'partida': json.dumps(partida)
-                }
-            )
-            
-            # Obtener el ID de la nueva partida
-            cursor.execute("""
-                SELECT PartidaID FROM Partidas 
-                WHERE ROWID = (SELECT MAX(ROWID) FROM Partidas)
-                """)
-            partida_id = cursor.fetchone()[0]
-            
-            conn.commit()
-            return jsonify({
-                'success': True,
-                'id_partida': partida_id
-            })
-            
-        except Exception as e:
-            conn.rollback()
-            return jsonify({'error': str(e)}), 500
-        finally:
-            cursor.close()
-            conn.close()
-    return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    try:
+        partida_id = repositorio().crear_partida(jugador1, jugador2, tablero)
+        return jsonify({
+            'success': True,
+            'id_partida': partida_id
+        })
+    except JugadorNoEncontrado:
+        return jsonify({'error': 'Jugador no encontrado'}), 400
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 #################################################################
 @app.route('/api/terminar_partida', methods=['POST'])
@@ -406,33 +488,21 @@ def api_terminar_partida():
     data = request.json
     jugador1 = data.get('jugador1')
     jugador2 = data.get('jugador2')
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            # Buscar la última partida en progreso entre estos jugadores
-            cursor.execute('''
-                SELECT PartidaID FROM Partidas
-                WHERE Estado = 'En progreso'
-                  AND ((IDJUGADOR = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j1) AND IDRival = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j2))
-                    OR (IDJUGADOR = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j2) AND IDRival = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j1)))
-                ORDER BY FechaCreacion DESC FETCH FIRST 1 ROWS ONLY
-            ''', {'j1': jugador1, 'j2': jugador2})
-            row = cursor.fetchone()
-            if row:
-                partida_id = row[0]
-                cursor.execute("UPDATE Partidas SET Estado = 'Terminada' WHERE PartidaID = :pid", {'pid': partida_id})
-                conn.commit()
-                return jsonify({'success': True})
-            else:
-                return jsonify({'error': 'No se encontró partida en progreso'}), 404
-        except Exception as e:
-            conn.rollback()
-            return jsonify({'error': str(e)}), 500
-        finally:
-            cursor.close()
-            conn.close()
-    return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    try:
+        # Última partida en progreso entre estos jugadores
+        partida_id = repositorio().partida_en_progreso(jugador1, jugador2)
+        if partida_id is None:
+            return jsonify({'error': 'No se encontró partida en progreso'}), 404
+        ia.cancelar_busqueda(partida_id)
+        repositorio().terminar_partida(partida_id)
+        notificar(partida_id)
+        return jsonify({'success': True})
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 #################################################################
 @app.route('/api/actualizar_partida', methods=['POST'])
@@ -441,64 +511,84 @@ def api_actualizar_partida():
     jugador1 = data.get('jugador1')
     jugador2 = data.get('jugador2')
     partida = data.get('partida')
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            # Buscar la última partida en progreso entre estos jugadores
-            cursor.execute('''
-                SELECT PartidaID FROM Partidas
-                WHERE Estado = 'En progreso'
-                  AND ((IDJUGADOR = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j1) AND IDRival = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j2))
-                    OR (IDJUGADOR = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j2) AND IDRival = (SELECT JugadorID FROM Jugadores WHERE Nombre = :j1)))
-                ORDER BY FechaCreacion DESC FETCH FIRST 1 ROWS ONLY
-            ''', {'j1': jugador1, 'j2': jugador2})
-            row = cursor.fetchone()
-            if row:
-                partida_id = row[0]
-                cursor.execute("UPDATE Partidas SET Partida = :partida WHERE PartidaID = :pid", {'partida': json.dumps(partida), 'pid': partida_id})
-                conn.commit()
-                return jsonify({'success': True})
-            else:
-                return jsonify({'error': 'No se encontró partida en progreso'}), 404
-        except Exception as e:
-            conn.rollback()
-            return jsonify({'error': str(e)}), 500
-        finally:
-            cursor.close()
-            conn.close()
-    return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    try:
+        partida_id = repositorio().partida_en_progreso(jugador1, jugador2)
+        if partida_id is None:
+            return jsonify({'error': 'No se encontró partida en progreso'}), 404
+        repositorio().sincronizar(partida_id, partida)
+        notificar(partida_id)
+        return jsonify({'success': True})
+    except (PartidaNoEncontrada, PartidaNoEnProgreso):
+        return jsonify({'error': 'No se encontró partida en progreso'}), 404
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 ##################################################################
 # API para listar partidas
+# Paginación por llave (FechaCreacion, PartidaID): el cursor es la última
+# fila de la página anterior y viaja en el encabezado X-Siguiente-Cursor
+LIMITE_PARTIDAS = 50
+LIMITE_PARTIDAS_MAX = 200
+
+def leer_cursor(cursor_texto):
+    fecha, _, partida_id = cursor_texto.rpartition(',')
+    return datetime.fromisoformat(fecha), int(partida_id)
+
+def escribir_cursor(fila):
+    return f'{fila[5].isoformat()},{fila[0]}'
+
+def partida_desde_fila(row):
+    return {
+        'PartidaID': row[0],
+        'Jugador1': row[1],
+        'Jugador2': row[2],
+        'Estado': row[3],
+        'Fecha': row[4]
+    }
+
 @app.route('/api/listar_partidas')
 def api_listar_partidas():
-    conn = get_db_connection()
-    if conn:
+    limite = request.args.get('limit', LIMITE_PARTIDAS, type=int)
+    if limite <= 0:
+        return jsonify({'error': 'limit debe ser mayor que cero'}), 400
+    limite = min(limite, LIMITE_PARTIDAS_MAX)
+    desde = None
+    if request.args.get('cursor'):
         try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT p.PartidaID, j1.Nombre, j2.Nombre, p.Estado, TO_CHAR(p.FechaCreacion, 'YYYY-MM-DD HH24:MI:SS')
-                FROM Partidas p
-                JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
-                JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
-                ORDER BY p.FechaCreacion DESC
-            ''')
-            partidas = [
-                {
-                    'PartidaID': row[0],
-                    'Jugador1': row[1],
-                    'Jugador2': row[2],
-                    'Estado': row[3],
-                    'Fecha': row[4]
-                } for row in cursor.fetchall()
-            ]
-            return jsonify(partidas)
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-        finally:
-            cursor.close()
-            conn.close()
-    return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+            desde = leer_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+
+    try:
+        # Una fila extra indica si hay otra página
+        filas = repositorio().listar_partidas(request.args.get('estado'), request.args.get('jugador'),
+                                              desde, limite + 1)
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    respuesta = jsonify([partida_desde_fila(row) for row in filas[:limite]])
+    if len(filas) > limite:
+        respuesta.headers['X-Siguiente-Cursor'] = escribir_cursor(filas[limite - 1])
+    return respuesta
+
+# Conteo con los mismos filtros
+@app.route('/api/listar_partidas/total')
+def api_total_partidas():
+    try:
+        return jsonify({'total': repositorio().contar_partidas(request.args.get('estado'),
+                                                               request.args.get('jugador'))})
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 ##################################################################
 # Nueva ruta para actualizar partida por ID
 @app.route('/api/actualizar_partida_por_id', methods=['POST'])
@@ -507,38 +597,21 @@ def api_actualizar_partida_por_id():
     partida_id = data.get('id_partida')
     partida = data.get('partida')
     
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            # Verificar si la partida existe y está en progreso
-            cursor.execute("""
-                SELECT Estado FROM Partidas WHERE PartidaID = :pid
-            """, {'pid': partida_id})
-            row = cursor.fetchone()
-            
-            if not row:
-                return jsonify({'error': 'Partida no encontrada'}), 404
-                
-            if row[0] != 'En progreso':
-                return jsonify({'error': 'La partida no está en progreso'}), 400
-                
-            # Actualizar la partida
-            cursor.execute("""
-                UPDATE Partidas 
-                SET Partida = :partida 
-                WHERE PartidaID = :pid
-            """, {'partida': json.dumps(partida), 'pid': partida_id})
-            
-            conn.commit()
-            return jsonify({'success': True})
-            
-        except Exception as e:
-            conn.rollback()
-            return jsonify({'error': str(e)}), 500
-        finally:
-            conn.close()
-    return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    try:
+        # Registra solo la ficha nueva en el historial
+        repositorio().sincronizar(partida_id, partida)
+        notificar(partida_id)
+        return jsonify({'success': True})
+    except PartidaNoEncontrada:
+        return jsonify({'error': 'Partida no encontrada'}), 404
+    except PartidaNoEnProgreso:
+        return jsonify({'error': 'La partida no está en progreso'}), 400
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 ##################################################################
 
 @app.route('/api/crear_nueva_partida', methods=['POST'])
@@ -548,61 +621,20 @@ def api_crear_nueva_partida():
     jugador2 = data.get('jugador2')
     id_partida_original = data.get('id_partida_original')
 
-    # Configuración inicial de nueva partida
-    nueva_partida = {
-        'tablero': [[None]*7 for _ in range(6)],
-        'turno': 0
-    }
-
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
-
     try:
-        cursor = conn.cursor()
-
-        # Obtener IDs de los jugadores
-        cursor.execute("SELECT JugadorID FROM Jugadores WHERE Nombre = :nombre", {'nombre': jugador1})
-        id_jugador = cursor.fetchone()
-        cursor.execute("SELECT JugadorID FROM Jugadores WHERE Nombre = :nombre", {'nombre': jugador2})
-        id_rival = cursor.fetchone()
-
-        if not id_jugador or not id_rival:
-            return jsonify({'error': 'Uno de los jugadores no existe'}), 404
-
-        # Para Oracle necesitamos usar una secuencia
-        # Primero insertamos
-        cursor.execute("""
-            INSERT INTO Partidas (IDJUGADOR, IDRival, Estado, Partida)
-            VALUES (:idj, :idr, 'En progreso', :partida)
-            """,
-            {
-                'idj': id_jugador[0],
-                'idr': id_rival[0],
-                'partida': json.dumps(nueva_partida)
-            }
-        )
-        
-        # Luego obtenemos el ID recién insertado
-        cursor.execute("""
-            SELECT PartidaID FROM Partidas 
-            WHERE ROWID = (SELECT MAX(ROWID) FROM Partidas)
-            """)
-        nueva_partida_id = cursor.fetchone()[0]
-        
-        conn.commit()
-
+        nueva_partida_id = repositorio().crear_partida(jugador1, jugador2, VACIO)
         return jsonify({
             'success': True,
             'id_partida': nueva_partida_id
         })
-
+    except JugadorNoEncontrado:
+        return jsonify({'error': 'Uno de los jugadores no existe'}), 404
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
     except Exception as e:
-        conn.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 ##################################################################
 @app.route('/api/terminar_partida_por_id', methods=['POST'])
@@ -610,25 +642,22 @@ def api_terminar_partida_por_id():
     data = request.json
     partida_id = data.get('id_partida')
     
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE Partidas 
-                SET Estado = 'Terminada' 
-                WHERE PartidaID = :pid
-            """, {'pid': partida_id})
-            
-            conn.commit()
-            return jsonify({'success': True})
-            
-        except Exception as e:
-            conn.rollback()
-            return jsonify({'error': str(e)}), 500
-        finally:
-            conn.close()
-    return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    # Una búsqueda de la computadora pendiente para esta partida ya no sirve
+    try:
+        ia.cancelar_busqueda(int(partida_id))
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        repositorio().terminar_partida(partida_id)
+        notificar(partida_id)
+        return jsonify({'success': True})
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 ##################################################################
 @app.route('/api/crear_partida_front')
 def api_crear_partida_front():
@@ -657,6 +686,233 @@ def api_crear_partida_front():
     except Exception as e:
         return f"Error: {str(e)}", 500
 ##################################################################
+# Jugada validada en el servidor: el cliente solo envía la columna
+@app.route('/api/partida/<int:id_partida>/jugada', methods=['POST'])
+def api_jugada(id_partida):
+    data = request.get_json(silent=True) or request.form
+    try:
+        columna = int(data.get('columna'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Columna inválida'}), 400
+    if not 0 <= columna < COLUMNAS:
+        return jsonify({'success': False, 'error': 'Columna inválida'}), 400
+
+    try:
+        posicion, fila = repositorio().jugar(id_partida, columna, jugador=data.get('jugador'))
+    except PartidaNoEncontrada:
+        return jsonify({'success': False, 'error': 'Partida no encontrada'}), 404
+    except PartidaNoEnProgreso:
+        return jsonify({'success': False, 'error': 'La partida no está en progreso'}), 400
+    except TurnoIncorrecto as e:
+        return jsonify({'success': False, 'error': 'No es el turno de ese jugador', 'turno': e.turno}), 409
+    except JugadaInvalida as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    notificar(id_partida)
+    return jsonify(respuesta_jugada(posicion, fila, columna))
+
+def respuesta_jugada(posicion, fila, columna):
+    return {
+        'success': True,
+        'fila': fila,
+        'columna': columna,
+        'turno': posicion.turno,
+        'ganador': posicion.ganador,
+        'empate': posicion.empate
+    }
+##################################################################
+# Jugada de la computadora cuando le toca al jugador reservado ia.JUGADOR_IA
+@app.route('/api/partida/<int:id_partida>/jugada_ia', methods=['POST'])
+def api_jugada_ia(id_partida):
+    data = request.get_json(silent=True) or request.form
+    nivel = data.get('nivel') or ia.NIVEL_POR_DEFECTO
+    if nivel not in ia.NIVELES:
+        return jsonify({'success': False, 'error': 'Nivel inválido', 'niveles': list(ia.NIVELES)}), 400
+
+    # La conexión no se retiene mientras se busca: se lee la posición, se
+    # calcula la jugada en el pool de procesos y luego se registra con bloqueo
+    try:
+        posicion, estado, jugador1, jugador2 = repositorio().cargar_partida(id_partida)
+    except PartidaNoEncontrada:
+        return jsonify({'success': False, 'error': 'Partida no encontrada'}), 404
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    if estado != 'En progreso':
+        return jsonify({'success': False, 'error': 'La partida no está en progreso'}), 400
+    if posicion.terminada:
+        return jsonify({'success': False, 'error': 'La partida ya terminó'}), 400
+    if (jugador1, jugador2)[posicion.turno] != ia.JUGADOR_IA:
+        return jsonify({'success': False, 'error': 'No es el turno de la computadora', 'turno': posicion.turno}), 409
+    try:
+        columna = ia.calcular_jugada(id_partida, posicion, nivel)
+    except ia.BusquedaCancelada:
+        return jsonify({'success': False, 'error': 'La partida terminó durante la búsqueda'}), 409
+
+    try:
+        actual, fila = repositorio().jugar(id_partida, columna, esperada=posicion.piezas)
+    except (PartidaNoEncontrada, PartidaNoEnProgreso):
+        return jsonify({'success': False, 'error': 'La partida no está en progreso'}), 409
+    except PartidaCambio as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    notificar(id_partida)
+    return jsonify(respuesta_jugada(actual, fila, columna))
+##################################################################
+# Resultado de una partida terminada: se saca del tablero del servidor, se
+# anota una sola vez en Resultados y suma a ambos jugadores en la misma
+# transacción. Reenviarlo no vuelve a sumar (registrado: false).
+@app.route('/api/partida/<int:id_partida>/resultado', methods=['POST'])
+def api_resultado(id_partida):
+    try:
+        posicion, estado, jugador1, jugador2 = repositorio().cargar_partida(id_partida)
+        if not posicion.terminada:
+            return jsonify({'success': False, 'error': 'La partida no ha terminado'}), 409
+        ratings = repositorio().registrar_resultado(id_partida, posicion.ganador)
+    except PartidaNoEncontrada:
+        return jsonify({'success': False, 'error': 'Partida no encontrada'}), 404
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        log.exception('Error al registrar el resultado de la partida %s', id_partida)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    if ratings is not None:
+        escalafon_cache.invalidar()
+        partidas_terminadas.invalidar()
+        rangos.actualizar(ratings)
+        ia.cancelar_busqueda(id_partida)
+        notificar(id_partida)
+    return jsonify({
+        'success': True,
+        'registrado': ratings is not None,
+        'ganador': posicion.ganador,
+        'empate': posicion.empate
+    })
+##################################################################
+# Pista para el jugador en turno: libro de aperturas o búsqueda corta
+@app.route('/api/partida/<int:id_partida>/pista')
+def api_pista(id_partida):
+    try:
+        posicion, estado, _, _ = repositorio().cargar_partida(id_partida)
+    except PartidaNoEncontrada:
+        return jsonify({'success': False, 'error': 'Partida no encontrada'}), 404
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    if estado != 'En progreso' or posicion.terminada:
+        return jsonify({'success': False, 'error': 'La partida no está en progreso'}), 400
+    jugada = consultar_libro(posicion)
+    if jugada is not None:
+        return jsonify({'success': True, 'columna': jugada[0], 'valor': jugada[1], 'fuente': 'libro'})
+    try:
+        columna = ia.calcular_jugada(id_partida, posicion, ia.NIVEL_POR_DEFECTO)
+    except ia.BusquedaCancelada:
+        return jsonify({'success': False, 'error': 'La partida terminó durante la búsqueda'}), 409
+    return jsonify({'success': True, 'columna': columna, 'valor': None, 'fuente': 'busqueda'})
+##################################################################
+# Historial completo de la partida (columnas en orden) para repeticiones
+@app.route('/api/partida/<int:id_partida>/jugadas')
+def api_listar_jugadas(id_partida):
+    try:
+        return jsonify({'success': True, 'id_partida': id_partida,
+                        'jugadas': repositorio().listar_jugadas(id_partida)})
+    except SinConexion:
+        return jsonify({'success': False, 'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+##################################################################
+# Transmisión en vivo para espectadores: foto inicial y luego cada jugada
+@app.route('/api/partida/<int:id_partida>/stream')
+def api_stream_partida(id_partida):
+    suscripcion = suscribir(id_partida)
+    if suscripcion is None:
+        return jsonify({'success': False, 'error': 'Partida no encontrada'}), 404
+    cola, foto = suscripcion
+    respuesta = Response(transmitir(id_partida, cola, foto), mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    # Que un proxy (nginx) no acumule el stream
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+@app.route('/api/stream/estadisticas')
+def api_estadisticas_stream():
+    return jsonify(estadisticas_transmision())
+##################################################################
+# Contadores del pool de procesos de la computadora
+@app.route('/api/ia/estadisticas')
+def api_estadisticas_ia():
+    return jsonify(ia.estadisticas_busquedas())
+##################################################################
+# Salud del pool de conexiones: ping real y contadores de uso
+@app.route('/api/salud')
+def api_salud():
+    ok, mensaje, latencia_ms = verificar_salud()
+    return jsonify({
+        'success': ok,
+        'mensaje': mensaje,
+        'latencia_ms': latencia_ms,
+        'pool': estadisticas_pool()
+    }), 200 if ok else 503
+##################################################################
+# Respaldo completo en NDJSON (ver exportacion.py), línea por línea
+@app.route('/api/export')
+def api_export():
+    if not exportacion_permitida(request.headers.get('X-Kuatro-Token')):
+        return jsonify({'error': 'No autorizado'}), 403
+    lineas = lineas_ndjson(repositorio())
+    try:
+        # La primera línea abre la conexión: si no hay base se responde el error de siempre
+        primera = next(lineas, '')
+    except SinConexion:
+        return jsonify({'error': 'No se pudo conectar a la base de datos'}), 500
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    respuesta = Response(itertools.chain([primera], lineas), mimetype='application/x-ndjson')
+    # Si el cliente corta, el generador se cierra y devuelve la conexión
+    respuesta.call_on_close(lineas.close)
+    respuesta.headers['Content-Disposition'] = 'attachment; filename=kuatro.ndjson'
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
+##################################################################
+# Métricas para Prometheus
+@app.route('/metrics')
+def api_metricas():
+    pool = estadisticas_pool()
+    transmision = estadisticas_transmision()
+    medidores = {
+        'kuatro_pool_abiertas': ('Conexiones abiertas en los pools', pool['abiertas']),
+        'kuatro_pool_en_uso': ('Conexiones prestadas en este momento', pool['en_uso']),
+        'kuatro_pool_esperando': ('Peticiones esperando una conexión', pool['esperando']),
+        'kuatro_stream_canales': ('Partidas con espectadores en vivo', transmision['canales']),
+        'kuatro_stream_espectadores': ('Espectadores conectados', transmision['espectadores']),
+        'kuatro_emparejamiento_esperando': ('Jugadores esperando rival', emparejador.estadisticas()['esperando']),
+    }
+    return Response(metricas.exponer(medidores), mimetype='text/plain; version=0.0.4')
+##################################################################
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,438 @@
+# Punto de entrada ASGI:
+#
+#   uvicorn asgi:app --workers 2
+#
+# Las rutas con más tráfico (escalafón, listado, jugadas y el stream de
+# espectadores) se atienden con handlers async sobre el pool async de
+# oracledb, así una consulta lenta o miles de streams abiertos no ocupan un
+# hilo cada uno. Las demás rutas (páginas, registro, IA...) pasan a la app
+# Flask de app.py, que corre en un hilo aparte. `python app.py` sigue
+# funcionando igual que antes.
+#
+# Los handlers async hablan directo con Oracle; con otro KUATRO_BACKEND solo
+# el stream y el long-poll del emparejamiento quedan async y lo demás pasa
+# por Flask y su repositorio. Con
+# KUATRO_ESCRITURA_DIFERIDA las rutas que escriben jugadas también van por Flask.
+import asyncio
+import io
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+from flask import json
+from werkzeug.http import parse_etags
+
+import app as aplicacion
+from app import (LIMITE_PARTIDAS, LIMITE_PARTIDAS_MAX, leer_cursor, escribir_cursor, partida_desde_fila,
+                 guardar_escalafon, etag_escalafon, respuesta_jugada)
+from db import get_db_connection_async, cerrar_pool_async, repartir_pool, PoolAgotado, POOL_WAIT_MS
+from emparejamiento import emparejador
+from jugadores import resolver_ids_async
+from metricas import CursorMedidoAsync, PETICIONES, RESPUESTAS
+from motor import COLUMNAS, JugadaInvalida
+from repositorio import (BACKEND, ESCRITURA_DIFERIDA, obtener_repositorio, SinConexion, PartidaNoEncontrada,
+                         PartidaNoEnProgreso, TurnoIncorrecto)
+from repositorio_oracle import CONDICION_CURSOR, SQL_ESCALAFON, condiciones_partidas, sql_listar_partidas
+from transmision import ColaAsync, suscribir, transmitir_async, notificar
+import ia
+
+# Partes del cuerpo de una respuesta de Flask que pueden esperar su envío
+PARTES_EN_VUELO = 8
+
+# El pool de Flask y el async comparten KUATRO_POOL_MAX
+repartir_pool()
+
+
+class Peticion:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.metodo = scope['method']
+        self.ruta = scope['path']
+        self.args = {k: v[0] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self._receive = receive
+        self._cuerpo = None
+
+    async def cuerpo(self):
+        if self._cuerpo is None:
+            partes = []
+            while True:
+                mensaje = await self._receive()
+                partes.append(mensaje.get('body', b''))
+                if not mensaje.get('more_body'):
+                    break
+            self._cuerpo = b''.join(partes)
+        return self._cuerpo
+
+    async def json(self):
+        try:
+            return json.loads(await self.cuerpo() or b'null')
+        except ValueError:
+            return None
+
+    def entero(self, nombre, defecto):
+        # Como request.args.get(nombre, defecto, type=int)
+        try:
+            return int(self.args[nombre])
+        except (KeyError, ValueError):
+            return defecto
+
+
+class Respuesta:
+    def __init__(self, cuerpo=b'', estado=200, encabezados=None, tipo='application/json'):
+        self.cuerpo = cuerpo
+        self.estado = estado
+        self.encabezados = dict(encabezados or {})
+        self.encabezados.setdefault('Content-Type', tipo)
+
+    async def enviar(self, send, receive):
+        encabezados = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in self.encabezados.items()]
+        encabezados.append((b'content-length', str(len(self.cuerpo)).encode()))
+        await send({'type': 'http.response.start', 'status': self.estado, 'headers': encabezados})
+        await send({'type': 'http.response.body', 'body': self.cuerpo})
+
+
+class RespuestaStream(Respuesta):
+    def __init__(self, generador, encabezados=None, tipo='text/event-stream'):
+        super().__init__(b'', 200, encabezados, tipo)
+        self.generador = generador
+
+    async def enviar(self, send, receive):
+        encabezados = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in self.encabezados.items()]
+        await send({'type': 'http.response.start', 'status': self.estado, 'headers': encabezados})
+        # El servidor avisa la desconexión por receive(); al llegar se cancela el
+        # envío y el generador suelta su suscripción
+        envio = asyncio.ensure_future(self._enviar_partes(send))
+        desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+        try:
+            await asyncio.wait([envio, desconexion], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for tarea in (envio, desconexion):
+                tarea.cancel()
+            await asyncio.gather(envio, desconexion, return_exceptions=True)
+            await self.generador.aclose()
+
+    async def _enviar_partes(self, send):
+        async for parte in self.generador:
+            await send({'type': 'http.response.body', 'body': parte.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def respuesta_json(datos, estado=200, encabezados=None):
+    return Respuesta(json.dumps(datos).encode(), estado, encabezados)
+
+
+def sin_conexion():
+    return respuesta_json({'error': 'No se pudo conectar a la base de datos'}, 500)
+
+
+#################################################################
+# Rutas async
+async def escalafon(peticion):
+    limit = peticion.entero('limit', None)
+    offset = peticion.entero('offset', 0)
+    if (limit is not None and limit < 0) or offset < 0:
+        return respuesta_json({'error': 'limit y offset deben ser enteros no negativos'}, 400)
+    # La caché es la misma de la app Flask, que la invalida al cambiar estadísticas
+    datos = aplicacion.escalafon_cache.obtener('escalafon')
+    if datos is None:
+        conn = await get_db_connection_async()
+        if not conn:
+            return sin_conexion()
+        try:
+            cursor = CursorMedidoAsync(conn.cursor(), 'asgi:escalafon')
+            await cursor.execute(SQL_ESCALAFON, {'ia': ia.JUGADOR_IA})
+            datos = guardar_escalafon(await cursor.fetchall())
+        finally:
+            await conn.close()
+    jugadores, version = datos
+    etag = etag_escalafon(version, offset, limit)
+    encabezados = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    # Igual que make_conditional en Flask: lista de ETags, '*' y comparación débil (W/)
+    if parse_etags(peticion.headers.get('if-none-match')).contains_weak(etag):
+        return Respuesta(b'', 304, encabezados)
+    fin = None if limit is None else offset + limit
+    return respuesta_json(jugadores[offset:fin], encabezados=encabezados)
+
+
+async def listar_partidas(peticion):
+    limite = peticion.entero('limit', LIMITE_PARTIDAS)
+    if limite <= 0:
+        return respuesta_json({'error': 'limit debe ser mayor que cero'}, 400)
+    limite = min(limite, LIMITE_PARTIDAS_MAX)
+    posicion_cursor = None
+    if peticion.args.get('cursor'):
+        try:
+            posicion_cursor = leer_cursor(peticion.args['cursor'])
+        except ValueError:
+            return respuesta_json({'error': 'Cursor inválido'}, 400)
+
+    conn = await get_db_connection_async()
+    if not conn:
+        return sin_conexion()
+    try:
+        cursor = CursorMedidoAsync(conn.cursor(), 'asgi:listar_partidas')
+        jugador_id = None
+        if peticion.args.get('jugador'):
+            nombre = peticion.args['jugador']
+            jugador_id = (await resolver_ids_async(cursor, [nombre])).get(nombre)
+        condiciones, params = condiciones_partidas(peticion.args.get('estado'), peticion.args.get('jugador'),
+                                                  jugador_id)
+        if posicion_cursor:
+            params['fecha'], params['pid'] = posicion_cursor
+            condiciones.append(CONDICION_CURSOR)
+        where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+        params['limite'] = limite + 1
+        await cursor.execute(sql_listar_partidas(where), params)
+        filas = await cursor.fetchall()
+    except Exception as e:
+        return respuesta_json({'error': str(e)}, 500)
+    finally:
+        await conn.close()
+    encabezados = {}
+    if len(filas) > limite:
+        encabezados['X-Siguiente-Cursor'] = escribir_cursor(filas[limite - 1])
+    return respuesta_json([partida_desde_fila(row) for row in filas[:limite]], encabezados=encabezados)
+
+
+async def jugada(peticion, id_partida):
+    id_partida = int(id_partida)
+    data = await peticion.json() or {}
+    try:
+        columna = int(data.get('columna'))
+    except (TypeError, ValueError):
+        return respuesta_json({'success': False, 'error': 'Columna inválida'}, 400)
+    if not 0 <= columna < COLUMNAS:
+        return respuesta_json({'success': False, 'error': 'Columna inválida'}, 400)
+
+    # Mismo bloqueo y validaciones que api_jugada (RepositorioOracle.jugar)
+    try:
+        posicion, fila = await obtener_repositorio().jugar_async(id_partida, columna, jugador=data.get('jugador'))
+    except PartidaNoEncontrada:
+        return respuesta_json({'success': False, 'error': 'Partida no encontrada'}, 404)
+    except PartidaNoEnProgreso:
+        return respuesta_json({'success': False, 'error': 'La partida no está en progreso'}, 400)
+    except TurnoIncorrecto as e:
+        return respuesta_json({'success': False, 'error': 'No es el turno de ese jugador', 'turno': e.turno}, 409)
+    except JugadaInvalida as e:
+        return respuesta_json({'success': False, 'error': str(e)}, 400)
+    except SinConexion:
+        return respuesta_json({'success': False, 'error': 'No se pudo conectar a la base de datos'}, 500)
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return respuesta_json({'success': False, 'error': str(e)}, 500)
+    notificar(id_partida)
+    return respuesta_json(respuesta_jugada(posicion, fila, columna))
+
+
+async def actualizar_partida_por_id(peticion):
+    data = await peticion.json() or {}
+    partida_id = data.get('id_partida')
+    try:
+        await obtener_repositorio().sincronizar_async(partida_id, data.get('partida'))
+    except PartidaNoEncontrada:
+        return respuesta_json({'error': 'Partida no encontrada'}, 404)
+    except PartidaNoEnProgreso:
+        return respuesta_json({'error': 'La partida no está en progreso'}, 400)
+    except SinConexion:
+        return sin_conexion()
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        return respuesta_json({'error': str(e)}, 500)
+    notificar(partida_id)
+    return respuesta_json({'success': True})
+
+
+async def terminar_partida_por_id(peticion):
+    data = await peticion.json() or {}
+    partida_id = data.get('id_partida')
+    try:
+        ia.cancelar_busqueda(int(partida_id))
+    except (TypeError, ValueError):
+        pass
+
+    conn = await get_db_connection_async()
+    if not conn:
+        return sin_conexion()
+    try:
+        cursor = CursorMedidoAsync(conn.cursor(), 'asgi:terminar_partida_por_id')
+        await cursor.execute("""
+            UPDATE Partidas SET Estado = 'Terminada' WHERE PartidaID = :pid
+        """, {'pid': partida_id})
+        await conn.commit()
+        notificar(partida_id)
+        return respuesta_json({'success': True})
+    except Exception as e:
+        await conn.rollback()
+        return respuesta_json({'error': str(e)}, 500)
+    finally:
+        await conn.close()
+
+
+async def stream_partida(peticion, id_partida):
+    id_partida = int(id_partida)
+    # La primera lectura del canal es síncrona; se hace fuera del event loop
+    cola = ColaAsync(asyncio.get_running_loop())
+    suscripcion = await asyncio.to_thread(suscribir, id_partida, cola)
+    if suscripcion is None:
+        return respuesta_json({'success': False, 'error': 'Partida no encontrada'}, 404)
+    cola, foto = suscripcion
+    return RespuestaStream(transmitir_async(id_partida, cola, foto),
+                           {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def estado_emparejamiento(peticion, ticket):
+    # Long-poll sin hilo: espera en el event loop a que el emparejador avise
+    try:
+        espera = float(peticion.args.get('espera', 0))
+    except ValueError:
+        espera = 0
+    entrada = await emparejador.consultar_async(ticket, espera)
+    if entrada is None:
+        return respuesta_json({'success': False, 'error': 'Ticket no encontrado'}, 404)
+    return respuesta_json({'success': True, **entrada.respuesta()})
+
+
+# (método, patrón, handler, regla de Flask con la que se reporta en /metrics)
+RUTAS = [
+    ('GET', re.compile(r'/api/escalafon'), escalafon, '/api/escalafon'),
+    ('GET', re.compile(r'/api/listar_partidas'), listar_partidas, '/api/listar_partidas'),
+    ('POST', re.compile(r'/api/partida/(\d+)/jugada'), jugada, '/api/partida/<int:id_partida>/jugada'),
+    ('POST', re.compile(r'/api/actualizar_partida_por_id'), actualizar_partida_por_id,
+     '/api/actualizar_partida_por_id'),
+    ('POST', re.compile(r'/api/terminar_partida_por_id'), terminar_partida_por_id, '/api/terminar_partida_por_id'),
+    ('GET', re.compile(r'/api/partida/(\d+)/stream'), stream_partida, '/api/partida/<int:id_partida>/stream'),
+    ('GET', re.compile(r'/api/emparejamiento/([^/]+)'), estado_emparejamiento, '/api/emparejamiento/<ticket>'),
+]
+if BACKEND != 'oracle':
+    RUTAS = [ruta for ruta in RUTAS if ruta[2] in (stream_partida, estado_emparejamiento)]
+elif ESCRITURA_DIFERIDA:
+    # Las jugadas tienen que pasar por la escritura diferida del repositorio
+    RUTAS = [ruta for ruta in RUTAS if ruta[2] not in (jugada, actualizar_partida_por_id, terminar_partida_por_id)]
+
+
+#################################################################
+# Todo lo demás lo atiende la app Flask (WSGI) en un hilo
+def _entorno_wsgi(peticion, cuerpo):
+    servidor, puerto = peticion.scope.get('server') or ('localhost', 80)
+    entorno = {
+        'REQUEST_METHOD': peticion.metodo,
+        'SCRIPT_NAME': peticion.scope.get('root_path', ''),
+        'PATH_INFO': peticion.ruta,
+        'QUERY_STRING': peticion.scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': servidor,
+        'SERVER_PORT': str(puerto),
+        'SERVER_PROTOCOL': f"HTTP/{peticion.scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (peticion.scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': peticion.scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in peticion.headers.items():
+        if nombre == 'content-type':
+            entorno['CONTENT_TYPE'] = valor
+        elif nombre == 'content-length':
+            entorno['CONTENT_LENGTH'] = valor
+        else:
+            entorno['HTTP_' + nombre.upper().replace('-', '_')] = valor
+    return entorno
+
+
+def _llamar_flask(entorno, loop, cola, cancelado):
+    # Corre en un hilo: el inicio y cada parte del cuerpo pasan al event loop por
+    # la cola, de a una, así una respuesta en stream (/api/export) no se junta en
+    # memoria. La app y su iterable se usan siempre desde este mismo hilo (las
+    # conexiones de SQLite son por hilo).
+    def poner(mensaje):
+        if not cancelado.is_set():
+            asyncio.run_coroutine_threadsafe(cola.put(mensaje), loop).result()
+
+    inicio = {}
+
+    def start_response(estado, encabezados, exc_info=None):
+        inicio['estado'] = int(estado.split(' ', 1)[0])
+        inicio['encabezados'] = encabezados
+
+    resultado = None
+    try:
+        resultado = aplicacion.app(entorno, start_response)
+        poner({'type': 'http.response.start', 'status': inicio['estado'],
+               'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in inicio['encabezados']]})
+        for parte in resultado:
+            if cancelado.is_set():
+                break
+            if parte:
+                poner({'type': 'http.response.body', 'body': parte, 'more_body': True})
+        poner({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(resultado, 'close'):
+            resultado.close()
+        poner(None)
+
+
+async def a_flask(peticion, send):
+    entorno = _entorno_wsgi(peticion, await peticion.cuerpo())
+    cola = asyncio.Queue(PARTES_EN_VUELO)
+    cancelado = threading.Event()
+    hilo = asyncio.ensure_future(
+        asyncio.to_thread(_llamar_flask, entorno, asyncio.get_running_loop(), cola, cancelado))
+    try:
+        while (mensaje := await cola.get()) is not None:
+            await send(mensaje)
+    finally:
+        # Si el envío se corta, el hilo deja de iterar y cierra el iterable (y su conexión)
+        cancelado.set()
+        while not cola.empty():
+            cola.get_nowait()
+        await hilo
+
+
+#################################################################
+async def _ciclo_de_vida(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            if ESCRITURA_DIFERIDA:
+                await asyncio.to_thread(obtener_repositorio().vaciar)
+            await cerrar_pool_async()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _ciclo_de_vida(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    peticion = Peticion(scope, receive)
+    for metodo, patron, handler, regla in RUTAS:
+        coincidencia = patron.fullmatch(peticion.ruta)
+        if coincidencia and peticion.metodo == metodo:
+            inicio = time.perf_counter()
+            try:
+                respuesta = await handler(peticion, *coincidencia.groups())
+            except PoolAgotado:
+                respuesta = respuesta_json({'success': False, 'error': 'Servidor ocupado, intente de nuevo'}, 503,
+                                           {'Retry-After': max(1, POOL_WAIT_MS // 1000)})
+            # Igual que en Flask: hasta tener la respuesta, sin contar el envío del stream
+            PETICIONES.observar(time.perf_counter() - inicio, regla, metodo)
+            RESPUESTAS.sumar(regla, metodo, respuesta.estado)
+            await respuesta.enviar(send, receive)
+            return
+    await a_flask(peticion, send)
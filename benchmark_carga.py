@@ -0,0 +1,370 @@
+# Prueba de carga: juega miles de partidas completas contra las rutas reales,
+# con varias partidas a la vez, y mide latencias por ruta, peticiones por
+# segundo y viajes a la base por partida.
+#
+#   python benchmark_carga.py --partidas 2000 --concurrencia 16
+#   python benchmark_carga.py --backend sqlite --http --salida sqlite.json --comparar memoria.json
+#
+# Cada partida registra a sus dos jugadores (/registro), crea la partida
+# (/api/crear_partida), manda el tablero después de cada jugada
+# (/api/actualizar_partida_por_id) y registra el resultado, que suma a los dos
+# jugadores y termina la partida (/api/partida/<id>/resultado).
+#
+# Por defecto usa el cliente de pruebas de Flask sobre el repositorio en
+# memoria; --http levanta un servidor local en un hilo y --url apunta a un
+# servidor ya corriendo (en ese caso no se pueden contar las consultas).
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import repositorio
+from motor import Posicion
+
+
+class Contadores:
+    # Suma por llave, segura entre hilos
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valores = {}
+
+    def sumar(self, llave, cantidad=1):
+        with self._lock:
+            self.valores[llave] = self.valores.get(llave, 0) + cantidad
+
+    def total(self):
+        with self._lock:
+            return sum(self.valores.values())
+
+
+#################################################################
+# Conteo de llamadas al repositorio (transacciones) y de sentencias (viajes a la base)
+class RepositorioContado:
+    def __init__(self, repo, transacciones):
+        self._repo = repo
+        self._transacciones = transacciones
+
+    def __getattr__(self, nombre):
+        metodo = getattr(self._repo, nombre)
+        if not callable(metodo):
+            return metodo
+
+        def contado(*args, **kwargs):
+            self._transacciones.sumar(nombre)
+            return metodo(*args, **kwargs)
+        return contado
+
+
+class CursorContado:
+    def __init__(self, cursor, sentencias):
+        self._cursor = cursor
+        self._sentencias = sentencias
+
+    def execute(self, *args, **kwargs):
+        self._sentencias.sumar('execute')
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._sentencias.sumar('executemany')
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+class ConexionContada:
+    def __init__(self, conn, sentencias):
+        self._conn = conn
+        self._sentencias = sentencias
+
+    def cursor(self):
+        return CursorContado(self._conn.cursor(), self._sentencias)
+
+    def commit(self):
+        self._sentencias.sumar('commit')
+        return self._conn.commit()
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+def preparar_repositorio(backend, ruta_sqlite, sentencias):
+    if backend == 'sqlite':
+        from repositorio_sqlite import RepositorioSQLite
+
+        class SQLiteContado(RepositorioSQLite):
+            def _conexion(self):
+                conn = super()._conexion()
+                if not getattr(self._local, 'contada', False):
+                    # Cada sentencia que llega a SQLite (incluye BEGIN y COMMIT)
+                    conn.set_trace_callback(lambda sql: sentencias.sumar(sql.split(None, 1)[0].upper()))
+                    self._local.contada = True
+                return conn
+
+        return SQLiteContado(ruta_sqlite)
+    if backend == 'oracle':
+        import repositorio_oracle
+        obtener = repositorio_oracle.get_db_connection
+
+        def obtener_contada():
+            conn = obtener()
+            return ConexionContada(conn, sentencias) if conn is not None else None
+        repositorio_oracle.get_db_connection = obtener_contada
+    return repositorio.crear_repositorio(backend)
+
+
+#################################################################
+# Clientes: el de pruebas de Flask o HTTP contra un servidor
+class ClientePruebas:
+    def __init__(self, app):
+        self._app = app
+        self._local = threading.local()
+
+    def post(self, ruta, datos=None, formulario=None):
+        cliente = getattr(self._local, 'cliente', None)
+        if cliente is None:
+            cliente = self._local.cliente = self._app.test_client()
+        if formulario is not None:
+            respuesta = cliente.post(ruta, data=formulario)
+        else:
+            respuesta = cliente.post(ruta, json=datos)
+        return respuesta.status_code, respuesta.get_json(silent=True)
+
+
+class ClienteHTTP:
+    def __init__(self, url):
+        partes = urlsplit(url)
+        self._host, self._puerto = partes.hostname, partes.port or 80
+        self._local = threading.local()
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self._host, self._puerto, timeout=30)
+        return conn
+
+    def post(self, ruta, datos=None, formulario=None):
+        if formulario is not None:
+            cuerpo, tipo = urlencode(formulario), 'application/x-www-form-urlencoded'
+        else:
+            cuerpo, tipo = json.dumps(datos), 'application/json'
+        for intento in range(2):
+            conn = self._conexion()
+            try:
+                conn.request('POST', ruta, cuerpo, {'Content-Type': tipo})
+                respuesta = conn.getresponse()
+                contenido = respuesta.read()
+                if respuesta.getheader('Connection', '').lower() == 'close' or respuesta.version == 10:
+                    conn.close()
+                    self._local.conn = None
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # El servidor cerró la conexión keep-alive: se reintenta con una nueva
+                conn.close()
+                self._local.conn = None
+                if intento:
+                    raise
+        try:
+            return respuesta.status, json.loads(contenido)
+        except ValueError:
+            return respuesta.status, None
+
+
+def servidor_local(app):
+    from werkzeug.serving import make_server
+    # Sin una línea de log por petición
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, name='servidor-carga', daemon=True).start()
+    return servidor, f'http://127.0.0.1:{servidor.server_port}'
+
+
+#################################################################
+# Simulación
+class Medicion:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}
+        self.errores = {}
+
+    def registrar(self, ruta, segundos, ok):
+        with self._lock:
+            self.latencias.setdefault(ruta, []).append(segundos)
+            if not ok:
+                self.errores[ruta] = self.errores.get(ruta, 0) + 1
+
+
+def pedir(cliente, medicion, ruta, datos=None, formulario=None, regla=None):
+    # `regla` agrupa las rutas con id (/api/partida/<id>/...) en una sola fila del resumen
+    inicio = time.perf_counter()
+    estado, cuerpo = cliente.post(ruta, datos, formulario)
+    ok = estado == 200 and bool(cuerpo) and cuerpo.get('success', False)
+    medicion.registrar(regla or ruta, time.perf_counter() - inicio, ok)
+    return cuerpo if ok else None
+
+
+def jugar_partida(cliente, medicion, corrida, numero, semilla):
+    azar = random.Random(semilla + numero)
+    nombres = [f'carga-{corrida}-{numero}-{lado}' for lado in ('a', 'b')]
+    for lado, nombre in enumerate(nombres):
+        identificacion = f'{corrida}{numero:07d}{lado}'
+        if pedir(cliente, medicion, '/registro', formulario={'nombre': nombre, 'identificacion': identificacion}) is None:
+            return False
+    creada = pedir(cliente, medicion, '/api/crear_partida', {'jugador1': nombres[0], 'jugador2': nombres[1]})
+    if creada is None:
+        return False
+    id_partida = creada['id_partida']
+
+    posicion = Posicion()
+    while not posicion.terminada:
+        posicion.jugar(azar.choice(posicion.jugadas_legales()))
+        if pedir(cliente, medicion, '/api/actualizar_partida_por_id',
+                 {'id_partida': id_partida, 'partida': posicion.a_partida()}) is None:
+            return False
+
+    return pedir(cliente, medicion, f'/api/partida/{id_partida}/resultado',
+                 regla='/api/partida/<id>/resultado') is not None
+
+
+def percentil(ordenados, p):
+    # Rango más cercano
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+def resumen_rutas(medicion, duracion):
+    rutas = {}
+    for ruta, latencias in sorted(medicion.latencias.items()):
+        ordenados = sorted(latencias)
+        rutas[ruta] = {
+            'peticiones': len(ordenados),
+            'errores': medicion.errores.get(ruta, 0),
+            'por_segundo': round(len(ordenados) / duracion, 1),
+            'media_ms': round(sum(ordenados) / len(ordenados) * 1000, 3),
+            'p50_ms': round(percentil(ordenados, 50) * 1000, 3),
+            'p95_ms': round(percentil(ordenados, 95) * 1000, 3),
+            'p99_ms': round(percentil(ordenados, 99) * 1000, 3),
+            'max_ms': round(ordenados[-1] * 1000, 3),
+        }
+    return rutas
+
+
+def imprimir(resultado):
+    print(f'{"ruta":<36} {"peticiones":>10} {"errores":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for ruta, datos in resultado['rutas'].items():
+        print(f'{ruta:<36} {datos["peticiones"]:>10} {datos["errores"]:>7} {datos["p50_ms"]:>8.2f}'
+              f' {datos["p95_ms"]:>8.2f} {datos["p99_ms"]:>8.2f}')
+    print(f'\n{resultado["partidas_completas"]}/{resultado["partidas"]} partidas en {resultado["duracion_s"]:.2f} s:'
+          f' {resultado["peticiones_por_segundo"]:.0f} peticiones/s, {resultado["partidas_por_segundo"]:.1f} partidas/s')
+    bd = resultado['bd']
+    if bd['transacciones_por_partida'] is not None:
+        print(f'Por partida: {bd["transacciones_por_partida"]:.1f} transacciones', end='')
+        if bd['sentencias_por_partida'] is not None:
+            print(f', {bd["sentencias_por_partida"]:.1f} viajes a la base', end='')
+        print()
+
+
+def comparar(resultado, anterior):
+    # Cambio relativo contra una corrida guardada; positivo en p95 es más lento
+    def cambio(nuevo, viejo):
+        return f'{(nuevo - viejo) / viejo * 100:+.1f}%' if viejo else 'n/a'
+    print(f'\nContra {anterior["configuracion"]["backend"]} ({anterior["fecha"]}):')
+    print(f'{"peticiones/s":<36} {cambio(resultado["peticiones_por_segundo"], anterior["peticiones_por_segundo"]):>10}')
+    for ruta, datos in resultado['rutas'].items():
+        previo = anterior['rutas'].get(ruta)
+        if previo:
+            print(f'{ruta + " p95":<36} {cambio(datos["p95_ms"], previo["p95_ms"]):>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga con partidas completas simuladas')
+    parser.add_argument('--partidas', type=int, default=1000)
+    parser.add_argument('--concurrencia', type=int, default=8, help='Partidas jugándose a la vez')
+    parser.add_argument('--backend', choices=('memoria', 'sqlite', 'oracle'), default='memoria')
+    parser.add_argument('--sqlite', help='Archivo SQLite (por defecto uno temporal)')
+    parser.add_argument('--http', action='store_true', help='Levantar un servidor local en vez del cliente de pruebas')
+    parser.add_argument('--url', help='Servidor ya corriendo, p. ej. http://127.0.0.1:5000')
+    parser.add_argument('--diferida', action='store_true', help='Escritura diferida de jugadas (repositorio_diferido)')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', default='benchmark_carga.json')
+    parser.add_argument('--comparar', help='Resultados JSON de una corrida anterior')
+    args = parser.parse_args()
+
+    transacciones, sentencias = Contadores(), Contadores()
+    servidor = None
+    if args.url:
+        cliente, contar = ClienteHTTP(args.url), False
+    else:
+        ruta_sqlite = args.sqlite or os.path.join(tempfile.mkdtemp(prefix='kuatro-carga-'), 'carga.sqlite3')
+        repo = preparar_repositorio(args.backend, ruta_sqlite, sentencias)
+        repo = RepositorioContado(repo, transacciones)
+        if args.diferida:
+            from repositorio_diferido import RepositorioDiferido
+            repo = RepositorioDiferido(repo)
+        repositorio.usar_repositorio(repo)
+        import app as aplicacion
+        if args.http:
+            servidor, url = servidor_local(aplicacion.app)
+            cliente = ClienteHTTP(url)
+        else:
+            cliente = ClientePruebas(aplicacion.app)
+        contar = True
+
+    medicion = Medicion()
+    corrida = f'{int(time.time()) % 100000:05d}'
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrencia) as ejecutor:
+        completas = sum(ejecutor.map(lambda n: jugar_partida(cliente, medicion, corrida, n, args.semilla),
+                                     range(args.partidas)))
+    duracion = time.perf_counter() - inicio
+    if args.diferida and not args.url:
+        repo.vaciar()
+    if servidor is not None:
+        servidor.shutdown()
+
+    peticiones = sum(len(latencias) for latencias in medicion.latencias.values())
+    resultado = {
+        'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'configuracion': {
+            'partidas': args.partidas,
+            'concurrencia': args.concurrencia,
+            'backend': 'externo' if args.url else args.backend,
+            'cliente': 'http' if args.url or args.http else 'pruebas',
+            'diferida': args.diferida,
+            'semilla': args.semilla,
+        },
+        'partidas': args.partidas,
+        'partidas_completas': completas,
+        'duracion_s': round(duracion, 3),
+        'peticiones': peticiones,
+        'peticiones_por_segundo': round(peticiones / duracion, 1),
+        'partidas_por_segundo': round(completas / duracion, 2),
+        'rutas': resumen_rutas(medicion, duracion),
+        'bd': {
+            'transacciones_por_partida': round(transacciones.total() / args.partidas, 2) if contar else None,
+            'sentencias_por_partida': (round(sentencias.total() / args.partidas, 2)
+                                       if contar and args.backend != 'memoria' else None),
+            'transacciones': dict(sorted(transacciones.valores.items())),
+            'sentencias': dict(sorted(sentencias.valores.items())),
+        },
+    }
+    imprimir(resultado)
+    with open(args.salida, 'w') as archivo:
+        json.dump(resultado, archivo, indent=2)
+    print(f'Resultados en {args.salida}')
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            comparar(resultado, json.load(archivo))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Mide conexiones y consultas por cada vista de partida (/juego y
+# /ver_partida) comparando la carga anterior (partida + dos get_stats en
+# conexiones aparte) con obtener_datos_partida.
+#
+#   python benchmark_partida.py --id-partida 15 --repeticiones 200
+#
+# Necesita la base configurada igual que la aplicación (ver db.py).
+import argparse
+import time
+
+import app as aplicacion
+from db import get_db_connection
+from jugadas import cargar_codigo
+from motor import partida_json_desde_codigo
+
+
+class Contador:
+    def __init__(self):
+        self.conexiones = 0
+        self.consultas = 0
+
+
+class CursorContado:
+    def __init__(self, cursor, contador):
+        self._cursor = cursor
+        self._contador = contador
+
+    def execute(self, *args, **kwargs):
+        self._contador.consultas += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+class ConexionContada:
+    def __init__(self, conn, contador):
+        self._conn = conn
+        self._contador = contador
+
+    def cursor(self):
+        return CursorContado(self._conn.cursor(), self._contador)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+def conexion_contada(contador):
+    def obtener():
+        conn = get_db_connection()
+        if conn is None:
+            return None
+        contador.conexiones += 1
+        return ConexionContada(conn, contador)
+    return obtener
+
+
+def carga_anterior(obtener_conexion, id_partida):
+    # Camino anterior: una conexión para la partida y una por jugador para las stats
+    conn = obtener_conexion()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT j1.Nombre, j2.Nombre, p.Tablero, p.Partida, p.Estado
+            FROM Partidas p
+            JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
+            JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
+            WHERE p.PartidaID = :pid
+        ''', {'pid': id_partida})
+        row = cursor.fetchone()
+        nombres = row[:2]
+        partida_json = partida_json_desde_codigo(cargar_codigo(cursor, id_partida, row[2] or row[3]))
+    finally:
+        conn.close()
+    stats = []
+    for nombre in nombres:
+        conn = obtener_conexion()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT Puntuacion, Ganadas, Empatadas, Perdidas FROM Jugadores WHERE Nombre = :nombre",
+                {'nombre': nombre}
+            )
+            stats.append(cursor.fetchone())
+        finally:
+            conn.close()
+    return nombres, partida_json, stats
+
+
+def medir(nombre, funcion, repeticiones, contador):
+    contador.conexiones = contador.consultas = 0
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    transcurrido = time.perf_counter() - inicio
+    print(f'{nombre:<24} {contador.conexiones / repeticiones:>8.2f} {contador.consultas / repeticiones:>9.2f}'
+          f' {transcurrido / repeticiones * 1000:>9.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Conexiones y consultas por vista de partida')
+    parser.add_argument('--id-partida', type=int, required=True)
+    parser.add_argument('--repeticiones', type=int, default=100)
+    args = parser.parse_args()
+
+    contador = Contador()
+    obtener_conexion = conexion_contada(contador)
+    aplicacion.get_db_connection = obtener_conexion
+
+    def nueva():
+        # Sin caché para medir la consulta misma
+        aplicacion.partidas_terminadas.invalidar()
+        return aplicacion.obtener_datos_partida(args.id_partida)
+
+    print(f'{"carga":<24} {"conexiones":>8} {"consultas":>9} {"ms/vista":>9}')
+    medir('anterior', lambda: carga_anterior(obtener_conexion, args.id_partida), args.repeticiones, contador)
+    medir('una consulta', nueva, args.repeticiones, contador)
+    medir('con caché (terminadas)', lambda: aplicacion.obtener_datos_partida(args.id_partida),
+          args.repeticiones, contador)
+
+
+if __name__ == '__main__':
+    main()
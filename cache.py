@@ -0,0 +1,67 @@
+# Cachés en memoria del proceso. Cada proceso (worker) tiene la suya, por eso
+# todas vencen por tiempo además de invalidarse cuando el mismo proceso
+# modifica los datos.
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, llave):
+        with self._lock:
+            entrada = self._datos.get(llave)
+            if entrada is None:
+                return None
+            valor, vence = entrada
+            if time.monotonic() >= vence:
+                del self._datos[llave]
+                return None
+            return valor
+
+    def guardar(self, llave, valor):
+        with self._lock:
+            self._datos[llave] = (valor, time.monotonic() + self.ttl)
+
+    def invalidar(self, llave=None):
+        with self._lock:
+            if llave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(llave, None)
+
+
+class CacheLRU:
+    # Tamaño acotado: al llenarse sale la entrada usada hace más tiempo
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, llave):
+        with self._lock:
+            if llave not in self._datos:
+                return None
+            self._datos.move_to_end(llave)
+            return self._datos[llave]
+
+    def guardar(self, llave, valor):
+        with self._lock:
+            self._datos[llave] = valor
+            self._datos.move_to_end(llave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, llave=None):
+        with self._lock:
+            if llave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(llave, None)
+
+    def __len__(self):
+        return len(self._datos)
@@ -0,0 +1,209 @@
+import logging
+import os
+import threading
+import time
+
+import oracledb
+
+from metricas import CONEXIONES, ERRORES_CONEXION
+
+# Configuración de la conexión y del pool (se puede cambiar con variables de entorno)
+DB_USER = os.environ.get('KUATRO_DB_USER', 'KUATRO')
+DB_PASSWORD = os.environ.get('KUATRO_DB_PASSWORD', 'KUATRO')
+DB_DSN = os.environ.get('KUATRO_DB_DSN', 'localhost:1521/xe')
+
+POOL_MIN = int(os.environ.get('KUATRO_POOL_MIN', '2'))
+POOL_MAX = int(os.environ.get('KUATRO_POOL_MAX', '10'))
+# Con asgi.py el proceso abre los dos pools: KUATRO_POOL_MAX es el total y el
+# async se queda con KUATRO_POOL_ASYNC_MAX (por defecto la mitad)
+POOL_ASYNC_MAX = int(os.environ.get('KUATRO_POOL_ASYNC_MAX', str(max(1, POOL_MAX // 2))))
+POOL_INCREMENT = int(os.environ.get('KUATRO_POOL_INCREMENT', '1'))
+# Milisegundos que una petición espera por una conexión libre antes de rendirse
+POOL_WAIT_MS = int(os.environ.get('KUATRO_POOL_WAIT_MS', '500'))
+# Segundos sin uso tras los cuales el pool hace ping a la conexión antes de entregarla
+POOL_PING_SEGUNDOS = int(os.environ.get('KUATRO_POOL_PING', '60'))
+
+log = logging.getLogger(__name__)
+
+
+class PoolAgotado(Exception):
+    """No hubo una conexión libre dentro de POOL_WAIT_MS."""
+
+
+_pool = None
+_pool_max = POOL_MAX
+_lock = threading.Lock()
+_contadores = {
+    'adquisiciones': 0,
+    'esperando': 0,
+    'timeouts': 0,
+    'errores': 0,
+    'espera_total_ms': 0.0,
+}
+
+
+def repartir_pool():
+    # asgi.py la llama al importarse, antes de que se cree algún pool
+    global _pool_max
+    _pool_max = max(1, POOL_MAX - POOL_ASYNC_MAX)
+
+
+def obtener_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = oracledb.create_pool(
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    dsn=DB_DSN,
+                    min=min(POOL_MIN, _pool_max),
+                    max=_pool_max,
+                    increment=POOL_INCREMENT,
+                    getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                    wait_timeout=POOL_WAIT_MS,
+                    ping_interval=POOL_PING_SEGUNDOS
+                )
+    return _pool
+
+
+_pool_async = None
+
+
+def obtener_pool_async():
+    # Pool de conexiones async (modo thin) para asgi.py; lo crea un solo event loop
+    global _pool_async
+    if _pool_async is None:
+        _pool_async = oracledb.create_pool_async(
+            user=DB_USER,
+            password=DB_PASSWORD,
+            dsn=DB_DSN,
+            min=min(POOL_MIN, POOL_ASYNC_MAX),
+            max=POOL_ASYNC_MAX,
+            increment=POOL_INCREMENT,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=POOL_WAIT_MS,
+            ping_interval=POOL_PING_SEGUNDOS
+        )
+    return _pool_async
+
+
+async def cerrar_pool_async():
+    global _pool_async
+    if _pool_async is not None:
+        await _pool_async.close(force=True)
+        _pool_async = None
+
+
+def _es_timeout_pool(error):
+    return getattr(error.args[0], 'full_code', None) == 'DPY-4005'
+
+
+def get_db_connection():
+    # Devuelve una conexión del pool; conn.close() la regresa al pool
+    try:
+        pool = obtener_pool()
+    except oracledb.DatabaseError:
+        log.exception('Error al crear el pool')
+        with _lock:
+            _contadores['errores'] += 1
+        return None
+
+    inicio = time.perf_counter()
+    with _lock:
+        _contadores['esperando'] += 1
+    try:
+        conn = pool.acquire()
+    except oracledb.DatabaseError as e:
+        ERRORES_CONEXION.sumar('sync', 'timeout' if _es_timeout_pool(e) else 'error')
+        with _lock:
+            if _es_timeout_pool(e):
+                _contadores['timeouts'] += 1
+            else:
+                _contadores['errores'] += 1
+        if _es_timeout_pool(e):
+            raise PoolAgotado() from e
+        log.exception('Error de conexión')
+        return None
+    finally:
+        with _lock:
+            _contadores['esperando'] -= 1
+
+    espera = time.perf_counter() - inicio
+    CONEXIONES.observar(espera, 'sync')
+    with _lock:
+        _contadores['adquisiciones'] += 1
+        _contadores['espera_total_ms'] += espera * 1000
+    return conn
+
+
+async def get_db_connection_async():
+    # Igual que get_db_connection pero sin bloquear el event loop;
+    # se devuelve al pool con `await conn.close()`
+    try:
+        pool = obtener_pool_async()
+    except oracledb.DatabaseError:
+        log.exception('Error al crear el pool async')
+        with _lock:
+            _contadores['errores'] += 1
+        return None
+
+    inicio = time.perf_counter()
+    with _lock:
+        _contadores['esperando'] += 1
+    try:
+        conn = await pool.acquire()
+    except oracledb.DatabaseError as e:
+        ERRORES_CONEXION.sumar('async', 'timeout' if _es_timeout_pool(e) else 'error')
+        with _lock:
+            if _es_timeout_pool(e):
+                _contadores['timeouts'] += 1
+            else:
+                _contadores['errores'] += 1
+        if _es_timeout_pool(e):
+            raise PoolAgotado() from e
+        log.exception('Error de conexión')
+        return None
+    finally:
+        with _lock:
+            _contadores['esperando'] -= 1
+
+    espera = time.perf_counter() - inicio
+    CONEXIONES.observar(espera, 'async')
+    with _lock:
+        _contadores['adquisiciones'] += 1
+        _contadores['espera_total_ms'] += espera * 1000
+    return conn
+
+
+def estadisticas_pool():
+    with _lock:
+        datos = dict(_contadores)
+    espera_total = datos.pop('espera_total_ms')
+    adquisiciones = datos['adquisiciones']
+    datos['espera_promedio_ms'] = round(espera_total / adquisiciones, 3) if adquisiciones else 0.0
+    datos.update({'min': POOL_MIN, 'max': POOL_MAX, 'incremento': POOL_INCREMENT})
+    datos['abiertas'] = datos['en_uso'] = 0
+    for pool in (_pool, _pool_async):
+        if pool is not None:
+            datos['abiertas'] += pool.opened
+            datos['en_uso'] += pool.busy
+    return datos
+
+
+def verificar_salud():
+    # Toma una conexión y hace un ping real a la base de datos
+    inicio = time.perf_counter()
+    try:
+        conn = get_db_connection()
+    except PoolAgotado:
+        return False, 'Pool agotado', 0.0
+    if not conn:
+        return False, 'No se pudo conectar a la base de datos', 0.0
+    try:
+        conn.ping()
+        return True, 'OK', round((time.perf_counter() - inicio) * 1000, 3)
+    except oracledb.DatabaseError as e:
+        return False, str(e), 0.0
+    finally:
+        conn.close()
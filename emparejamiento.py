@@ -0,0 +1,265 @@
+# Cola de emparejamiento: un jugador pide rival y el servidor lo junta con
+# otro que esté esperando y tenga un rating parecido.
+#
+# Los que esperan están en una lista ordenada por rating. Al entrar alguien
+# se busca con bisect al vecino más cercano y, si está dentro de la ventana
+# de ambos, se emparejan en ese momento (O(log n)). La ventana empieza en
+# VENTANA_INICIAL puntos y crece VENTANA_POR_SEGUNDO por cada segundo de
+# espera; un hilo recorre la lista cada EMPAREJAR_CADA y junta vecinos que
+# ya quedaron dentro de sus ventanas. La partida se crea con el mismo
+# crear_partida de siempre y el que esperó más juega primero.
+#
+# El cliente consulta su turno en la cola con long-poll: la petición queda
+# abierta hasta que hay partida o pasan `espera` segundos. Quien deja de
+# consultar por ABANDONO segundos sale de la cola. Con Flask la petición
+# espera en su hilo; asgi.py usa consultar_async, que espera en el event loop.
+#
+# La cola vive en el proceso: con varios workers, las peticiones de
+# emparejamiento deben ir todas al mismo (igual que la escritura diferida).
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import secrets
+import threading
+import time
+
+from motor import VACIO
+from repositorio import obtener_repositorio
+
+VENTANA_INICIAL = float(os.environ.get('KUATRO_EMPAREJAR_VENTANA', '50'))
+VENTANA_POR_SEGUNDO = float(os.environ.get('KUATRO_EMPAREJAR_CRECE', '25'))
+VENTANA_MAXIMA = float(os.environ.get('KUATRO_EMPAREJAR_VENTANA_MAX', '800'))
+EMPAREJAR_CADA = float(os.environ.get('KUATRO_EMPAREJAR_CADA_MS', '200')) / 1000
+ABANDONO = float(os.environ.get('KUATRO_EMPAREJAR_ABANDONO', '30'))
+# Segundos que se guarda el resultado de un ticket ya emparejado o vencido
+RESULTADO_TTL = 60
+ESPERA_MAXIMA = 30
+
+log = logging.getLogger(__name__)
+
+
+class Entrada:
+    def __init__(self, ticket, jugador_id, nombre, rating, secuencia):
+        self.ticket = ticket
+        self.jugador_id = jugador_id
+        self.nombre = nombre
+        self.rating = rating
+        self.llave = (rating, secuencia)
+        self.desde = self.contacto = time.monotonic()
+        self.estado = 'esperando'       # esperando, creando, emparejado, vencido
+        self.partida = None             # {'id_partida', 'jugador1', 'jugador2', 'jugador'}
+        self.fin = None
+        self.listo = threading.Event()
+        self._avisos = []               # [(loop, asyncio.Event)] de consultas async esperando
+
+    def avisar(self):
+        # Despierta a las consultas que esperan, en hilos o en un event loop
+        self.listo.set()
+        for loop, aviso in list(self._avisos):
+            try:
+                loop.call_soon_threadsafe(aviso.set)
+            except RuntimeError:
+                pass
+
+    def ventana(self, ahora):
+        return min(VENTANA_MAXIMA, VENTANA_INICIAL + VENTANA_POR_SEGUNDO * (ahora - self.desde))
+
+    def respuesta(self):
+        datos = {'ticket': self.ticket, 'estado': 'esperando' if self.estado == 'creando' else self.estado}
+        if self.estado in ('esperando', 'creando'):
+            ahora = time.monotonic()
+            datos['espera'] = round(ahora - self.desde, 1)
+            datos['ventana'] = round(self.ventana(ahora))
+        if self.partida:
+            datos.update(self.partida)
+        return datos
+
+
+class Emparejador:
+    def __init__(self):
+        self._espera = []           # [(rating, secuencia)] ordenada
+        self._por_llave = {}        # (rating, secuencia) -> Entrada
+        self._entradas = {}         # ticket -> Entrada
+        self._por_jugador = {}      # JugadorID -> Entrada en espera
+        self._secuencia = itertools.count()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.emparejadas = 0
+
+    #################################################################
+    # Lista ordenada (siempre con _lock tomado)
+    def _agregar(self, entrada):
+        bisect.insort(self._espera, entrada.llave)
+        self._por_llave[entrada.llave] = entrada
+        self._por_jugador[entrada.jugador_id] = entrada
+        entrada.estado = 'esperando'
+
+    def _sacar(self, entrada, estado):
+        indice = bisect.bisect_left(self._espera, entrada.llave)
+        if indice < len(self._espera) and self._espera[indice] == entrada.llave:
+            del self._espera[indice]
+        self._por_llave.pop(entrada.llave, None)
+        if self._por_jugador.get(entrada.jugador_id) is entrada:
+            del self._por_jugador[entrada.jugador_id]
+        entrada.estado = estado
+
+    def _compatibles(self, a, b, ahora):
+        return (a.jugador_id != b.jugador_id
+                and abs(a.rating - b.rating) <= min(a.ventana(ahora), b.ventana(ahora)))
+
+    def _vecino(self, entrada, ahora):
+        # El que espera con el rating más cercano, si está dentro de ambas ventanas
+        indice = bisect.bisect_left(self._espera, entrada.llave)
+        candidatos = [self._por_llave[self._espera[i]] for i in (indice - 1, indice) if 0 <= i < len(self._espera)]
+        candidatos.sort(key=lambda otra: abs(otra.rating - entrada.rating))
+        for otra in candidatos:
+            if self._compatibles(entrada, otra, ahora):
+                return otra
+        return None
+
+    #################################################################
+    def unirse(self, jugador_id, nombre, rating):
+        # Devuelve la Entrada del jugador; si ya estaba esperando, la misma
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._por_jugador.get(jugador_id)
+            if entrada is not None:
+                entrada.contacto = ahora
+                return entrada
+            entrada = Entrada(secrets.token_urlsafe(12), jugador_id, nombre, float(rating), next(self._secuencia))
+            self._entradas[entrada.ticket] = entrada
+            rival = self._vecino(entrada, ahora)
+            if rival is None:
+                self._agregar(entrada)
+                self._iniciar()
+            else:
+                self._sacar(rival, 'creando')
+                entrada.estado = 'creando'
+                self._por_jugador[jugador_id] = entrada
+        if rival is not None:
+            self._crear_partida(rival, entrada)
+        return entrada
+
+    def consultar(self, ticket, espera=0):
+        # Long-poll: espera hasta `espera` segundos a que haya partida
+        with self._lock:
+            entrada = self._entradas.get(ticket)
+            if entrada is None:
+                return None
+            entrada.contacto = time.monotonic()
+        if espera > 0:
+            entrada.listo.wait(min(espera, ESPERA_MAXIMA))
+        entrada.contacto = time.monotonic()
+        return entrada
+
+    async def consultar_async(self, ticket, espera=0):
+        # Igual que consultar, sin ocupar un hilo mientras espera
+        with self._lock:
+            entrada = self._entradas.get(ticket)
+            if entrada is None:
+                return None
+            entrada.contacto = time.monotonic()
+        if espera > 0:
+            aviso = (asyncio.get_running_loop(), asyncio.Event())
+            entrada._avisos.append(aviso)
+            try:
+                # Se revisa después de anotarse: si avisar() ya pasó, no se espera
+                if not entrada.listo.is_set():
+                    await asyncio.wait_for(aviso[1].wait(), min(espera, ESPERA_MAXIMA))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                entrada._avisos.remove(aviso)
+        entrada.contacto = time.monotonic()
+        return entrada
+
+    def salir(self, ticket):
+        with self._lock:
+            entrada = self._entradas.get(ticket)
+            if entrada is None or entrada.estado != 'esperando':
+                return False
+            self._sacar(entrada, 'vencido')
+            entrada.fin = time.monotonic()
+        entrada.avisar()
+        return True
+
+    #################################################################
+    def _crear_partida(self, primero, segundo):
+        # Fuera del candado: inserta en Partidas como cualquier partida nueva
+        try:
+            id_partida = obtener_repositorio().crear_partida(primero.nombre, segundo.nombre, VACIO)
+        except Exception:
+            log.exception('Emparejamiento: no se pudo crear la partida')
+            with self._lock:
+                for entrada in (primero, segundo):
+                    if entrada.estado == 'creando':
+                        self._agregar(entrada)
+                self._iniciar()
+            return
+        ahora = time.monotonic()
+        with self._lock:
+            for lado, entrada in enumerate((primero, segundo)):
+                entrada.partida = {'id_partida': id_partida, 'jugador1': primero.nombre,
+                                   'jugador2': segundo.nombre, 'jugador': lado}
+                if self._por_jugador.get(entrada.jugador_id) is entrada:
+                    del self._por_jugador[entrada.jugador_id]
+                entrada.estado = 'emparejado'
+                entrada.fin = ahora
+            self.emparejadas += 1
+            self._iniciar()
+        primero.avisar()
+        segundo.avisar()
+
+    def _barrer(self):
+        # Junta vecinos que ya entran en sus ventanas y saca a los que abandonaron
+        ahora = time.monotonic()
+        pares = []
+        with self._lock:
+            for llave in list(self._espera):
+                entrada = self._por_llave[llave]
+                if ahora - entrada.contacto > ABANDONO:
+                    self._sacar(entrada, 'vencido')
+                    entrada.fin = ahora
+                    entrada.avisar()
+            i = 0
+            while i + 1 < len(self._espera):
+                a, b = self._por_llave[self._espera[i]], self._por_llave[self._espera[i + 1]]
+                if self._compatibles(a, b, ahora):
+                    pares.append((a, b) if a.desde <= b.desde else (b, a))
+                    i += 2
+                else:
+                    i += 1
+            for a, b in pares:
+                self._sacar(a, 'creando')
+                self._sacar(b, 'creando')
+                self._por_jugador[a.jugador_id] = a
+                self._por_jugador[b.jugador_id] = b
+            for ticket, entrada in list(self._entradas.items()):
+                if entrada.fin is not None and ahora - entrada.fin > RESULTADO_TTL:
+                    del self._entradas[ticket]
+        for primero, segundo in pares:
+            self._crear_partida(primero, segundo)
+
+    def _iniciar(self):
+        # Con _lock tomado: el hilo corre mientras haya tickets
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._trabajar, name='emparejamiento', daemon=True)
+            self._hilo.start()
+
+    def _trabajar(self):
+        while True:
+            time.sleep(EMPAREJAR_CADA)
+            self._barrer()
+            with self._lock:
+                if not self._espera and not self._entradas:
+                    self._hilo = None
+                    return
+
+    def estadisticas(self):
+        with self._lock:
+            return {'esperando': len(self._espera), 'tickets': len(self._entradas), 'emparejadas': self.emparejadas}
+
+
+emparejador = Emparejador()
@@ -0,0 +1,165 @@
+# Exportación e importación de Jugadores, Partidas (con sus jugadas) y
+# Resultados en NDJSON: un objeto JSON por línea con un campo "tipo".
+#
+#   {"tipo": "jugador", "JugadorID": 1, "Nombre": "Ana", "Identificacion": 11, "Puntuacion": 3, "Rating": 1516.0, ...}
+#   {"tipo": "partida", "PartidaID": 7, "IDJUGADOR": 1, "IDRival": 2, "Estado": "Terminada",
+#    "FechaCreacion": "2024-05-01T10:00:00", "Tablero": "....", "Jugadas": "3344..."}
+#   {"tipo": "resultado", "PartidaID": 7, "IDJUGADOR": 1, "IDRival": 2, "Ganador": 0, ...}
+#
+# "Tablero" es la posición final y "Jugadas" las columnas del historial en
+# orden; las últimas len(Jugadas) fichas del tablero son esas jugadas.
+#
+# La exportación recorre la base con un cursor (arraysize filas por viaje) y
+# escribe línea por línea, así que usa la misma memoria con mil o con un
+# millón de partidas. La importación junta IMPORTAR_LOTE filas por tipo y las
+# inserta con executemany; las filas que fallan (llave repetida, jugador
+# inexistente) se informan sin detener el resto del lote. Los IDs se
+# conservan, de modo que exportar e importar en una base vacía la deja igual.
+import hmac
+import itertools
+import json
+import os
+from datetime import datetime
+
+import click
+
+from motor import decodificar, es_codigo
+from rango import RATING_INICIAL
+from repositorio import obtener_repositorio
+
+EXPORTAR_ARRAYSIZE = int(os.environ.get('KUATRO_EXPORTAR_ARRAYSIZE', '1000'))
+IMPORTAR_LOTE = int(os.environ.get('KUATRO_IMPORTAR_LOTE', '5000'))
+# GET /api/export exige el encabezado X-Kuatro-Token con este valor; sin token queda cerrado
+EXPORTAR_TOKEN = os.environ.get('KUATRO_EXPORTAR_TOKEN', '')
+
+# Orden de escritura: cada tipo depende de los anteriores
+TIPOS = ('jugador', 'partida', 'resultado')
+
+
+def exportacion_permitida(valor):
+    return bool(EXPORTAR_TOKEN) and bool(valor) and hmac.compare_digest(valor, EXPORTAR_TOKEN)
+
+
+def _json(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f'No se puede exportar {type(valor).__name__}')
+
+
+def lineas_ndjson(repositorio, arraysize=EXPORTAR_ARRAYSIZE):
+    for registro in repositorio.exportar(arraysize):
+        yield json.dumps(registro, default=_json, ensure_ascii=False) + '\n'
+
+
+#################################################################
+# Importación
+def _fecha(valor):
+    return datetime.fromisoformat(valor) if valor else None
+
+
+def _entero(valor):
+    return int(valor) if valor is not None else None
+
+
+def _fila(tipo, registro):
+    # Registro NDJSON -> binds del INSERT; para partidas también sus jugadas
+    if tipo == 'jugador':
+        return {
+            'jid': int(registro['JugadorID']),
+            'nombre': registro['Nombre'],
+            'identificacion': registro['Identificacion'],
+            'puntuacion': registro.get('Puntuacion') or 0,
+            'ganadas': registro.get('Ganadas') or 0,
+            'empatadas': registro.get('Empatadas') or 0,
+            'perdidas': registro.get('Perdidas') or 0,
+            'rating': registro.get('Rating') or RATING_INICIAL,
+        }, []
+    if tipo == 'partida':
+        tablero = registro.get('Tablero')
+        if tablero is not None and not es_codigo(tablero):
+            raise ValueError('Tablero inválido')
+        columnas = [int(c) for c in registro.get('Jugadas') or '']
+        # Numero de cada jugada = fichas en el tablero después de jugarla
+        base = (decodificar(tablero).jugadas if tablero else 0) - len(columnas)
+        if base < 0:
+            raise ValueError('Hay más jugadas que fichas en el tablero')
+        pid = int(registro['PartidaID'])
+        return {
+            'pid': pid,
+            'idj': int(registro['IDJUGADOR']),
+            'idr': int(registro['IDRival']),
+            'estado': registro.get('Estado') or 'Terminada',
+            'tablero': tablero,
+            'fecha': _fecha(registro.get('FechaCreacion')),
+        }, [{'pid': pid, 'n': base + i, 'col': columna} for i, columna in enumerate(columnas, 1)]
+    return {
+        'pid': int(registro['PartidaID']),
+        'idj': int(registro['IDJUGADOR']),
+        'idr': int(registro['IDRival']),
+        'ganador': _entero(registro.get('Ganador')),
+        'fecha': _fecha(registro.get('FechaRegistro')),
+    }, []
+
+
+def importar(repositorio, lineas, lote=IMPORTAR_LOTE):
+    # Devuelve ({tipo: filas cargadas}, [(número de línea, error), ...])
+    cargadas = dict.fromkeys(TIPOS, 0)
+    errores = []
+    pendientes = {tipo: [] for tipo in TIPOS}    # [(línea, fila, jugadas)]
+
+    def escribir(tipo):
+        filas = pendientes[tipo]
+        if not filas:
+            return
+        pendientes[tipo] = []
+        jugadas = [(i, jugada) for i, (_, _, de_partida) in enumerate(filas) for jugada in de_partida]
+        fallidas = repositorio.importar_lote(tipo, [fila for _, fila, _ in filas], jugadas)
+        for indice, mensaje in sorted(fallidas):
+            errores.append((filas[indice][0], mensaje))
+        cargadas[tipo] += len(filas) - len(fallidas)
+
+    for numero, linea in enumerate(lineas, 1):
+        if not linea.strip():
+            continue
+        try:
+            registro = json.loads(linea)
+            tipo = registro['tipo']
+            if tipo not in TIPOS:
+                raise ValueError(f'Tipo desconocido: {tipo}')
+            fila, jugadas = _fila(tipo, registro)
+        except (ValueError, KeyError, TypeError) as e:
+            errores.append((numero, f'Línea inválida: {e}'))
+            continue
+        # Lo de tipos anteriores se escribe antes (una partida necesita a sus jugadores)
+        for anterior in TIPOS[:TIPOS.index(tipo)]:
+            escribir(anterior)
+        pendientes[tipo].append((numero, fila, jugadas))
+        if len(pendientes[tipo]) >= lote:
+            escribir(tipo)
+    for tipo in TIPOS:
+        escribir(tipo)
+    repositorio.ajustar_identidades()
+    return cargadas, sorted(errores)
+
+
+#################################################################
+@click.command('exportar')
+@click.option('--salida', type=click.File('w', encoding='utf-8'), default='-', help='Archivo NDJSON (- es stdout)')
+@click.option('--arraysize', default=EXPORTAR_ARRAYSIZE, show_default=True, help='Filas por viaje a la base')
+def exportar_comando(salida, arraysize):
+    """Exporta jugadores, partidas y resultados en NDJSON."""
+    salida.writelines(lineas_ndjson(obtener_repositorio(), arraysize))
+
+
+@click.command('importar')
+@click.argument('entrada', type=click.File('r', encoding='utf-8'))
+@click.option('--lote', default=IMPORTAR_LOTE, show_default=True, help='Filas por cada executemany/commit')
+@click.option('--max-errores', default=20, show_default=True, help='Errores que se muestran')
+def importar_comando(entrada, lote, max_errores):
+    """Carga un archivo NDJSON de `flask exportar` (- es stdin)."""
+    cargadas, errores = importar(obtener_repositorio(), entrada, lote)
+    click.echo(', '.join(f'{tipo}: {cantidad}' for tipo, cantidad in cargadas.items()))
+    for numero, mensaje in itertools.islice(errores, max_errores):
+        click.echo(f'Línea {numero}: {mensaje}', err=True)
+    if errores:
+        click.echo(f'Filas con error: {len(errores)}', err=True)
@@ -0,0 +1,338 @@
+# Oponente de la computadora: negamax con poda alfa-beta, tabla de
+# transposición acotada y profundización iterativa con límite de tiempo.
+#
+# La búsqueda trabaja con dos enteros: `actual` (fichas del jugador en turno)
+# y `mascara` (todas las fichas). La llave actual + mascara identifica la
+# posición de forma única, así que sirve directamente como llave de la tabla.
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FuturoVencido
+
+from aperturas import consultar_libro
+from motor import ALTO, COLUMNA, COLUMNAS, FILA_ABAJO, TABLERO_LLENO, FILAS, Posicion
+from repositorio import JUGADOR_IA
+
+# nivel -> (profundidad máxima, segundos por jugada)
+NIVELES = {
+    'facil': (2, 0.010),
+    'normal': (10, 0.040),
+    'dificil': (42, 0.400),
+}
+NIVEL_POR_DEFECTO = 'normal'
+
+TAMANO_TABLA = int(os.environ.get('KUATRO_IA_TABLA', str(1 << 18)))
+
+# Pool de procesos para las búsquedas (ver calcular_jugada)
+PROCESOS = int(os.environ.get('KUATRO_IA_PROCESOS', str(os.cpu_count() or 2)))
+# Búsquedas pendientes a partir de las cuales se responde con el nivel fácil
+# en el mismo hilo en lugar de encolar
+MAX_PENDIENTES = int(os.environ.get('KUATRO_IA_COLA', str(PROCESOS * 2)))
+# Margen sobre el tiempo del nivel antes de dar la búsqueda por vencida
+MARGEN_SEGUNDOS = float(os.environ.get('KUATRO_IA_MARGEN', '0.5'))
+
+CASILLAS = FILAS * COLUMNAS
+GANAR = 1000
+# Centro primero: las columnas centrales participan en más líneas
+ORDEN_COLUMNAS = sorted(range(COLUMNAS), key=lambda c: abs(COLUMNAS // 2 - c))
+
+EXACTO, COTA_INFERIOR, COTA_SUPERIOR = 0, 1, 2
+
+
+class TiempoAgotado(Exception):
+    pass
+
+
+class BusquedaCancelada(Exception):
+    """La partida terminó mientras se buscaba la jugada."""
+
+
+def casillas_ganadoras(fichas, mascara):
+    # Casillas vacías que completarían cuatro en línea para `fichas`
+    r = (fichas << 1) & (fichas << 2) & (fichas << 3)
+    for d in (ALTO, ALTO - 1, ALTO + 1):
+        t = (fichas << d) & (fichas << 2 * d)
+        r |= t & (fichas << 3 * d)
+        r |= t & (fichas >> d)
+        t = (fichas >> d) & (fichas >> 2 * d)
+        r |= t & (fichas << d)
+        r |= t & (fichas >> 3 * d)
+    return r & (TABLERO_LLENO ^ mascara)
+
+
+class TablaTransposicion:
+    # Tabla de tamaño fijo indexada por llave % tamaño. Una entrada se
+    # reemplaza si es de una búsqueda anterior o si la nueva es más profunda.
+    def __init__(self, tamano=TAMANO_TABLA):
+        self.tamano = tamano
+        self.entradas = [None] * tamano
+        self.generacion = 0
+
+    def nueva_busqueda(self):
+        self.generacion += 1
+
+    def obtener(self, llave):
+        entrada = self.entradas[llave % self.tamano]
+        if entrada is not None and entrada[0] == llave:
+            return entrada
+        return None
+
+    def guardar(self, llave, profundidad, valor, bandera, columna):
+        i = llave % self.tamano
+        entrada = self.entradas[i]
+        if entrada is None or entrada[5] != self.generacion or profundidad >= entrada[1]:
+            self.entradas[i] = (llave, profundidad, valor, bandera, columna, self.generacion)
+
+
+class Buscador:
+    def __init__(self, tabla=None):
+        self.tabla = tabla or TablaTransposicion()
+        self.nodos = 0
+        self.limite = None
+
+    def evaluar(self, actual, mascara):
+        # Diferencia de amenazas (casillas que ganarían) entre ambos jugadores
+        oponente = actual ^ mascara
+        propias = bin(casillas_ganadoras(actual, mascara)).count('1')
+        ajenas = bin(casillas_ganadoras(oponente, mascara)).count('1')
+        return propias - ajenas
+
+    def negamax(self, actual, mascara, jugadas, profundidad, alfa, beta):
+        self.nodos += 1
+        if self.limite is not None and not self.nodos & 1023 and time.perf_counter() > self.limite:
+            raise TiempoAgotado()
+
+        if jugadas >= CASILLAS:
+            return 0
+        posibles = (mascara + FILA_ABAJO) & TABLERO_LLENO
+        if casillas_ganadoras(actual, mascara) & posibles:
+            return GANAR - jugadas - 1
+        if profundidad == 0:
+            return self.evaluar(actual, mascara)
+
+        alfa_original = alfa
+        llave = actual + mascara
+        mejor_columna = None
+        entrada = self.tabla.obtener(llave)
+        if entrada is not None:
+            mejor_columna = entrada[4]
+            if entrada[1] >= profundidad:
+                valor, bandera = entrada[2], entrada[3]
+                if bandera == EXACTO:
+                    return valor
+                if bandera == COTA_INFERIOR:
+                    alfa = max(alfa, valor)
+                else:
+                    beta = min(beta, valor)
+                if alfa >= beta:
+                    return valor
+
+        orden = ORDEN_COLUMNAS
+        if mejor_columna is not None:
+            orden = [mejor_columna] + [c for c in ORDEN_COLUMNAS if c != mejor_columna]
+
+        mejor = -GANAR * 2
+        for col in orden:
+            jugada = posibles & COLUMNA[col]
+            if not jugada:
+                continue
+            valor = -self.negamax(actual ^ mascara, mascara | jugada, jugadas + 1, profundidad - 1, -beta, -alfa)
+            if valor > mejor:
+                mejor, mejor_columna = valor, col
+            if valor > alfa:
+                alfa = valor
+            if alfa >= beta:
+                break
+
+        if mejor <= alfa_original:
+            bandera = COTA_SUPERIOR
+        elif mejor >= beta:
+            bandera = COTA_INFERIOR
+        else:
+            bandera = EXACTO
+        self.tabla.guardar(llave, profundidad, mejor, bandera, mejor_columna)
+        return mejor
+
+    def buscar(self, posicion, profundidad_maxima, segundos):
+        # Profundización iterativa: se queda con la mejor jugada de la última
+        # profundidad que terminó dentro del tiempo
+        self.tabla.nueva_busqueda()
+        self.nodos = 0
+        self.limite = time.perf_counter() + segundos
+        actual = posicion.piezas[posicion.turno]
+        mascara = posicion.mascara
+        legales = posicion.jugadas_legales()
+        mejor_columna = min(legales, key=ORDEN_COLUMNAS.index)
+        mejor_valor = 0
+        profundidad = 0
+        restantes = CASILLAS - posicion.jugadas
+        for profundidad in range(1, min(profundidad_maxima, restantes) + 1):
+            try:
+                valor, columna = self._raiz(actual, mascara, posicion.jugadas, profundidad, legales)
+            except TiempoAgotado:
+                profundidad -= 1
+                break
+            mejor_valor, mejor_columna = valor, columna
+            if abs(valor) >= GANAR - CASILLAS:
+                break
+        self.limite = None
+        return mejor_columna, mejor_valor, profundidad
+
+    def _raiz(self, actual, mascara, jugadas, profundidad, legales):
+        posibles = (mascara + FILA_ABAJO) & TABLERO_LLENO
+        entrada = self.tabla.obtener(actual + mascara)
+        orden = [c for c in ORDEN_COLUMNAS if c in legales]
+        if entrada is not None and entrada[4] in legales:
+            orden.remove(entrada[4])
+            orden.insert(0, entrada[4])
+        alfa, beta = -GANAR * 2, GANAR * 2
+        mejor_columna = orden[0]
+        for col in orden:
+            jugada = posibles & COLUMNA[col]
+            if casillas_ganadoras(actual, mascara) & jugada:
+                return GANAR - jugadas - 1, col
+            valor = -self.negamax(actual ^ mascara, mascara | jugada, jugadas + 1, profundidad - 1, -beta, -alfa)
+            if valor > alfa:
+                alfa, mejor_columna = valor, col
+        self.tabla.guardar(actual + mascara, profundidad, alfa, EXACTO, mejor_columna)
+        return alfa, mejor_columna
+
+
+# Buscador de los procesos del pool (un hilo cada uno); no se comparte entre hilos
+_buscador = None
+# Entradas de la tabla de las búsquedas 'facil' que se hacen en el hilo de la petición
+TABLA_RESPALDO = 1 << 12
+
+
+def elegir_jugada(posicion, nivel=NIVEL_POR_DEFECTO, buscador=None):
+    # Primero el libro de aperturas; sin buscador, la tabla se conserva entre jugadas del mismo proceso
+    global _buscador
+    if nivel != 'facil':
+        jugada = consultar_libro(posicion)
+        if jugada is not None:
+            return jugada[0]
+    if buscador is None:
+        if _buscador is None:
+            _buscador = Buscador()
+        buscador = _buscador
+    profundidad, segundos = NIVELES[nivel]
+    columna, _, _ = buscador.buscar(posicion, profundidad, segundos)
+    return columna
+
+
+def jugada_de_respaldo(posicion):
+    # En el hilo de la petición, que puede correr junto a otras: un Buscador propio por llamada
+    return elegir_jugada(posicion, 'facil', Buscador(TablaTransposicion(TABLA_RESPALDO)))
+
+
+##################################################################
+# Ejecución en un pool de procesos: la búsqueda usa CPU y retiene el GIL,
+# así que se hace fuera del proceso de Flask. El hilo de la petición solo
+# espera el resultado, sin bloquear a las demás rutas.
+_ejecutor = None
+_lock = threading.Lock()
+_pendientes = 0
+_busquedas = {}
+_contadores = {
+    'busquedas': 0,
+    'libro': 0,
+    'degradadas': 0,
+    'vencidas': 0,
+    'canceladas': 0,
+    'espera_total_ms': 0.0,
+    'computo_total_ms': 0.0,
+}
+
+
+def _buscar_en_proceso(piezas, nivel, encolada):
+    inicio = time.time()
+    columna = elegir_jugada(Posicion(piezas), nivel)
+    return columna, inicio - encolada, time.time() - inicio
+
+
+def _obtener_ejecutor():
+    global _ejecutor
+    if _ejecutor is None:
+        with _lock:
+            if _ejecutor is None:
+                _ejecutor = ProcessPoolExecutor(
+                    max_workers=PROCESOS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                atexit.register(_ejecutor.shutdown, wait=False, cancel_futures=True)
+    return _ejecutor
+
+
+def _sumar(contador, valor=1):
+    with _lock:
+        _contadores[contador] += valor
+
+
+def calcular_jugada(id_partida, posicion, nivel=NIVEL_POR_DEFECTO):
+    global _pendientes
+    if nivel != 'facil':
+        jugada = consultar_libro(posicion)
+        if jugada is not None:
+            _sumar('libro')
+            return jugada[0]
+    with _lock:
+        degradar = _pendientes >= MAX_PENDIENTES
+        if not degradar:
+            _pendientes += 1
+    if degradar:
+        # Cola llena: búsqueda corta en el mismo hilo en vez de esperar turno
+        _sumar('degradadas')
+        return jugada_de_respaldo(posicion)
+
+    futuro = None
+    try:
+        futuro = _obtener_ejecutor().submit(_buscar_en_proceso, list(posicion.piezas), nivel, time.time())
+        with _lock:
+            _busquedas[id_partida] = futuro
+        try:
+            columna, espera, computo = futuro.result(timeout=NIVELES[nivel][1] + MARGEN_SEGUNDOS)
+        except CancelledError:
+            _sumar('canceladas')
+            raise BusquedaCancelada()
+        except FuturoVencido:
+            futuro.cancel()
+            _sumar('vencidas')
+            return jugada_de_respaldo(posicion)
+        if futuro.cancelled() or getattr(futuro, 'cancelada', False):
+            _sumar('canceladas')
+            raise BusquedaCancelada()
+        with _lock:
+            _contadores['busquedas'] += 1
+            _contadores['espera_total_ms'] += espera * 1000
+            _contadores['computo_total_ms'] += computo * 1000
+        return columna
+    finally:
+        with _lock:
+            _pendientes -= 1
+            if _busquedas.get(id_partida) is futuro:
+                del _busquedas[id_partida]
+
+
+def cancelar_busqueda(id_partida):
+    # Si la búsqueda no ha empezado se saca de la cola; si ya corre, su
+    # resultado se descarta al volver
+    with _lock:
+        futuro = _busquedas.get(id_partida)
+    if futuro is None:
+        return False
+    futuro.cancelada = True
+    futuro.cancel()
+    return True
+
+
+def estadisticas_busquedas():
+    with _lock:
+        datos = dict(_contadores)
+        datos['pendientes'] = _pendientes
+    busquedas = datos['busquedas']
+    datos['espera_promedio_ms'] = round(datos['espera_total_ms'] / busquedas, 3) if busquedas else 0.0
+    datos['computo_promedio_ms'] = round(datos['computo_total_ms'] / busquedas, 3) if busquedas else 0.0
+    datos.update({'procesos': PROCESOS, 'max_pendientes': MAX_PENDIENTES})
+    return datos
@@ -0,0 +1,210 @@
+# Historial de jugadas de solo inserción.
+#
+# Cada ficha es una fila en Jugadas (PartidaID, Numero, Columna). La columna
+# Partidas.Tablero guarda una foto compacta del tablero (ver motor.codificar)
+# cada SNAPSHOT_CADA jugadas; la posición actual es esa foto más las jugadas
+# posteriores a ella. Las filas antiguas pueden tener la foto todavía en
+# Partidas.Partida como JSON hasta que se migren con `flask migrar-tableros`.
+import os
+
+import click
+from flask import json
+
+from db import get_db_connection
+from motor import Posicion, codificar, decodificar, es_codigo
+
+SNAPSHOT_CADA = int(os.environ.get('KUATRO_SNAPSHOT_CADA', '8'))
+
+
+def posicion_desde_snapshot(snapshot):
+    if es_codigo(snapshot):
+        return decodificar(snapshot)
+    # Formato viejo; con la columna tipo JSON el driver ya entrega un dict
+    if isinstance(snapshot, str):
+        snapshot = json.loads(snapshot)
+    return Posicion.desde_partida(snapshot or {})
+
+
+# Sentencias compartidas por las versiones síncrona y async (ver repositorio_oracle.py)
+SQL_JUGADAS_POSTERIORES = """
+    SELECT Columna FROM Jugadas
+    WHERE PartidaID = :pid AND Numero > :n
+    ORDER BY Numero
+"""
+SQL_INSERTAR_JUGADA = """
+    INSERT INTO Jugadas (PartidaID, Numero, Columna) VALUES (:pid, :n, :col)
+"""
+SQL_GUARDAR_SNAPSHOT = """
+    UPDATE Partidas SET Tablero = :tablero, Partida = NULL WHERE PartidaID = :pid
+"""
+SQL_BORRAR_JUGADAS = "DELETE FROM Jugadas WHERE PartidaID = :pid"
+
+
+def _jugadas_posteriores(cursor, id_partida, desde):
+    cursor.execute(SQL_JUGADAS_POSTERIORES, {'pid': id_partida, 'n': desde})
+    return [row[0] for row in cursor.fetchall()]
+
+
+def cargar_posicion(cursor, id_partida, snapshot):
+    posicion = posicion_desde_snapshot(snapshot)
+    # La foto ya incluye las primeras `jugadas` fichas
+    for columna in _jugadas_posteriores(cursor, id_partida, posicion.jugadas):
+        posicion.jugar(columna)
+    return posicion
+
+
+def cargar_codigo(cursor, id_partida, snapshot):
+    # Igual que cargar_posicion pero devuelve el código compacto; si no hay
+    # jugadas después de la foto no se decodifica nada
+    if es_codigo(snapshot):
+        pendientes = _jugadas_posteriores(cursor, id_partida, len(snapshot) - snapshot.count('.'))
+        if not pendientes:
+            return snapshot
+        posicion = decodificar(snapshot)
+        for columna in pendientes:
+            posicion.jugar(columna)
+        return codificar(posicion)
+    return codificar(cargar_posicion(cursor, id_partida, snapshot))
+
+
+# Subconsulta con las jugadas posteriores a la foto de la fila `p` de Partidas
+# como texto de columnas ('3342...'), para traer partida y jugadas en una sola
+# consulta. Sin Tablero (foto JSON vieja) todas las jugadas son posteriores.
+SQL_PENDIENTES = """(
+    SELECT LISTAGG(jg.Columna) WITHIN GROUP (ORDER BY jg.Numero)
+    FROM Jugadas jg
+    WHERE jg.PartidaID = p.PartidaID
+      AND jg.Numero > NVL(LENGTH(REPLACE(p.Tablero, '.', '')), 0)
+)"""
+
+
+def codigo_con_pendientes(snapshot, pendientes):
+    # Código actual a partir de la foto y el texto de SQL_PENDIENTES
+    if es_codigo(snapshot) and not pendientes:
+        return snapshot
+    posicion = posicion_desde_snapshot(snapshot)
+    for columna in pendientes or '':
+        posicion.jugar(int(columna))
+    return codificar(posicion)
+
+
+def guardar_snapshot(cursor, id_partida, posicion):
+    cursor.execute(SQL_GUARDAR_SNAPSHOT, {'tablero': codificar(posicion), 'pid': id_partida})
+
+
+def _toca_snapshot(posicion):
+    return posicion.jugadas % SNAPSHOT_CADA == 0 or posicion.terminada
+
+
+def registrar_jugada(cursor, id_partida, posicion, columna):
+    # Aplica la jugada y la agrega al historial; devuelve la fila donde cayó.
+    # La llave primaria (PartidaID, Numero) rechaza dos jugadas con el mismo número.
+    fila = posicion.jugar(columna)
+    cursor.execute(SQL_INSERTAR_JUGADA, {'pid': id_partida, 'n': posicion.jugadas, 'col': columna})
+    if _toca_snapshot(posicion):
+        guardar_snapshot(cursor, id_partida, posicion)
+    return fila
+
+
+def sincronizar_tablero(cursor, id_partida, actual, partida):
+    # Compatibilidad con los endpoints que reciben el tablero completo:
+    # si es la posición actual más una ficha se registra solo esa jugada
+    nueva = Posicion.desde_partida(partida or {})
+    if nueva.piezas == actual.piezas:
+        return
+    columna = actual.jugada_hacia(nueva)
+    if columna is not None:
+        registrar_jugada(cursor, id_partida, actual, columna)
+        return
+    # El tablero no continúa la partida (p. ej. se reinició): el historial empieza de nuevo
+    cursor.execute(SQL_BORRAR_JUGADAS, {'pid': id_partida})
+    guardar_snapshot(cursor, id_partida, nueva)
+
+
+##################################################################
+# Lo mismo sobre cursores async de oracledb (conn.cursor() de una AsyncConnection)
+async def cargar_posicion_async(cursor, id_partida, snapshot):
+    posicion = posicion_desde_snapshot(snapshot)
+    await cursor.execute(SQL_JUGADAS_POSTERIORES, {'pid': id_partida, 'n': posicion.jugadas})
+    for (columna,) in await cursor.fetchall():
+        posicion.jugar(columna)
+    return posicion
+
+
+async def guardar_snapshot_async(cursor, id_partida, posicion):
+    await cursor.execute(SQL_GUARDAR_SNAPSHOT, {'tablero': codificar(posicion), 'pid': id_partida})
+
+
+async def registrar_jugada_async(cursor, id_partida, posicion, columna):
+    fila = posicion.jugar(columna)
+    await cursor.execute(SQL_INSERTAR_JUGADA, {'pid': id_partida, 'n': posicion.jugadas, 'col': columna})
+    if _toca_snapshot(posicion):
+        await guardar_snapshot_async(cursor, id_partida, posicion)
+    return fila
+
+
+async def sincronizar_tablero_async(cursor, id_partida, actual, partida):
+    nueva = Posicion.desde_partida(partida or {})
+    if nueva.piezas == actual.piezas:
+        return
+    columna = actual.jugada_hacia(nueva)
+    if columna is not None:
+        await registrar_jugada_async(cursor, id_partida, actual, columna)
+        return
+    await cursor.execute(SQL_BORRAR_JUGADAS, {'pid': id_partida})
+    await guardar_snapshot_async(cursor, id_partida, nueva)
+
+
+def listar_jugadas(cursor, id_partida):
+    cursor.execute("""
+        SELECT Columna FROM Jugadas WHERE PartidaID = :pid ORDER BY Numero
+    """, {'pid': id_partida})
+    return [row[0] for row in cursor.fetchall()]
+
+
+##################################################################
+# Migración de las fotos JSON viejas al formato compacto
+def migrar_tableros(lote=500):
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException('No se pudo conectar a la base de datos')
+    migradas = fallidas = 0
+    ultimo = 0
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute("""
+                SELECT PartidaID, Partida FROM Partidas
+                WHERE PartidaID > :ultimo AND Tablero IS NULL AND Partida IS NOT NULL
+                ORDER BY PartidaID
+                FETCH FIRST :lote ROWS ONLY
+            """, {'ultimo': ultimo, 'lote': lote})
+            filas = cursor.fetchall()
+            if not filas:
+                break
+            ultimo = filas[-1][0]
+            cambios = []
+            for partida_id, partida in filas:
+                try:
+                    cambios.append({'tablero': codificar(posicion_desde_snapshot(partida)), 'pid': partida_id})
+                except (ValueError, TypeError, AttributeError) as e:
+                    fallidas += 1
+                    print(f"Partida {partida_id} no se pudo convertir: {e}")
+            # Un lote donde ninguna se pudo convertir no tiene nada que escribir
+            if cambios:
+                cursor.executemany("""
+                    UPDATE Partidas SET Tablero = :tablero, Partida = NULL WHERE PartidaID = :pid
+                """, cambios)
+                conn.commit()
+                migradas += len(cambios)
+    finally:
+        conn.close()
+    return migradas, fallidas
+
+
+@click.command('migrar-tableros')
+@click.option('--lote', default=500, show_default=True, help='Filas por cada executemany/commit')
+def migrar_tableros_comando(lote):
+    """Convierte Partidas.Partida (JSON) a Partidas.Tablero (42 símbolos)."""
+    migradas, fallidas = migrar_tableros(lote)
+    click.echo(f'Partidas migradas: {migradas}, con error: {fallidas}')
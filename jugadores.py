@@ -0,0 +1,135 @@
+# Caché nombre -> JugadorID compartida por las rutas. Se llena completa la
+# primera vez que se usa (hasta el máximo) y con cada registro; los nombres
+# que falten se resuelven todos juntos en una sola consulta IN (...).
+#
+# IndiceNombres es aparte: todos los nombres ordenados para autocompletar.
+import bisect
+import os
+import threading
+import time
+import unicodedata
+
+from cache import CacheLRU
+
+MAX_JUGADORES = int(os.environ.get('KUATRO_CACHE_JUGADORES', '10000'))
+
+ids_jugadores = CacheLRU(MAX_JUGADORES)
+_precargada = False
+_lock = threading.Lock()
+
+
+SQL_PRECARGA = "SELECT Nombre, JugadorID FROM Jugadores FETCH FIRST :maximo ROWS ONLY"
+
+
+def _precargar(cursor):
+    global _precargada
+    with _lock:
+        if _precargada:
+            return
+        cursor.execute(SQL_PRECARGA, {'maximo': MAX_JUGADORES})
+        for nombre, jugador_id in cursor.fetchall():
+            ids_jugadores.guardar(nombre, jugador_id)
+        _precargada = True
+
+
+def recordar_jugador(nombre, jugador_id):
+    ids_jugadores.guardar(nombre, jugador_id)
+
+
+def _buscar_en_cache(nombres):
+    ids = {}
+    faltantes = []
+    for nombre in set(nombres):
+        jugador_id = ids_jugadores.obtener(nombre)
+        if jugador_id is None:
+            faltantes.append(nombre)
+        else:
+            ids[nombre] = jugador_id
+    return ids, faltantes
+
+
+def _consulta_faltantes(faltantes):
+    binds = {f'n{i}': nombre for i, nombre in enumerate(faltantes)}
+    sql = f"SELECT Nombre, JugadorID FROM Jugadores WHERE Nombre IN ({', '.join(':' + b for b in binds)})"
+    return sql, binds
+
+
+def resolver_ids(cursor, nombres):
+    # {nombre: JugadorID} para los nombres que existen
+    if not _precargada:
+        _precargar(cursor)
+    ids, faltantes = _buscar_en_cache(nombres)
+    if faltantes:
+        cursor.execute(*_consulta_faltantes(faltantes))
+        for nombre, jugador_id in cursor.fetchall():
+            ids_jugadores.guardar(nombre, jugador_id)
+            ids[nombre] = jugador_id
+    return ids
+
+
+async def resolver_ids_async(cursor, nombres):
+    # Igual que resolver_ids con un cursor async; comparte la misma caché
+    global _precargada
+    if not _precargada:
+        await cursor.execute(SQL_PRECARGA, {'maximo': MAX_JUGADORES})
+        for nombre, jugador_id in await cursor.fetchall():
+            ids_jugadores.guardar(nombre, jugador_id)
+        _precargada = True
+    ids, faltantes = _buscar_en_cache(nombres)
+    if faltantes:
+        await cursor.execute(*_consulta_faltantes(faltantes))
+        for nombre, jugador_id in await cursor.fetchall():
+            ids_jugadores.guardar(nombre, jugador_id)
+            ids[nombre] = jugador_id
+    return ids
+
+
+#################################################################
+# Autocompletar (/api/jugadores/buscar): lista ordenada por nombre normalizado
+# (minúsculas y sin tildes). El prefijo se ubica con bisect en O(log n) y se
+# leen los que siguen mientras empiecen igual.
+def normalizar(nombre):
+    descompuesto = unicodedata.normalize('NFKD', nombre.strip().lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+class IndiceNombres:
+    def __init__(self):
+        self._lista = []            # [(normalizado, JugadorID)] ordenada
+        self._nombres = {}          # JugadorID -> (Nombre, normalizado)
+        self._lock = threading.Lock()
+        self.cargado = None
+
+    def reemplazar(self, filas):
+        # filas: (JugadorID, Nombre, ...)
+        nombres = {fila[0]: (fila[1], normalizar(fila[1])) for fila in filas}
+        lista = sorted((normalizado, jugador_id) for jugador_id, (_, normalizado) in nombres.items())
+        with self._lock:
+            self._lista, self._nombres = lista, nombres
+            self.cargado = time.monotonic()
+
+    def vencido(self, ttl):
+        return self.cargado is None or time.monotonic() - self.cargado >= ttl
+
+    def poner(self, jugador_id, nombre):
+        with self._lock:
+            if self.cargado is None or jugador_id in self._nombres:
+                return
+            normalizado = normalizar(nombre)
+            bisect.insort(self._lista, (normalizado, jugador_id))
+            self._nombres[jugador_id] = (nombre, normalizado)
+
+    def buscar(self, prefijo, limite):
+        # [(JugadorID, Nombre)] de los nombres que empiezan con `prefijo`, en orden alfabético
+        prefijo = normalizar(prefijo)
+        encontrados = []
+        with self._lock:
+            i = bisect.bisect_left(self._lista, (prefijo,))
+            while i < len(self._lista) and len(encontrados) < limite and self._lista[i][0].startswith(prefijo):
+                jugador_id = self._lista[i][1]
+                encontrados.append((jugador_id, self._nombres[jugador_id][0]))
+                i += 1
+        return encontrados
+
+    def __len__(self):
+        return len(self._nombres)
@@ -0,0 +1,217 @@
+# Métricas del proceso en formato de texto de Prometheus (GET /metrics):
+# duración de peticiones por ruta, sentencias por etiqueta, espera por
+# conexiones del pool, tiempo en plantillas y JSON, y errores.
+#
+# También hay un perfilador por muestreo que se activa para una sola
+# petición con el encabezado X-Kuatro-Perfil (ver Muestreador).
+import hmac
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Límites superiores de los buckets en segundos
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Perfilador: sin token queda apagado
+PERFIL_TOKEN = os.environ.get('KUATRO_PERFIL_TOKEN', '')
+PERFIL_INTERVALO = int(os.environ.get('KUATRO_PERFIL_INTERVALO_MS', '5')) / 1000
+PERFIL_DIR = os.environ.get('KUATRO_PERFIL_DIR', os.path.join(tempfile.gettempdir(), 'kuatro-perfiles'))
+
+_metricas = []
+INFINITO = 'le="+Inf"'
+
+
+def _etiquetas(nombres, valores, extra=''):
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, etiquetas
+        self._valores = {}
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def sumar(self, *valores, cantidad=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} counter']
+        for llave, valor in valores:
+            lineas.append(f'{self.nombre}{_etiquetas(self.etiquetas, llave)} {_numero(valor)}')
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS):
+        self.nombre, self.ayuda, self.etiquetas, self.buckets = nombre, ayuda, etiquetas, buckets
+        self._series = {}    # etiquetas -> [cuentas por bucket..., suma, total]
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def observar(self, segundos, *valores):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if segundos <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += segundos
+            serie[-1] += 1
+
+    @contextmanager
+    def medir(self, *valores):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, *valores)
+
+    def exponer(self):
+        with self._lock:
+            series = sorted((llave, list(serie)) for llave, serie in self._series.items())
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        for llave, serie in series:
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets, serie):
+                acumulado += cuenta
+                le = f'le="{limite}"'
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, llave, le)} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, llave, INFINITO)} {serie[-1]}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, llave)} {serie[-2]!r}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, llave)} {serie[-1]}')
+        return lineas
+
+
+PETICIONES = Histograma('kuatro_peticion_segundos', 'Duración de las peticiones HTTP', ('ruta', 'metodo'))
+RESPUESTAS = Contador('kuatro_respuestas_total', 'Respuestas HTTP por código', ('ruta', 'metodo', 'codigo'))
+EXCEPCIONES = Contador('kuatro_excepciones_total', 'Excepciones no manejadas por las rutas', ('ruta', 'tipo'))
+SENTENCIAS = Histograma('kuatro_bd_sentencia_segundos', 'Duración de cada sentencia por etiqueta', ('etiqueta',))
+ERRORES_BD = Contador('kuatro_bd_errores_total', 'Sentencias que fallaron por etiqueta', ('etiqueta', 'tipo'))
+CONEXIONES = Histograma('kuatro_bd_conexion_segundos', 'Espera por una conexión del pool', ('pool',))
+ERRORES_CONEXION = Contador('kuatro_bd_conexion_errores_total', 'Conexiones que no se pudieron obtener',
+                            ('pool', 'tipo'))
+FASES = Histograma('kuatro_fase_segundos', 'Tiempo en plantillas y serialización', ('fase',))
+
+
+def exponer(medidores=None):
+    # Texto para /metrics; `medidores` son valores instantáneos {nombre: (ayuda, valor)}
+    lineas = []
+    for metrica in _metricas:
+        lineas.extend(metrica.exponer())
+    for nombre, (ayuda, valor) in (medidores or {}).items():
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} gauge', f'{nombre} {_numero(valor)}']
+    return '\n'.join(lineas) + '\n'
+
+
+#################################################################
+# Cursores que miden cada sentencia con la etiqueta de la operación
+class CursorMedido:
+    def __init__(self, cursor, etiqueta):
+        self._cursor = cursor
+        self._etiqueta = etiqueta
+
+    def _medir(self, metodo, args, kwargs):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args, **kwargs)
+        except Exception as e:
+            ERRORES_BD.sumar(self._etiqueta, type(e).__name__)
+            raise
+        finally:
+            SENTENCIAS.observar(time.perf_counter() - inicio, self._etiqueta)
+
+    def execute(self, *args, **kwargs):
+        return self._medir(self._cursor.execute, args, kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._medir(self._cursor.executemany, args, kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        # arraysize, prefetchrows y demás van al cursor real
+        if nombre.startswith('_'):
+            object.__setattr__(self, nombre, valor)
+        else:
+            setattr(self._cursor, nombre, valor)
+
+
+class CursorMedidoAsync(CursorMedido):
+    async def _medir(self, metodo, args, kwargs):
+        inicio = time.perf_counter()
+        try:
+            return await metodo(*args, **kwargs)
+        except Exception as e:
+            ERRORES_BD.sumar(self._etiqueta, type(e).__name__)
+            raise
+        finally:
+            SENTENCIAS.observar(time.perf_counter() - inicio, self._etiqueta)
+
+
+#################################################################
+# Perfilador por muestreo: un hilo mira cada PERFIL_INTERVALO la pila del
+# hilo que atiende la petición y cuenta pilas iguales. El resultado queda en
+# PERFIL_DIR en formato "folded" (una pila por línea), que leen flamegraph.pl
+# y speedscope.
+def perfil_solicitado(valor):
+    return bool(PERFIL_TOKEN) and bool(valor) and hmac.compare_digest(valor, PERFIL_TOKEN)
+
+
+class Muestreador:
+    def __init__(self, hilo, intervalo=None):
+        self.hilo = hilo
+        self.intervalo = intervalo or PERFIL_INTERVALO
+        self.pilas = Counter()
+        self._alto = threading.Event()
+        self._muestreo = threading.Thread(target=self._muestrear, name='perfil', daemon=True)
+
+    def _muestrear(self):
+        while not self._alto.wait(self.intervalo):
+            marco = sys._current_frames().get(self.hilo)
+            pila = []
+            while marco is not None:
+                codigo = marco.f_code
+                pila.append(f'{os.path.basename(codigo.co_filename)}:{codigo.co_name}')
+                marco = marco.f_back
+            if pila:
+                self.pilas[';'.join(reversed(pila))] += 1
+
+    def iniciar(self):
+        self._muestreo.start()
+        return self
+
+    def detener(self, nombre):
+        # Devuelve (ruta del archivo, muestras)
+        self._alto.set()
+        self._muestreo.join()
+        os.makedirs(PERFIL_DIR, exist_ok=True)
+        ruta = os.path.join(PERFIL_DIR, f'{nombre}-{time.strftime("%Y%m%d-%H%M%S")}-{self.hilo}.folded')
+        with open(ruta, 'w') as archivo:
+            for pila, cuenta in self.pilas.most_common():
+                archivo.write(f'{pila} {cuenta}\n')
+        return ruta, sum(self.pilas.values())
@@ -0,0 +1,167 @@
+# Motor de Conecta 4 con bitboards.
+#
+# Cada jugador tiene un entero de 64 bits. El tablero se recorre por columnas
+# de 7 bits (6 filas + 1 bit centinela arriba), así que el bit de la fila h
+# (0 = abajo) de la columna c es c * 7 + h. El centinela evita que una línea
+# "salte" de una columna a la siguiente al desplazar bits.
+
+FILAS = 6
+COLUMNAS = 7
+ALTO = FILAS + 1
+
+ABAJO = [1 << (c * ALTO) for c in range(COLUMNAS)]
+ARRIBA = [1 << (c * ALTO + FILAS - 1) for c in range(COLUMNAS)]
+COLUMNA = [((1 << FILAS) - 1) << (c * ALTO) for c in range(COLUMNAS)]
+FILA_ABAJO = sum(ABAJO)
+TABLERO_LLENO = sum(COLUMNA)
+
+# Desplazamientos: vertical, horizontal, diagonal /, diagonal \
+DIRECCIONES = (1, ALTO, ALTO + 1, ALTO - 1)
+
+
+class JugadaInvalida(ValueError):
+    pass
+
+
+def hay_cuatro(bits):
+    for d in DIRECCIONES:
+        m = bits & (bits >> d)
+        if m & (m >> (2 * d)):
+            return True
+    return False
+
+
+class Posicion:
+    __slots__ = ('piezas', 'mascara', 'jugadas')
+
+    def __init__(self, piezas=(0, 0), jugadas=None):
+        self.piezas = list(piezas)
+        self.mascara = self.piezas[0] | self.piezas[1]
+        self.jugadas = bin(self.mascara).count('1') if jugadas is None else jugadas
+
+    @property
+    def turno(self):
+        return self.jugadas & 1
+
+    def puede_jugar(self, col):
+        return 0 <= col < COLUMNAS and not self.mascara & ARRIBA[col]
+
+    def jugadas_legales(self):
+        libres = (self.mascara + FILA_ABAJO) & TABLERO_LLENO
+        return [c for c in range(COLUMNAS) if libres & COLUMNA[c]]
+
+    def jugar(self, col):
+        # Coloca la ficha del jugador en turno y devuelve la fila en formato
+        # del template (0 = fila de arriba)
+        if self.terminada:
+            raise JugadaInvalida('La partida ya terminó')
+        if not self.puede_jugar(col):
+            raise JugadaInvalida('Columna llena o fuera del tablero')
+        nueva = (self.mascara + ABAJO[col]) & COLUMNA[col]
+        self.piezas[self.turno] |= nueva
+        self.mascara |= nueva
+        self.jugadas += 1
+        altura = nueva.bit_length() - 1 - col * ALTO
+        return FILAS - 1 - altura
+
+    @property
+    def ganador(self):
+        for jugador in (0, 1):
+            if hay_cuatro(self.piezas[jugador]):
+                return jugador
+        return None
+
+    @property
+    def empate(self):
+        return self.mascara == TABLERO_LLENO and self.ganador is None
+
+    @property
+    def terminada(self):
+        return self.mascara == TABLERO_LLENO or self.ganador is not None
+
+    def jugada_hacia(self, otra):
+        # Columna que lleva de esta posición a `otra` con una sola jugada legal,
+        # o None si `otra` no es una continuación directa
+        nueva = otra.mascara & ~self.mascara
+        if otra.mascara & self.mascara != self.mascara:
+            return None
+        if otra.piezas[0] & self.mascara != self.piezas[0] or otra.piezas[1] & self.mascara != self.piezas[1]:
+            return None
+        if not nueva or nueva & (nueva - 1) or not otra.piezas[self.turno] & nueva:
+            return None
+        col = (nueva.bit_length() - 1) // ALTO
+        if self.terminada or (self.mascara + ABAJO[col]) & COLUMNA[col] != nueva:
+            return None
+        return col
+
+    def copia(self):
+        return Posicion(self.piezas, self.jugadas)
+
+    # Conversión desde/hacia el formato {'tablero': [[...]], 'turno': n}
+    @classmethod
+    def desde_tablero(cls, tablero):
+        piezas = [0, 0]
+        for r, fila in enumerate(tablero):
+            altura = FILAS - 1 - r
+            for c, celda in enumerate(fila):
+                if celda in (0, 1):
+                    piezas[celda] |= 1 << (c * ALTO + altura)
+        return cls(piezas)
+
+    @classmethod
+    def desde_partida(cls, partida):
+        return cls.desde_tablero(partida.get('tablero') or [])
+
+    def a_tablero(self):
+        tablero = []
+        for r in range(FILAS):
+            altura = FILAS - 1 - r
+            fila = []
+            for c in range(COLUMNAS):
+                bit = 1 << (c * ALTO + altura)
+                if self.piezas[0] & bit:
+                    fila.append(0)
+                elif self.piezas[1] & bit:
+                    fila.append(1)
+                else:
+                    fila.append(None)
+            tablero.append(fila)
+        return tablero
+
+    def a_partida(self):
+        return {'tablero': self.a_tablero(), 'turno': self.turno}
+
+
+# Codificación compacta: 42 símbolos ('.', '0', '1') fila por fila empezando
+# arriba a la izquierda, igual que el orden de `tablero` en el template.
+# El turno no se guarda porque es la cantidad de fichas módulo 2.
+VACIO = '.' * (FILAS * COLUMNAS)
+_BITS_CODIGO = [1 << (c * ALTO + FILAS - 1 - r) for r in range(FILAS) for c in range(COLUMNAS)]
+_JSON_CELDA = {'.': 'null', '0': '0', '1': '1'}
+
+
+def es_codigo(valor):
+    return isinstance(valor, str) and len(valor) == FILAS * COLUMNAS and not valor.startswith('{')
+
+
+def codificar(posicion):
+    p0, p1 = posicion.piezas
+    return ''.join('0' if p0 & bit else '1' if p1 & bit else '.' for bit in _BITS_CODIGO)
+
+
+def decodificar(codigo):
+    piezas = [0, 0]
+    for bit, simbolo in zip(_BITS_CODIGO, codigo):
+        if simbolo != '.':
+            piezas[simbolo == '1'] |= bit
+    return Posicion(piezas)
+
+
+def partida_json_desde_codigo(codigo):
+    # Arma el JSON {'tablero': ..., 'turno': ...} del template sin pasar por listas
+    filas = [
+        '[' + ', '.join(_JSON_CELDA[s] for s in codigo[i:i + COLUMNAS]) + ']'
+        for i in range(0, FILAS * COLUMNAS, COLUMNAS)
+    ]
+    turno = (FILAS * COLUMNAS - codigo.count('.')) & 1
+    return '{"tablero": [' + ', '.join(filas) + '], "turno": ' + str(turno) + '}'
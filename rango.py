@@ -0,0 +1,181 @@
+# Rating Elo de los jugadores y el índice que responde "qué lugar ocupo" sin
+# bajar el escalafón completo.
+#
+# El rating (Jugadores.Rating, RATING_INICIAL al registrarse) se actualiza en
+# la misma transacción que registra el resultado de la partida (ver
+# repositorio.registrar_resultado). `flask recalcular-ratings` lo vuelve a
+# calcular desde cero recorriendo Resultados en orden.
+#
+# IndiceRango agrupa los ratings en cubetas de un punto con un árbol de
+# Fenwick encima que cuenta jugadores por cubeta: el lugar de un jugador y el
+# jugador en el lugar k salen en O(log n). Dentro de cada cubeta los
+# jugadores se ordenan por rating exacto y luego por JugadorID.
+import bisect
+import os
+import threading
+import time
+
+import click
+
+from repositorio import obtener_repositorio
+
+RATING_INICIAL = 1500.0
+K_ELO = float(os.environ.get('KUATRO_ELO_K', '32'))
+# Cubetas del índice; los ratings fuera del rango caen en la primera o la última
+RATING_MINIMO, RATING_MAXIMO = 0, 4000
+
+
+def esperado(rating, rival):
+    # Puntaje esperado de `rating` contra `rival` (0 a 1)
+    return 1 / (1 + 10 ** ((rival - rating) / 400))
+
+
+def delta_elo(rating1, rating2, ganador, k=K_ELO):
+    # Cambio del jugador 1 (el 2 cambia lo mismo con signo contrario); ganador 0/1 o None si es empate
+    puntaje = 0.5 if ganador is None else (1.0 if ganador == 0 else 0.0)
+    return k * (puntaje - esperado(rating1, rating2))
+
+
+def deltas_resultado(jugador1, jugador2, rating1, rating2, ganador):
+    # {JugadorID: cambio}; contra sí mismo se anula
+    delta = delta_elo(rating1, rating2, ganador)
+    deltas = {jugador1: delta}
+    deltas[jugador2] = deltas.get(jugador2, 0.0) - delta
+    return deltas
+
+
+def recalcular(historial):
+    # {JugadorID: rating} a partir de (IDJUGADOR, IDRival, Ganador) en orden
+    ratings = {}
+    for jugador1, jugador2, ganador in historial:
+        rating1 = ratings.get(jugador1, RATING_INICIAL)
+        rating2 = ratings.get(jugador2, RATING_INICIAL)
+        for jugador_id, delta in deltas_resultado(jugador1, jugador2, rating1, rating2, ganador).items():
+            ratings[jugador_id] = ratings.get(jugador_id, RATING_INICIAL) + delta
+    return ratings
+
+
+#################################################################
+class IndiceRango:
+    def __init__(self, minimo=RATING_MINIMO, maximo=RATING_MAXIMO):
+        self.minimo = minimo
+        self.cubetas = maximo - minimo + 1
+        self._arbol = [0] * (self.cubetas + 1)     # Fenwick 1-based: jugadores por cubeta
+        self._listas = {}                           # cubeta -> [(-rating, JugadorID)] ordenada
+        self._jugadores = {}                        # JugadorID -> (nombre, rating)
+        self._lock = threading.Lock()
+        self.cargado = None
+
+    def _cubeta(self, rating):
+        return min(max(int(rating) - self.minimo, 0), self.cubetas - 1) + 1
+
+    def _sumar(self, cubeta, cantidad):
+        while cubeta <= self.cubetas:
+            self._arbol[cubeta] += cantidad
+            cubeta += cubeta & -cubeta
+
+    def _hasta(self, cubeta):
+        # Jugadores en las cubetas 1..cubeta
+        total = 0
+        while cubeta > 0:
+            total += self._arbol[cubeta]
+            cubeta -= cubeta & -cubeta
+        return total
+
+    def _buscar(self, posicion):
+        # Menor cubeta con _hasta(cubeta) >= posicion (descenso por el árbol)
+        cubeta, paso = 0, 1 << self.cubetas.bit_length()
+        while paso:
+            siguiente = cubeta + paso
+            if siguiente <= self.cubetas and self._arbol[siguiente] < posicion:
+                cubeta = siguiente
+                posicion -= self._arbol[siguiente]
+            paso >>= 1
+        return cubeta + 1
+
+    def _quitar(self, jugador_id):
+        anterior = self._jugadores.pop(jugador_id, None)
+        if anterior is None:
+            return
+        cubeta = self._cubeta(anterior[1])
+        lista = self._listas[cubeta]
+        lista.pop(bisect.bisect_left(lista, (-anterior[1], jugador_id)))
+        self._sumar(cubeta, -1)
+
+    def _poner(self, jugador_id, nombre, rating):
+        self._quitar(jugador_id)
+        cubeta = self._cubeta(rating)
+        bisect.insort(self._listas.setdefault(cubeta, []), (-rating, jugador_id))
+        self._sumar(cubeta, 1)
+        self._jugadores[jugador_id] = (nombre, rating)
+
+    def reemplazar(self, filas):
+        # filas: (JugadorID, Nombre, Rating); arma el árbol de una vez en O(n log n)
+        listas, jugadores = {}, {}
+        for jugador_id, nombre, rating in filas:
+            rating = float(rating if rating is not None else RATING_INICIAL)
+            jugadores[jugador_id] = (nombre, rating)
+            listas.setdefault(self._cubeta(rating), []).append((-rating, jugador_id))
+        arbol = [0] * (self.cubetas + 1)
+        for cubeta, lista in listas.items():
+            lista.sort()
+            arbol[cubeta] = len(lista)
+        for cubeta in range(1, self.cubetas + 1):
+            padre = cubeta + (cubeta & -cubeta)
+            if padre <= self.cubetas:
+                arbol[padre] += arbol[cubeta]
+        with self._lock:
+            self._arbol, self._listas, self._jugadores = arbol, listas, jugadores
+            self.cargado = time.monotonic()
+
+    def vencido(self, ttl):
+        return self.cargado is None or time.monotonic() - self.cargado >= ttl
+
+    def poner(self, jugador_id, nombre, rating):
+        with self._lock:
+            if self.cargado is not None:
+                self._poner(jugador_id, nombre, float(rating))
+
+    def actualizar(self, ratings):
+        # {JugadorID: rating nuevo} de jugadores que ya están en el índice
+        with self._lock:
+            for jugador_id, rating in ratings.items():
+                if jugador_id in self._jugadores:
+                    self._poner(jugador_id, self._jugadores[jugador_id][0], float(rating))
+
+    def __len__(self):
+        return len(self._jugadores)
+
+    def _lugar(self, jugador_id):
+        nombre, rating = self._jugadores[jugador_id]
+        cubeta = self._cubeta(rating)
+        mayores = len(self._jugadores) - self._hasta(cubeta)
+        return mayores + bisect.bisect_left(self._listas[cubeta], (-rating, jugador_id)) + 1
+
+    def _en_lugar(self, lugar):
+        # Jugador en el lugar 1..n (1 es el de mayor rating)
+        cubeta = self._buscar(len(self._jugadores) - lugar + 1)
+        mayores = len(self._jugadores) - self._hasta(cubeta)
+        jugador_id = self._listas[cubeta][lugar - mayores - 1][1]
+        nombre, rating = self._jugadores[jugador_id]
+        return {'rango': lugar, 'JugadorID': jugador_id, 'Nombre': nombre, 'Rating': round(rating, 1)}
+
+    def rango(self, jugador_id, alrededor=0):
+        # (lugar del jugador, [jugadores de lugar - alrededor a lugar + alrededor]) o None
+        with self._lock:
+            if jugador_id not in self._jugadores:
+                return None
+            lugar = self._lugar(jugador_id)
+            desde, hasta = max(1, lugar - alrededor), min(len(self._jugadores), lugar + alrededor)
+            return self._en_lugar(lugar), [self._en_lugar(i) for i in range(desde, hasta + 1)]
+
+
+#################################################################
+@click.command('recalcular-ratings')
+@click.confirmation_option(prompt='Se reemplazará el rating de todos los jugadores. ¿Continuar?')
+def recalcular_ratings_comando():
+    """Recalcula el rating Elo de todos los jugadores desde la tabla Resultados."""
+    repositorio = obtener_repositorio()
+    ratings = recalcular(repositorio.historial_resultados())
+    repositorio.guardar_ratings(ratings, RATING_INICIAL)
+    click.echo(f'Jugadores con partidas: {len(ratings)}')
@@ -0,0 +1,87 @@
+# Imágenes de Assets/ con nombre por contenido y caché larga.
+#
+# Al arrancar se lee cada archivo una vez y se le calcula una huella
+# (sha256 del contenido). Las plantillas piden la URL con recurso('Logo.png'),
+# que devuelve /Assets/Logo.<huella>.png. Como la URL cambia cuando cambia el
+# archivo, esa respuesta se manda con Cache-Control immutable por un año y el
+# navegador no vuelve a pedirla. La URL sin huella sigue funcionando y se
+# revalida con ETag (304 si no cambió).
+#
+# Los archivos de hasta RECURSOS_MEMORIA bytes quedan en memoria y se
+# responden sin tocar el disco; de esos se guarda también una versión gzip,
+# solo si ahorra al menos un 10% (los PNG casi nunca ganan).
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, request, send_from_directory, url_for
+
+RECURSOS_MEMORIA = int(os.environ.get('KUATRO_RECURSOS_MEMORIA', str(256 * 1024)))
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Recurso:
+    def __init__(self, nombre, contenido):
+        self.nombre = nombre
+        self.huella = hashlib.sha256(contenido).hexdigest()[:12]
+        base, extension = os.path.splitext(nombre)
+        self.nombre_con_huella = f'{base}.{self.huella}{extension}'
+        self.tipo = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+        self.tamano = len(contenido)
+        self.contenido = contenido if len(contenido) <= RECURSOS_MEMORIA else None
+        self.comprimido = None
+        if self.contenido is not None:
+            comprimido = gzip.compress(contenido, compresslevel=9, mtime=0)
+            if len(comprimido) <= len(contenido) * 0.9:
+                self.comprimido = comprimido
+
+
+class Recursos:
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self._por_nombre = {}          # 'Logo.png' -> Recurso
+        self._por_huella = {}          # 'Logo.<huella>.png' -> Recurso
+        self.cargar()
+
+    def cargar(self):
+        por_nombre, por_huella = {}, {}
+        for raiz, _, archivos in os.walk(self.carpeta):
+            for archivo in archivos:
+                ruta = os.path.join(raiz, archivo)
+                nombre = os.path.relpath(ruta, self.carpeta).replace(os.sep, '/')
+                with open(ruta, 'rb') as f:
+                    recurso = Recurso(nombre, f.read())
+                por_nombre[nombre] = recurso
+                por_huella[recurso.nombre_con_huella] = recurso
+        self._por_nombre, self._por_huella = por_nombre, por_huella
+
+    def url(self, nombre):
+        # Para las plantillas: URL con huella, o la de siempre si el archivo no estaba al arrancar
+        recurso = self._por_nombre.get(nombre)
+        return url_for('serve_assets', filename=recurso.nombre_con_huella if recurso else nombre)
+
+    def responder(self, nombre):
+        recurso = self._por_huella.get(nombre)
+        inmutable = recurso is not None
+        if recurso is None:
+            recurso = self._por_nombre.get(nombre)
+        if recurso is None:
+            # Archivo agregado después de arrancar: se sirve del disco como antes
+            respuesta = send_from_directory(self.carpeta, nombre)
+            respuesta.headers['Cache-Control'] = 'no-cache'
+            return respuesta
+
+        if recurso.contenido is None:
+            respuesta = send_from_directory(self.carpeta, recurso.nombre, etag=False)
+        elif recurso.comprimido is not None and 'gzip' in request.accept_encodings:
+            respuesta = Response(recurso.comprimido, mimetype=recurso.tipo)
+            respuesta.headers['Content-Encoding'] = 'gzip'
+        else:
+            respuesta = Response(recurso.contenido, mimetype=recurso.tipo)
+        if recurso.comprimido is not None:
+            respuesta.vary.add('Accept-Encoding')
+        comprimida = respuesta.headers.get('Content-Encoding') == 'gzip'
+        respuesta.set_etag(recurso.huella + ('-gz' if comprimida else ''))
+        respuesta.headers['Cache-Control'] = CACHE_INMUTABLE if inmutable else 'no-cache'
+        return respuesta.make_conditional(request)
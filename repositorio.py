@@ -0,0 +1,258 @@
+# Capa de persistencia. Las rutas de app.py no escriben SQL: llaman a un
+# repositorio que se elige con KUATRO_BACKEND:
+#
+#   oracle   la base Oracle de producción (repositorio_oracle.py, por defecto)
+#   sqlite   un archivo SQLite (KUATRO_SQLITE), para correr sin Oracle
+#   memoria  todo en diccionarios del proceso, para perfilar y hacer pruebas de carga
+#
+# Con KUATRO_ESCRITURA_DIFERIDA=1 el repositorio elegido se envuelve en
+# repositorio_diferido.RepositorioDiferido, que junta las jugadas en lotes.
+#
+# Todos los backends implementan los mismos métodos de Repositorio y lanzan
+# las mismas excepciones, que las rutas traducen a sus respuestas de siempre.
+import os
+import threading
+
+import click
+
+BACKEND = os.environ.get('KUATRO_BACKEND', 'oracle')
+ESCRITURA_DIFERIDA = os.environ.get('KUATRO_ESCRITURA_DIFERIDA', '0') == '1'
+# Nombre del jugador reservado que representa a la computadora. En Oracle lo
+# crea KUATRO.sql; los backends sqlite y memoria lo crean al abrirse.
+JUGADOR_IA = os.environ.get('KUATRO_JUGADOR_IA', 'Computadora')
+
+
+class ErrorRepositorio(Exception):
+    pass
+
+
+class SinConexion(ErrorRepositorio):
+    """No se pudo conectar a la base de datos."""
+
+
+class JugadorDuplicado(ErrorRepositorio):
+    """El nombre o la identificación ya están registrados."""
+
+
+class JugadorNoEncontrado(ErrorRepositorio):
+    pass
+
+
+class PartidaNoEncontrada(ErrorRepositorio):
+    pass
+
+
+class PartidaNoEnProgreso(ErrorRepositorio):
+    pass
+
+
+class TurnoIncorrecto(ErrorRepositorio):
+    def __init__(self, turno):
+        super().__init__('No es el turno de ese jugador')
+        self.turno = turno
+
+
+class PartidaCambio(ErrorRepositorio):
+    """La posición ya no es la que se esperaba (otra jugada llegó antes)."""
+
+
+class Repositorio:
+    # Jugadores
+    def registrar_jugador(self, nombre, identificacion):
+        """Devuelve el JugadorID nuevo; JugadorDuplicado si ya existe."""
+        raise NotImplementedError
+
+    def registrar_victoria(self, ganador, perdedor):
+        raise NotImplementedError
+
+    def registrar_empate(self, jugador1, jugador2):
+        raise NotImplementedError
+
+    def buscar_jugador(self, nombre):
+        """(JugadorID, Rating) del jugador con ese nombre, o None."""
+        raise NotImplementedError
+
+    def escalafon(self):
+        """Filas (Identificacion, Nombre, Puntuacion, Ganadas, Empatadas, Perdidas) ordenadas, sin JUGADOR_IA."""
+        raise NotImplementedError
+
+    # Partidas
+    def crear_partida(self, jugador1, jugador2, tablero):
+        """Devuelve el PartidaID nuevo; JugadorNoEncontrado si falta alguno."""
+        raise NotImplementedError
+
+    def cargar_vista_partida(self, id_partida):
+        """(jugador1, jugador2, codigo, estado, stats1, stats2) o None."""
+        raise NotImplementedError
+
+    def cargar_partida(self, id_partida):
+        """(posicion, estado, jugador1, jugador2); PartidaNoEncontrada si no existe."""
+        raise NotImplementedError
+
+    def jugar(self, id_partida, columna, jugador=None, esperada=None):
+        """Registra la jugada con la partida bloqueada y devuelve (posicion, fila).
+
+        `jugador` (0/1) valida el turno y `esperada` (piezas) que nadie haya
+        jugado desde que se leyó la posición."""
+        raise NotImplementedError
+
+    def guardar_jugadas(self, lote):
+        """Escritura diferida: lote de (id_partida, [(numero, columna), ...], codigo) en una transacción."""
+        raise NotImplementedError
+
+    def sincronizar(self, id_partida, partida):
+        """Endpoints viejos que mandan el tablero completo (ver jugadas.sincronizar_tablero)."""
+        raise NotImplementedError
+
+    def partida_en_progreso(self, jugador1, jugador2):
+        """PartidaID de la última partida en progreso entre ambos, o None."""
+        raise NotImplementedError
+
+    def terminar_partida(self, id_partida):
+        raise NotImplementedError
+
+    def registrar_resultado(self, id_partida, ganador):
+        """Anota el resultado (ganador 0/1, None si es empate) en el registro de resultados,
+        suma a ambos jugadores, mueve su rating y termina la partida, todo en una
+        transacción. Devuelve {JugadorID: rating nuevo}, o None si la partida ya tenía
+        resultado (no se suma dos veces)."""
+        raise NotImplementedError
+
+    def reagregar_estadisticas(self):
+        """Recalcula Puntuacion/Ganadas/Empatadas/Perdidas de todos los jugadores desde
+        el registro de resultados; devuelve cuántos jugadores se actualizaron."""
+        raise NotImplementedError
+
+    def guardar_partidas_terminadas(self, partidas, sumas):
+        """Torneos (ver torneo.py): inserta partidas ya terminadas con sus jugadas y su
+        resultado y suma a los jugadores, todo en una transacción. `partidas` son dicts
+        (idj, idr, tablero, jugadas, ganador) con las jugadas como texto de columnas;
+        `sumas` es {JugadorID: (puntos, ganadas, empatadas, perdidas, cambio de rating)}.
+        Devuelve los PartidaID en el mismo orden."""
+        raise NotImplementedError
+
+    # Rating Elo (ver rango.py)
+    def ratings(self):
+        """Filas (JugadorID, Nombre, Rating) de todos los jugadores."""
+        raise NotImplementedError
+
+    def historial_resultados(self):
+        """(IDJUGADOR, IDRival, Ganador) de Resultados en el orden en que se registraron."""
+        raise NotImplementedError
+
+    def guardar_ratings(self, ratings, inicial):
+        """Reemplaza todos los ratings: los de `ratings` y `inicial` para el resto."""
+        raise NotImplementedError
+
+    # Estadísticas globales (ver analisis.py)
+    def partidas_terminadas(self, arraysize):
+        """Genera (IDJUGADOR, IDRival, código del tablero final, primera columna o None) de
+        las partidas terminadas sin cargarlas todas en memoria."""
+        raise NotImplementedError
+
+    def guardar_estadisticas_globales(self, clave, datos):
+        """Reemplaza el resumen `clave` (texto JSON)."""
+        raise NotImplementedError
+
+    def estadisticas_globales(self, clave):
+        """(texto JSON, fecha de cálculo) del resumen `clave`, o None."""
+        raise NotImplementedError
+
+    # Exportación e importación (ver exportacion.py)
+    def exportar(self, arraysize):
+        """Genera los registros de jugadores, partidas y resultados (dicts con 'tipo') sin
+        cargarlos todos en memoria."""
+        raise NotImplementedError
+
+    def importar_lote(self, tipo, filas, jugadas):
+        """Inserta un lote de filas de `tipo` (y las jugadas [(índice de la partida, fila)]);
+        devuelve [(índice, error)] de las filas que no se pudieron insertar."""
+        raise NotImplementedError
+
+    def ajustar_identidades(self):
+        """Después de importar con IDs explícitos, los IDs nuevos siguen al mayor."""
+
+    def listar_partidas(self, estado, jugador, desde, limite):
+        """Filas (PartidaID, Jugador1, Jugador2, Estado, Fecha texto, FechaCreacion) de la
+        más nueva a la más vieja; `desde` es la llave (FechaCreacion, PartidaID) del cursor."""
+        raise NotImplementedError
+
+    def contar_partidas(self, estado, jugador):
+        raise NotImplementedError
+
+    def listar_jugadas(self, id_partida):
+        raise NotImplementedError
+
+    def novedades(self, id_partida, desde):
+        """(estado, [(numero, columna), ...]) con las jugadas posteriores a `desde`."""
+        raise NotImplementedError
+
+
+def sumas_resultado(jugador1, jugador2, ganador):
+    # {JugadorID: [puntos, ganadas, empatadas, perdidas]}; el mismo jugador en ambos lados suma las dos cosas
+    sumas = {jugador1: [0, 0, 0, 0]}
+    sumas.setdefault(jugador2, [0, 0, 0, 0])
+    for lado, jugador in enumerate((jugador1, jugador2)):
+        if ganador is None:
+            sumas[jugador][2] += 1
+        elif ganador == lado:
+            sumas[jugador][0] += 1
+            sumas[jugador][1] += 1
+        else:
+            sumas[jugador][0] -= 1
+            sumas[jugador][3] += 1
+    return sumas
+
+
+def stats_desde_fila(puntuacion, ganadas, empatadas, perdidas):
+    return {
+        'Puntuacion': puntuacion,
+        'Ganadas': ganadas,
+        'Empatadas': empatadas,
+        'Perdidas': perdidas
+    }
+
+
+_repositorio = None
+_lock = threading.Lock()
+
+
+def crear_repositorio(backend):
+    if backend == 'oracle':
+        from repositorio_oracle import RepositorioOracle
+        return RepositorioOracle()
+    if backend == 'sqlite':
+        from repositorio_sqlite import RepositorioSQLite
+        return RepositorioSQLite()
+    if backend == 'memoria':
+        from repositorio_memoria import RepositorioMemoria
+        return RepositorioMemoria()
+    raise ValueError(f'KUATRO_BACKEND desconocido: {backend}')
+
+
+def obtener_repositorio():
+    global _repositorio
+    if _repositorio is None:
+        with _lock:
+            if _repositorio is None:
+                repositorio = crear_repositorio(BACKEND)
+                if ESCRITURA_DIFERIDA:
+                    from repositorio_diferido import RepositorioDiferido
+                    repositorio = RepositorioDiferido(repositorio)
+                _repositorio = repositorio
+    return _repositorio
+
+
+def usar_repositorio(repositorio):
+    # Reemplaza el repositorio del proceso (benchmarks, herramientas)
+    global _repositorio
+    with _lock:
+        _repositorio = repositorio
+
+
+@click.command('reagregar-estadisticas')
+@click.confirmation_option(prompt='Se reemplazarán las estadísticas de todos los jugadores. ¿Continuar?')
+def reagregar_estadisticas_comando():
+    """Recalcula las estadísticas de Jugadores desde la tabla Resultados."""
+    actualizados = obtener_repositorio().reagregar_estadisticas()
+    click.echo(f'Jugadores actualizados: {actualizados}')
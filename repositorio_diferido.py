@@ -0,0 +1,314 @@
+# Escritura diferida de jugadas (KUATRO_ESCRITURA_DIFERIDA=1).
+#
+# Envuelve a cualquier repositorio: las partidas en progreso que recibieron
+# jugadas quedan en memoria y sus jugadas nuevas se acumulan. Un hilo las
+# escribe todas juntas (guardar_jugadas: un executemany y un commit) cada
+# DIFERIDA_INTERVALO o apenas se juntan DIFERIDA_LOTE jugadas. Cuando una
+# partida termina (cuatro en línea, empate o terminar_partida) se escribe en
+# el momento, antes de responder, así que las partidas terminadas siempre
+# están completas en la base: si esa escritura falla la ruta responde con
+# error y las jugadas quedan pendientes (las de una partida terminada no se
+# descartan nunca). Al salir el proceso se vacía lo pendiente.
+#
+# El estado vive en el proceso: sirve con un solo proceso por partida (un
+# worker, o sesiones fijas). Las lecturas de este proceso ven las jugadas
+# pendientes; otros procesos las ven al escribirse el lote.
+import atexit
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from metricas import Contador
+from motor import Posicion, codificar
+from repositorio import PartidaNoEnProgreso, TurnoIncorrecto, PartidaCambio
+
+DIFERIDA_INTERVALO = int(os.environ.get('KUATRO_DIFERIDA_INTERVALO_MS', '500')) / 1000
+DIFERIDA_LOTE = int(os.environ.get('KUATRO_DIFERIDA_LOTE', '500'))
+# Segundos sin jugadas tras los cuales una partida sale de memoria
+DIFERIDA_INACTIVA = int(os.environ.get('KUATRO_DIFERIDA_INACTIVA', '300'))
+# Intentos fallidos de escribir una partida en progreso antes de descartar sus jugadas
+DIFERIDA_REINTENTOS = 3
+
+LOTES = Contador('kuatro_diferida_lotes_total', 'Lotes de jugadas escritos por la escritura diferida', ('motivo',))
+JUGADAS_ESCRITAS = Contador('kuatro_diferida_jugadas_total', 'Jugadas escritas por la escritura diferida')
+DESCARTADAS = Contador('kuatro_diferida_descartadas_total', 'Jugadas descartadas tras fallar su escritura')
+
+log = logging.getLogger(__name__)
+
+
+class PartidaEnMemoria:
+    def __init__(self, posicion, estado, jugador1, jugador2):
+        self.posicion = posicion
+        self.estado = estado
+        self.jugadores = (jugador1, jugador2)
+        self.pendientes = []      # [(numero, columna)] aún no escritas
+        self.fallos = 0
+        self.uso = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class RepositorioDiferido:
+    def __init__(self, repositorio, intervalo=DIFERIDA_INTERVALO, lote=DIFERIDA_LOTE):
+        self.repositorio = repositorio
+        self.intervalo = intervalo
+        self.lote = lote
+        self._partidas = {}
+        self._lock = threading.Lock()
+        # Un solo vaciado a la vez: el de fin de partida espera al lote en curso
+        self._vaciando = threading.Lock()
+        self._aviso = threading.Event()
+        self._pendientes = 0
+        self._cerrado = False
+        self._hilo = threading.Thread(target=self._escribir_periodicamente, name='escritura-diferida', daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+        _terminar_con_sigterm()
+
+    def __getattr__(self, nombre):
+        # Jugadores, listados y demás van directo al repositorio de abajo
+        return getattr(self.repositorio, nombre)
+
+    #################################################################
+    # Estado en memoria
+    def _partida(self, id_partida):
+        # `uso` se marca con _lock tomado para que _olvidar_inactivas no la saque entre medio
+        id_partida = int(id_partida)
+        with self._lock:
+            partida = self._partidas.get(id_partida)
+            if partida is not None:
+                partida.uso = time.monotonic()
+                return partida
+        posicion, estado, jugador1, jugador2 = self.repositorio.cargar_partida(id_partida)
+        if estado != 'En progreso':
+            raise PartidaNoEnProgreso('La partida no está en progreso')
+        with self._lock:
+            partida = self._partidas.setdefault(id_partida, PartidaEnMemoria(posicion, estado, jugador1, jugador2))
+            partida.uso = time.monotonic()
+        return partida
+
+    def _vigente(self, id_partida, partida):
+        # Con partida.lock tomado: sigue siendo la que está en memoria (no se olvidó ni soltó)
+        with self._lock:
+            return self._partidas.get(int(id_partida)) is partida
+
+    def _en_memoria(self, id_partida):
+        try:
+            with self._lock:
+                return self._partidas.get(int(id_partida))
+        except (TypeError, ValueError):
+            return None
+
+    def _soltar(self, id_partida):
+        with self._lock:
+            self._partidas.pop(int(id_partida), None)
+
+    #################################################################
+    # Escrituras
+    def jugar(self, id_partida, columna, jugador=None, esperada=None):
+        while True:
+            partida = self._partida(id_partida)
+            with partida.lock:
+                if not self._vigente(id_partida, partida):
+                    # Se olvidó mientras se esperaba el candado: se vuelve a cargar
+                    continue
+                if partida.estado != 'En progreso':
+                    raise PartidaNoEnProgreso('La partida no está en progreso')
+                posicion = partida.posicion
+                if esperada is not None and posicion.piezas != list(esperada):
+                    raise PartidaCambio('La partida cambió durante la búsqueda')
+                if jugador is not None and str(jugador) != str(posicion.turno):
+                    raise TurnoIncorrecto(posicion.turno)
+                nueva = posicion.copia()
+                fila = nueva.jugar(columna)
+                partida.posicion = nueva
+                partida.pendientes.append((nueva.jugadas, columna))
+                terminada = nueva.terminada
+            break
+        if terminada:
+            # Partida terminada: se escribe ya para que quede durable
+            self.vaciar(id_partida)
+        else:
+            self._anotar(1)
+        return nueva.copia(), fila
+
+    def sincronizar(self, id_partida, partida):
+        actual = self._partida(id_partida)
+        nueva = Posicion.desde_partida(partida or {})
+        with actual.lock:
+            if nueva.piezas == actual.posicion.piezas:
+                return
+            columna = actual.posicion.jugada_hacia(nueva)
+        if columna is not None:
+            self.jugar(id_partida, columna)
+            return
+        # El tablero no continúa la partida: se escribe lo pendiente y el repositorio reinicia el historial
+        self.vaciar(id_partida)
+        self._soltar(id_partida)
+        self.repositorio.sincronizar(id_partida, partida)
+
+    def terminar_partida(self, id_partida):
+        if self._en_memoria(id_partida) is not None:
+            self.vaciar(id_partida)
+            self._soltar(id_partida)
+        self.repositorio.terminar_partida(id_partida)
+
+    def registrar_resultado(self, id_partida, ganador):
+        if self._en_memoria(id_partida) is not None:
+            self.vaciar(id_partida)
+            self._soltar(id_partida)
+        return self.repositorio.registrar_resultado(id_partida, ganador)
+
+    def exportar(self, arraysize):
+        # Lo pendiente se escribe antes para que la exportación lo incluya
+        self.vaciar()
+        return self.repositorio.exportar(arraysize)
+
+    def _anotar(self, cantidad):
+        with self._lock:
+            self._pendientes += cantidad
+            lleno = self._pendientes >= self.lote
+        if lleno:
+            self._aviso.set()
+
+    #################################################################
+    # Lecturas: lo escrito en la base más lo pendiente en memoria
+    def cargar_partida(self, id_partida):
+        partida = self._en_memoria(id_partida)
+        if partida is None:
+            return self.repositorio.cargar_partida(id_partida)
+        with partida.lock:
+            return (partida.posicion.copia(), partida.estado) + partida.jugadores
+
+    def cargar_vista_partida(self, id_partida):
+        partida = self._en_memoria(id_partida)
+        vista = self.repositorio.cargar_vista_partida(id_partida)
+        if partida is None or vista is None:
+            return vista
+        with partida.lock:
+            codigo = codificar(partida.posicion)
+        return vista[:2] + (codigo,) + vista[3:]
+
+    def _pendientes_de(self, id_partida):
+        # Se copian antes de leer la base: si el lote se escribe entre medio, la base ya las trae
+        partida = self._en_memoria(id_partida)
+        if partida is None:
+            return []
+        with partida.lock:
+            return list(partida.pendientes)
+
+    def novedades(self, id_partida, desde):
+        pendientes = self._pendientes_de(id_partida)
+        estado, jugadas = self.repositorio.novedades(id_partida, desde)
+        todas = dict(jugadas)
+        todas.update((numero, columna) for numero, columna in pendientes if numero > desde)
+        return estado, sorted(todas.items())
+
+    def listar_jugadas(self, id_partida):
+        pendientes = self._pendientes_de(id_partida)
+        jugadas = self.repositorio.listar_jugadas(id_partida)
+        return jugadas + [columna for numero, columna in pendientes if numero > len(jugadas)]
+
+    #################################################################
+    # Vaciado
+    def _tomar(self, ids):
+        # Saca las jugadas pendientes de las partidas indicadas (todas si ids es None)
+        lote = []
+        with self._lock:
+            partidas = [(i, self._partidas[i]) for i in (ids if ids is not None else list(self._partidas))
+                        if i in self._partidas]
+        for id_partida, partida in partidas:
+            with partida.lock:
+                if partida.pendientes:
+                    lote.append((id_partida, partida.pendientes, codificar(partida.posicion)))
+                    partida.pendientes = []
+        with self._lock:
+            self._pendientes -= sum(len(pendientes) for _, pendientes, _ in lote)
+        return lote
+
+    def _devolver(self, id_partida, pendientes, descartable=True):
+        partida = self._en_memoria(id_partida)
+        if partida is None:
+            return
+        with partida.lock:
+            partida.fallos += 1
+            # Las jugadas de una partida terminada se reintentan hasta que se escriban
+            if descartable and partida.fallos >= DIFERIDA_REINTENTOS and not partida.posicion.terminada:
+                log.error('Escritura diferida: se descartan %d jugadas de la partida %s', len(pendientes), id_partida)
+                DESCARTADAS.sumar(cantidad=len(pendientes))
+                partida.pendientes = []
+                descartar = True
+            else:
+                partida.pendientes = pendientes + partida.pendientes
+                descartar = False
+        if descartar:
+            self._soltar(id_partida)
+        else:
+            self._anotar(len(pendientes))
+
+    def _escribir(self, lote, motivo):
+        try:
+            self.repositorio.guardar_jugadas(lote)
+        except Exception:
+            if len(lote) == 1:
+                log.exception('Error al escribir jugadas de la partida %s', lote[0][0])
+                self._devolver(lote[0][0], lote[0][1], descartable=motivo != 'fin')
+                if motivo == 'fin':
+                    # Fin de partida: el error llega a la ruta en vez de responder como si se hubiera guardado
+                    raise
+                return
+            # Se separa por partida para que una fila con problemas no frene a las demás
+            for entrada in lote:
+                self._escribir([entrada], motivo)
+            return
+        LOTES.sumar(motivo)
+        JUGADAS_ESCRITAS.sumar(cantidad=sum(len(pendientes) for _, pendientes, _ in lote))
+        for id_partida, _, _ in lote:
+            partida = self._en_memoria(id_partida)
+            if partida is not None:
+                partida.fallos = 0
+
+    def vaciar(self, id_partida=None):
+        # Escribe lo pendiente de una partida (o de todas) y espera el commit
+        with self._vaciando:
+            lote = self._tomar(None if id_partida is None else [int(id_partida)])
+            if lote:
+                self._escribir(lote, 'todas' if id_partida is None else 'fin')
+
+    def _escribir_periodicamente(self):
+        while not self._cerrado:
+            self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+            with self._vaciando:
+                lote = self._tomar(None)
+                if lote:
+                    self._escribir(lote, 'periodo')
+            self._olvidar_inactivas()
+
+    def _olvidar_inactivas(self):
+        limite = time.monotonic() - DIFERIDA_INACTIVA
+        with self._lock:
+            for id_partida, partida in list(self._partidas.items()):
+                # Sin esperar: si alguien tiene el candado de la partida, la está usando
+                if partida.uso >= limite or not partida.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not partida.pendientes:
+                        del self._partidas[id_partida]
+                finally:
+                    partida.lock.release()
+
+    def cerrar(self):
+        self._cerrado = True
+        self._aviso.set()
+        self.vaciar()
+
+
+def _terminar_con_sigterm():
+    # Con SIGTERM el intérprete muere sin correr atexit; así sale normal y vacía lo pendiente
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
@@ -0,0 +1,367 @@
+# Repositorio en memoria del proceso. No persiste nada: sirve para perfilar
+# las rutas sin base de datos y para las pruebas de carga.
+import itertools
+import threading
+from datetime import datetime
+
+from jugadas import posicion_desde_snapshot
+from motor import Posicion, codificar, decodificar, VACIO
+from rango import RATING_INICIAL, deltas_resultado
+from repositorio import (Repositorio, JUGADOR_IA, JugadorDuplicado, JugadorNoEncontrado, PartidaNoEncontrada,
+                         PartidaNoEnProgreso, TurnoIncorrecto, PartidaCambio, stats_desde_fila, sumas_resultado)
+
+
+class RepositorioMemoria(Repositorio):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids_jugador = itertools.count(1)
+        self._ids_partida = itertools.count(1)
+        self.jugadores = {}       # JugadorID -> dict con las columnas de Jugadores
+        self.por_nombre = {}      # Nombre -> JugadorID
+        self._claves = set()      # nombres en minúscula e identificaciones, para rechazar duplicados
+        self.partidas = {}        # PartidaID -> dict (jugadores, Estado, FechaCreacion, posicion)
+        self.jugadas = {}         # PartidaID -> [columna, ...]
+        self.resultados = {}      # PartidaID -> (IDJUGADOR, IDRival, Ganador)
+        self.estadisticas = {}    # Clave -> (texto JSON, fecha)
+        # Jugador reservado de la computadora, como el INSERT de KUATRO.sql
+        self.registrar_jugador(JUGADOR_IA, 0)
+
+    def _jugador(self, nombre):
+        jugador_id = self.por_nombre.get(nombre)
+        return self.jugadores[jugador_id] if jugador_id is not None else None
+
+    def _partida(self, id_partida):
+        try:
+            return self.partidas[int(id_partida)]
+        except (KeyError, TypeError, ValueError):
+            raise PartidaNoEncontrada('Partida no encontrada')
+
+    # Jugadores
+    def registrar_jugador(self, nombre, identificacion):
+        with self._lock:
+            claves = {('nombre', nombre.lower()), ('identificacion', str(identificacion))}
+            if claves & self._claves:
+                raise JugadorDuplicado('El nombre o identificación ya existen')
+            self._claves |= claves
+            jugador_id = next(self._ids_jugador)
+            self.jugadores[jugador_id] = {
+                'Identificacion': identificacion, 'Nombre': nombre,
+                'Puntuacion': 0, 'Ganadas': 0, 'Empatadas': 0, 'Perdidas': 0, 'Rating': RATING_INICIAL,
+            }
+            self.por_nombre[nombre] = jugador_id
+            return jugador_id
+
+    def _sumar(self, nombre, **cambios):
+        jugador = self._jugador(nombre)
+        if jugador is not None:
+            for campo, valor in cambios.items():
+                jugador[campo] += valor
+
+    def registrar_victoria(self, ganador, perdedor):
+        with self._lock:
+            self._sumar(ganador, Puntuacion=1, Ganadas=1)
+            self._sumar(perdedor, Puntuacion=-1, Perdidas=1)
+
+    def registrar_empate(self, jugador1, jugador2):
+        with self._lock:
+            self._sumar(jugador1, Empatadas=1)
+            self._sumar(jugador2, Empatadas=1)
+
+    def buscar_jugador(self, nombre):
+        with self._lock:
+            jugador_id = self.por_nombre.get(nombre)
+            return (jugador_id, self.jugadores[jugador_id]['Rating']) if jugador_id is not None else None
+
+    def escalafon(self):
+        with self._lock:
+            filas = [
+                (j['Identificacion'], j['Nombre'], j['Puntuacion'], j['Ganadas'], j['Empatadas'], j['Perdidas'])
+                for j in self.jugadores.values() if j['Nombre'] != JUGADOR_IA
+            ]
+        filas.sort(key=lambda fila: (-fila[2], fila[1]))
+        return filas
+
+    # Partidas
+    def crear_partida(self, jugador1, jugador2, tablero):
+        with self._lock:
+            id_jugador, id_rival = self.por_nombre.get(jugador1), self.por_nombre.get(jugador2)
+            if id_jugador is None or id_rival is None:
+                raise JugadorNoEncontrado('Uno o ambos jugadores no existen')
+            partida_id = next(self._ids_partida)
+            self.partidas[partida_id] = {
+                'IDJUGADOR': id_jugador,
+                'IDRival': id_rival,
+                'Estado': 'En progreso',
+                'FechaCreacion': datetime.now(),
+                'posicion': posicion_desde_snapshot(tablero),
+            }
+            self.jugadas[partida_id] = []
+            return partida_id
+
+    def cargar_vista_partida(self, id_partida):
+        with self._lock:
+            try:
+                partida = self._partida(id_partida)
+            except PartidaNoEncontrada:
+                return None
+            j1, j2 = self.jugadores[partida['IDJUGADOR']], self.jugadores[partida['IDRival']]
+            return (
+                j1['Nombre'], j2['Nombre'], codificar(partida['posicion']), partida['Estado'],
+                stats_desde_fila(j1['Puntuacion'], j1['Ganadas'], j1['Empatadas'], j1['Perdidas']),
+                stats_desde_fila(j2['Puntuacion'], j2['Ganadas'], j2['Empatadas'], j2['Perdidas']),
+            )
+
+    def cargar_partida(self, id_partida):
+        with self._lock:
+            partida = self._partida(id_partida)
+            return (partida['posicion'].copia(), partida['Estado'],
+                    self.jugadores[partida['IDJUGADOR']]['Nombre'], self.jugadores[partida['IDRival']]['Nombre'])
+
+    def _en_progreso(self, id_partida):
+        partida = self._partida(id_partida)
+        if partida['Estado'] != 'En progreso':
+            raise PartidaNoEnProgreso('La partida no está en progreso')
+        return partida
+
+    def jugar(self, id_partida, columna, jugador=None, esperada=None):
+        with self._lock:
+            partida = self._en_progreso(id_partida)
+            posicion = partida['posicion']
+            if esperada is not None and posicion.piezas != list(esperada):
+                raise PartidaCambio('La partida cambió durante la búsqueda')
+            if jugador is not None and str(jugador) != str(posicion.turno):
+                raise TurnoIncorrecto(posicion.turno)
+            # Se juega sobre una copia para no dejar la partida a medias si la jugada es inválida
+            nueva = posicion.copia()
+            fila = nueva.jugar(columna)
+            partida['posicion'] = nueva
+            self.jugadas[int(id_partida)].append(columna)
+            return nueva.copia(), fila
+
+    def sincronizar(self, id_partida, partida):
+        with self._lock:
+            datos = self._en_progreso(id_partida)
+            actual = datos['posicion']
+            nueva = Posicion.desde_partida(partida or {})
+            if nueva.piezas == actual.piezas:
+                return
+            columna = actual.jugada_hacia(nueva)
+            if columna is not None:
+                self.jugar(id_partida, columna)
+                return
+            # El tablero no continúa la partida: el historial empieza de nuevo
+            datos['posicion'] = nueva
+            self.jugadas[int(id_partida)] = []
+
+    def guardar_jugadas(self, lote):
+        with self._lock:
+            for id_partida, pendientes, codigo in lote:
+                self._partida(id_partida)['posicion'] = decodificar(codigo)
+                self.jugadas[int(id_partida)].extend(columna for _, columna in pendientes)
+
+    def partida_en_progreso(self, jugador1, jugador2):
+        with self._lock:
+            ids = {self.por_nombre.get(jugador1), self.por_nombre.get(jugador2)}
+            if None in ids:
+                return None
+            candidatas = [
+                (p['FechaCreacion'], partida_id) for partida_id, p in self.partidas.items()
+                if p['Estado'] == 'En progreso' and {p['IDJUGADOR'], p['IDRival']} == ids
+            ]
+            return max(candidatas)[1] if candidatas else None
+
+    def terminar_partida(self, id_partida):
+        with self._lock:
+            try:
+                self._partida(id_partida)['Estado'] = 'Terminada'
+            except PartidaNoEncontrada:
+                pass
+
+    def _sumar_resultado(self, jugador1, jugador2, ganador):
+        for jugador_id, (puntos, ganadas, empatadas, perdidas) in sumas_resultado(jugador1, jugador2, ganador).items():
+            jugador = self.jugadores[jugador_id]
+            jugador['Puntuacion'] += puntos
+            jugador['Ganadas'] += ganadas
+            jugador['Empatadas'] += empatadas
+            jugador['Perdidas'] += perdidas
+
+    def registrar_resultado(self, id_partida, ganador):
+        with self._lock:
+            partida = self._partida(id_partida)
+            if int(id_partida) in self.resultados:
+                return None
+            jugador1, jugador2 = partida['IDJUGADOR'], partida['IDRival']
+            self.resultados[int(id_partida)] = (jugador1, jugador2, ganador)
+            self._sumar_resultado(jugador1, jugador2, ganador)
+            deltas = deltas_resultado(jugador1, jugador2, self.jugadores[jugador1]['Rating'],
+                                      self.jugadores[jugador2]['Rating'], ganador)
+            for jugador_id, delta in deltas.items():
+                self.jugadores[jugador_id]['Rating'] += delta
+            partida['Estado'] = 'Terminada'
+            return {jugador_id: self.jugadores[jugador_id]['Rating'] for jugador_id in deltas}
+
+    def ratings(self):
+        with self._lock:
+            return [(jugador_id, j['Nombre'], j['Rating']) for jugador_id, j in self.jugadores.items()]
+
+    def historial_resultados(self):
+        # Los resultados se guardan en el orden en que se registraron
+        with self._lock:
+            return list(self.resultados.values())
+
+    def guardar_ratings(self, ratings, inicial):
+        with self._lock:
+            for jugador_id, jugador in self.jugadores.items():
+                jugador['Rating'] = ratings.get(jugador_id, inicial)
+
+    def guardar_partidas_terminadas(self, partidas, sumas):
+        with self._lock:
+            ids = []
+            for partida in partidas:
+                partida_id = next(self._ids_partida)
+                self.partidas[partida_id] = {
+                    'IDJUGADOR': partida['idj'], 'IDRival': partida['idr'], 'Estado': 'Terminada',
+                    'FechaCreacion': datetime.now(), 'posicion': decodificar(partida['tablero']),
+                }
+                self.jugadas[partida_id] = [int(columna) for columna in partida['jugadas']]
+                self.resultados[partida_id] = (partida['idj'], partida['idr'], partida['ganador'])
+                ids.append(partida_id)
+            for jugador_id, (puntos, ganadas, empatadas, perdidas, cambio) in sumas.items():
+                jugador = self.jugadores[jugador_id]
+                jugador['Puntuacion'] += puntos
+                jugador['Ganadas'] += ganadas
+                jugador['Empatadas'] += empatadas
+                jugador['Perdidas'] += perdidas
+                jugador['Rating'] += cambio
+            return ids
+
+    def reagregar_estadisticas(self):
+        with self._lock:
+            for jugador in self.jugadores.values():
+                jugador.update(Puntuacion=0, Ganadas=0, Empatadas=0, Perdidas=0)
+            for jugador1, jugador2, ganador in self.resultados.values():
+                self._sumar_resultado(jugador1, jugador2, ganador)
+            return len(self.jugadores)
+
+    def partidas_terminadas(self, arraysize):
+        partidas = []
+        with self._lock:
+            for partida_id, p in self.partidas.items():
+                if p['Estado'] != 'Terminada':
+                    continue
+                # La primera columna solo se conoce si la partida empezó con el tablero vacío
+                jugadas = self.jugadas[partida_id]
+                primera = jugadas[0] if jugadas and len(jugadas) == p['posicion'].jugadas else None
+                partidas.append((p['IDJUGADOR'], p['IDRival'], codificar(p['posicion']), primera))
+        yield from partidas
+
+    def guardar_estadisticas_globales(self, clave, datos):
+        with self._lock:
+            self.estadisticas[clave] = (datos, datetime.now())
+
+    def estadisticas_globales(self, clave):
+        with self._lock:
+            return self.estadisticas.get(clave)
+
+    def exportar(self, arraysize):
+        with self._lock:
+            jugadores = sorted(self.jugadores.items())
+            partidas = [(partida_id, dict(p), list(self.jugadas[partida_id]))
+                        for partida_id, p in sorted(self.partidas.items())]
+            resultados = sorted(self.resultados.items())
+        for jugador_id, j in jugadores:
+            yield {'tipo': 'jugador', 'JugadorID': jugador_id, 'Nombre': j['Nombre'],
+                   'Identificacion': j['Identificacion'], 'Puntuacion': j['Puntuacion'], 'Ganadas': j['Ganadas'],
+                   'Empatadas': j['Empatadas'], 'Perdidas': j['Perdidas'], 'Rating': j['Rating']}
+        for partida_id, p, jugadas in partidas:
+            yield {'tipo': 'partida', 'PartidaID': partida_id, 'IDJUGADOR': p['IDJUGADOR'], 'IDRival': p['IDRival'],
+                   'Estado': p['Estado'], 'FechaCreacion': p['FechaCreacion'], 'Tablero': codificar(p['posicion']),
+                   'Jugadas': ''.join(str(columna) for columna in jugadas)}
+        for partida_id, (jugador1, jugador2, ganador) in resultados:
+            yield {'tipo': 'resultado', 'PartidaID': partida_id, 'IDJUGADOR': jugador1, 'IDRival': jugador2,
+                   'Ganador': ganador, 'FechaRegistro': None}
+
+    def _importar(self, tipo, fila):
+        if tipo == 'jugador':
+            claves = {('nombre', fila['nombre'].lower()), ('identificacion', str(fila['identificacion']))}
+            if fila['jid'] in self.jugadores or claves & self._claves:
+                raise JugadorDuplicado('El jugador ya existe')
+            self._claves |= claves
+            self.jugadores[fila['jid']] = {
+                'Identificacion': fila['identificacion'], 'Nombre': fila['nombre'], 'Puntuacion': fila['puntuacion'],
+                'Ganadas': fila['ganadas'], 'Empatadas': fila['empatadas'], 'Perdidas': fila['perdidas'],
+                'Rating': fila['rating'],
+            }
+            self.por_nombre[fila['nombre']] = fila['jid']
+            return
+        if fila['idj'] not in self.jugadores or fila['idr'] not in self.jugadores:
+            raise JugadorNoEncontrado('Uno o ambos jugadores no existen')
+        if tipo == 'partida':
+            if fila['pid'] in self.partidas:
+                raise ValueError('La partida ya existe')
+            self.partidas[fila['pid']] = {
+                'IDJUGADOR': fila['idj'], 'IDRival': fila['idr'], 'Estado': fila['estado'],
+                'FechaCreacion': fila['fecha'] or datetime.now(),
+                'posicion': posicion_desde_snapshot(fila['tablero'] or VACIO),
+            }
+            self.jugadas[fila['pid']] = []
+            return
+        if fila['pid'] not in self.partidas or fila['pid'] in self.resultados:
+            raise ValueError('Partida inexistente o con resultado')
+        self.resultados[fila['pid']] = (fila['idj'], fila['idr'], fila['ganador'])
+
+    def importar_lote(self, tipo, filas, jugadas):
+        errores = {}
+        with self._lock:
+            for i, fila in enumerate(filas):
+                try:
+                    self._importar(tipo, fila)
+                except (ValueError, JugadorDuplicado, JugadorNoEncontrado) as e:
+                    errores[i] = str(e)
+            for i, jugada in jugadas:
+                if i not in errores:
+                    self.jugadas[jugada['pid']].append(jugada['col'])
+        return list(errores.items())
+
+    def ajustar_identidades(self):
+        with self._lock:
+            self._ids_jugador = itertools.count(max(self.jugadores, default=0) + 1)
+            self._ids_partida = itertools.count(max(self.partidas, default=0) + 1)
+
+    def _filtradas(self, estado, jugador):
+        jugador_id = self.por_nombre.get(jugador) if jugador else None
+        for partida_id, p in self.partidas.items():
+            if estado and p['Estado'] != estado:
+                continue
+            if jugador and jugador_id not in (p['IDJUGADOR'], p['IDRival']):
+                continue
+            yield partida_id, p
+
+    def listar_partidas(self, estado, jugador, desde, limite):
+        with self._lock:
+            filas = [
+                (partida_id, self.jugadores[p['IDJUGADOR']]['Nombre'], self.jugadores[p['IDRival']]['Nombre'],
+                 p['Estado'], p['FechaCreacion'].strftime('%Y-%m-%d %H:%M:%S'), p['FechaCreacion'])
+                for partida_id, p in self._filtradas(estado, jugador)
+                if not desde or (p['FechaCreacion'], partida_id) < tuple(desde)
+            ]
+        filas.sort(key=lambda fila: (fila[5], fila[0]), reverse=True)
+        return filas[:limite]
+
+    def contar_partidas(self, estado, jugador):
+        with self._lock:
+            return sum(1 for _ in self._filtradas(estado, jugador))
+
+    def listar_jugadas(self, id_partida):
+        with self._lock:
+            return list(self.jugadas.get(int(id_partida), []))
+
+    def novedades(self, id_partida, desde):
+        with self._lock:
+            partida = self._partida(id_partida)
+            jugadas = self.jugadas[int(id_partida)]
+            # Números como en la tabla Jugadas: fichas en el tablero después de la jugada
+            base = partida['posicion'].jugadas - len(jugadas)
+            return partida['Estado'], [
+                (base + i, columna) for i, columna in enumerate(jugadas, 1) if base + i > desde
+            ]
@@ -0,0 +1,582 @@
+# Repositorio sobre Oracle (pool de db.py). Son las mismas sentencias que
+# antes estaban dentro de cada ruta de app.py.
+from contextlib import asynccontextmanager, contextmanager
+
+import oracledb
+
+from db import get_db_connection, get_db_connection_async
+from jugadas import (cargar_posicion, registrar_jugada, sincronizar_tablero, listar_jugadas, posicion_desde_snapshot,
+                     codigo_con_pendientes, cargar_posicion_async, registrar_jugada_async, sincronizar_tablero_async,
+                     SQL_INSERTAR_JUGADA, SQL_GUARDAR_SNAPSHOT, SQL_PENDIENTES)
+from jugadores import resolver_ids, recordar_jugador
+from metricas import CursorMedido, CursorMedidoAsync, SENTENCIAS
+from rango import K_ELO
+from repositorio import (Repositorio, JUGADOR_IA, SinConexion, JugadorDuplicado, JugadorNoEncontrado, PartidaNoEncontrada,
+                         PartidaNoEnProgreso, TurnoIncorrecto, PartidaCambio, stats_desde_fila)
+
+# El jugador reservado de la computadora no entra al escalafón (parámetro :ia)
+SQL_ESCALAFON = """
+    SELECT Identificacion, Nombre, Puntuacion, Ganadas, Empatadas, Perdidas
+    FROM Jugadores
+    WHERE Nombre <> :ia
+    ORDER BY Puntuacion DESC, Nombre ASC
+"""
+
+# FOR UPDATE serializa jugadas simultáneas sobre la misma partida
+SQL_BLOQUEAR_PARTIDA = """
+    SELECT Tablero, Partida, Estado FROM Partidas WHERE PartidaID = :pid FOR UPDATE
+"""
+
+CONDICION_CURSOR = '(p.FechaCreacion < :fecha OR (p.FechaCreacion = :fecha AND p.PartidaID < :pid))'
+
+
+def sql_listar_partidas(where):
+    return f'''
+        SELECT p.PartidaID, j1.Nombre, j2.Nombre, p.Estado, TO_CHAR(p.FechaCreacion, 'YYYY-MM-DD HH24:MI:SS'),
+               p.FechaCreacion
+        FROM Partidas p
+        JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
+        JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
+        {where}
+        ORDER BY p.FechaCreacion DESC, p.PartidaID DESC
+        FETCH FIRST :limite ROWS ONLY
+    '''
+
+
+def _snapshot_bloqueado(row):
+    # Fila de SQL_BLOQUEAR_PARTIDA -> foto del tablero, si la partida admite jugadas
+    if not row:
+        raise PartidaNoEncontrada('Partida no encontrada')
+    if row[2] != 'En progreso':
+        raise PartidaNoEnProgreso('La partida no está en progreso')
+    return row[0] or row[1]
+
+
+def _validar_jugada(posicion, jugador, esperada):
+    if esperada is not None and posicion.piezas != list(esperada):
+        raise PartidaCambio('La partida cambió durante la búsqueda')
+    if jugador is not None and str(jugador) != str(posicion.turno):
+        raise TurnoIncorrecto(posicion.turno)
+
+
+def condiciones_partidas(estado, jugador, jugador_id=None):
+    # Condiciones y parámetros comunes al listado y al conteo
+    condiciones, params = [], {}
+    if estado:
+        condiciones.append('p.Estado = :estado')
+        params['estado'] = estado
+    if jugador:
+        condiciones.append('(p.IDJUGADOR = :jugador OR p.IDRival = :jugador)')
+        params['jugador'] = jugador_id
+    return condiciones, params
+
+
+# Resultado de una partida en un solo viaje: la fila del registro (llave
+# PartidaID, así un reintento choca con DUP_VAL_ON_INDEX y no suma nada), un
+# MERGE que suma a ambos jugadores y mueve su rating Elo (misma fórmula que
+# rango.delta_elo) y el cambio de estado de la partida.
+SQL_REGISTRAR_RESULTADO = """
+    DECLARE
+        v_j1 Partidas.IDJUGADOR%TYPE;
+        v_j2 Partidas.IDRival%TYPE;
+        v_r1 Jugadores.Rating%TYPE;
+        v_r2 Jugadores.Rating%TYPE;
+        v_d NUMBER;
+    BEGIN
+        SELECT IDJUGADOR, IDRival INTO v_j1, v_j2 FROM Partidas WHERE PartidaID = :pid;
+        INSERT INTO Resultados (PartidaID, IDJUGADOR, IDRival, Ganador) VALUES (:pid, v_j1, v_j2, :ganador);
+        SELECT Rating INTO v_r1 FROM Jugadores WHERE JugadorID = v_j1 FOR UPDATE;
+        SELECT Rating INTO v_r2 FROM Jugadores WHERE JugadorID = v_j2 FOR UPDATE;
+        v_d := :k * (CASE WHEN :ganador IS NULL THEN 0.5 WHEN :ganador = 0 THEN 1 ELSE 0 END
+                     - 1 / (1 + POWER(10, (v_r2 - v_r1) / 400)));
+        MERGE INTO Jugadores j
+        USING (
+            SELECT JugadorID, SUM(g) AS g, SUM(e) AS e, SUM(p) AS p, SUM(dr) AS dr
+            FROM (
+                SELECT v_j1 AS JugadorID,
+                       CASE WHEN :ganador = 0 THEN 1 ELSE 0 END AS g,
+                       CASE WHEN :ganador IS NULL THEN 1 ELSE 0 END AS e,
+                       CASE WHEN :ganador = 1 THEN 1 ELSE 0 END AS p,
+                       v_d AS dr
+                FROM dual
+                UNION ALL
+                SELECT v_j2,
+                       CASE WHEN :ganador = 1 THEN 1 ELSE 0 END,
+                       CASE WHEN :ganador IS NULL THEN 1 ELSE 0 END,
+                       CASE WHEN :ganador = 0 THEN 1 ELSE 0 END,
+                       -v_d
+                FROM dual
+            )
+            GROUP BY JugadorID
+        ) r ON (j.JugadorID = r.JugadorID)
+        WHEN MATCHED THEN UPDATE SET
+            j.Puntuacion = j.Puntuacion + r.g - r.p,
+            j.Ganadas = j.Ganadas + r.g,
+            j.Empatadas = j.Empatadas + r.e,
+            j.Perdidas = j.Perdidas + r.p,
+            j.Rating = j.Rating + r.dr;
+        UPDATE Partidas SET Estado = 'Terminada' WHERE PartidaID = :pid;
+        :j1 := v_j1;
+        :j2 := v_j2;
+        SELECT Rating INTO :rating1 FROM Jugadores WHERE JugadorID = v_j1;
+        SELECT Rating INTO :rating2 FROM Jugadores WHERE JugadorID = v_j2;
+        :registrado := 1;
+    EXCEPTION
+        WHEN DUP_VAL_ON_INDEX THEN :registrado := 0;
+        WHEN NO_DATA_FOUND THEN :registrado := -1;
+    END;
+"""
+
+# Estadísticas de todos los jugadores desde cero a partir de Resultados
+SQL_REAGREGAR = """
+    MERGE INTO Jugadores j
+    USING (
+        SELECT jj.JugadorID, NVL(a.g, 0) AS g, NVL(a.e, 0) AS e, NVL(a.p, 0) AS p
+        FROM Jugadores jj
+        LEFT JOIN (
+            SELECT JugadorID, SUM(g) AS g, SUM(e) AS e, SUM(p) AS p
+            FROM (
+                SELECT IDJUGADOR AS JugadorID,
+                       CASE WHEN Ganador = 0 THEN 1 ELSE 0 END AS g,
+                       CASE WHEN Ganador IS NULL THEN 1 ELSE 0 END AS e,
+                       CASE WHEN Ganador = 1 THEN 1 ELSE 0 END AS p
+                FROM Resultados
+                UNION ALL
+                SELECT IDRival,
+                       CASE WHEN Ganador = 1 THEN 1 ELSE 0 END,
+                       CASE WHEN Ganador IS NULL THEN 1 ELSE 0 END,
+                       CASE WHEN Ganador = 0 THEN 1 ELSE 0 END
+                FROM Resultados
+            )
+            GROUP BY JugadorID
+        ) a ON a.JugadorID = jj.JugadorID
+    ) r ON (j.JugadorID = r.JugadorID)
+    WHEN MATCHED THEN UPDATE SET
+        j.Puntuacion = r.g - r.p,
+        j.Ganadas = r.g,
+        j.Empatadas = r.e,
+        j.Perdidas = r.p
+"""
+
+
+# Exportación: partidas con la posición final y el historial completo
+SQL_EXPORTAR_PARTIDAS = f"""
+    SELECT p.PartidaID, p.IDJUGADOR, p.IDRival, p.Estado, p.FechaCreacion, p.Tablero, p.Partida,
+           {SQL_PENDIENTES},
+           (SELECT LISTAGG(jg.Columna) WITHIN GROUP (ORDER BY jg.Numero)
+            FROM Jugadas jg WHERE jg.PartidaID = p.PartidaID)
+    FROM Partidas p
+    ORDER BY p.PartidaID
+"""
+
+# Importación con IDs explícitos (las columnas son GENERATED BY DEFAULT)
+SQL_IMPORTAR = {
+    'jugador': """
+        INSERT INTO Jugadores (JugadorID, Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas, Rating)
+        VALUES (:jid, :nombre, :identificacion, :puntuacion, :ganadas, :empatadas, :perdidas, :rating)
+    """,
+    'partida': """
+        INSERT INTO Partidas (PartidaID, IDJUGADOR, IDRival, Estado, Tablero, FechaCreacion)
+        VALUES (:pid, :idj, :idr, :estado, :tablero, NVL(:fecha, SYSTIMESTAMP))
+    """,
+    'resultado': """
+        INSERT INTO Resultados (PartidaID, IDJUGADOR, IDRival, Ganador, FechaRegistro)
+        VALUES (:pid, :idj, :idr, :ganador, NVL(:fecha, SYSTIMESTAMP))
+    """,
+}
+
+# Partidas de un torneo: llegan terminadas y con su resultado
+SQL_INSERTAR_TERMINADA = """
+    INSERT INTO Partidas (IDJUGADOR, IDRival, Estado, Tablero)
+    VALUES (:idj, :idr, 'Terminada', :tablero)
+    RETURNING PartidaID INTO :pid
+"""
+SQL_SUMAR_JUGADOR = """
+    UPDATE Jugadores
+    SET Puntuacion = Puntuacion + :puntos, Ganadas = Ganadas + :g, Empatadas = Empatadas + :e,
+        Perdidas = Perdidas + :p, Rating = Rating + :dr
+    WHERE JugadorID = :jid
+"""
+
+
+class RepositorioOracle(Repositorio):
+    @contextmanager
+    def _cursor(self, etiqueta):
+        # Cursor en una conexión del pool; commit al salir bien, rollback si no.
+        # Cada sentencia se mide en /metrics con la etiqueta de la operación.
+        conn = get_db_connection()
+        if not conn:
+            raise SinConexion('No se pudo conectar a la base de datos')
+        try:
+            yield CursorMedido(conn.cursor(), etiqueta)
+            with SENTENCIAS.medir(f'{etiqueta}:commit'):
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @asynccontextmanager
+    async def _cursor_async(self, etiqueta):
+        # Igual que _cursor, sobre el pool async (asgi.py)
+        conn = await get_db_connection_async()
+        if not conn:
+            raise SinConexion('No se pudo conectar a la base de datos')
+        try:
+            yield CursorMedidoAsync(conn.cursor(), etiqueta)
+            with SENTENCIAS.medir(f'{etiqueta}:commit'):
+                await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+        finally:
+            await conn.close()
+
+    # Jugadores
+    def registrar_jugador(self, nombre, identificacion):
+        # Los índices únicos sobre LOWER(Nombre) e Identificacion rechazan los duplicados
+        try:
+            with self._cursor('registrar_jugador') as cursor:
+                jugador_id_var = cursor.var(oracledb.NUMBER)
+                cursor.execute(
+                    "INSERT INTO Jugadores (Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas) "
+                    "VALUES (:nombre, :identificacion, 0, 0, 0, 0) "
+                    "RETURNING JugadorID INTO :jid",
+                    {'nombre': nombre, 'identificacion': identificacion, 'jid': jugador_id_var}
+                )
+                jugador_id = int(jugador_id_var.getvalue()[0])
+        except oracledb.IntegrityError as e:
+            if e.args[0].code == 1:     # ORA-00001
+                raise JugadorDuplicado('El nombre o identificación ya existen') from e
+            raise
+        recordar_jugador(nombre, jugador_id)
+        return jugador_id
+
+    def registrar_victoria(self, ganador, perdedor):
+        with self._cursor('registrar_victoria') as cursor:
+            cursor.execute("""
+                UPDATE Jugadores
+                SET
+                    Puntuacion = Puntuacion + 1,
+                    Ganadas = Ganadas + 1
+                WHERE Nombre = :nombre
+            """, {'nombre': ganador})
+            cursor.execute("""
+                UPDATE Jugadores
+                SET
+                    Puntuacion = Puntuacion - 1,
+                    Perdidas = Perdidas + 1
+                WHERE Nombre = :nombre
+            """, {'nombre': perdedor})
+
+    def registrar_empate(self, jugador1, jugador2):
+        with self._cursor('registrar_empate') as cursor:
+            cursor.executemany("""
+                UPDATE Jugadores
+                SET
+                    Empatadas = Empatadas + 1
+                WHERE Nombre = :nombre
+            """, [{'nombre': jugador1}, {'nombre': jugador2}])
+
+    def buscar_jugador(self, nombre):
+        with self._cursor('buscar_jugador') as cursor:
+            cursor.execute("SELECT JugadorID, Rating FROM Jugadores WHERE Nombre = :nombre", {'nombre': nombre})
+            return cursor.fetchone()
+
+    def escalafon(self):
+        with self._cursor('escalafon') as cursor:
+            cursor.execute(SQL_ESCALAFON, {'ia': JUGADOR_IA})
+            return cursor.fetchall()
+
+    # Partidas
+    def crear_partida(self, jugador1, jugador2, tablero):
+        with self._cursor('crear_partida') as cursor:
+            # IDs desde la caché compartida, una sola consulta si faltan
+            ids = resolver_ids(cursor, [jugador1, jugador2])
+            if jugador1 not in ids or jugador2 not in ids:
+                raise JugadorNoEncontrado('Uno o ambos jugadores no existen')
+            partida_id_var = cursor.var(oracledb.NUMBER)
+            cursor.execute("""
+                INSERT INTO Partidas (IDJUGADOR, IDRival, Estado, Tablero)
+                VALUES (:idj, :idr, 'En progreso', :tablero)
+                RETURNING PartidaID INTO :pid
+            """, {'idj': ids[jugador1], 'idr': ids[jugador2], 'tablero': tablero, 'pid': partida_id_var})
+            return int(partida_id_var.getvalue()[0])
+
+    def cargar_vista_partida(self, id_partida):
+        # Partida, nombres, estadísticas de ambos y jugadas pendientes en una sola consulta
+        with self._cursor('cargar_vista_partida') as cursor:
+            cursor.execute(f'''
+                SELECT j1.Nombre, j2.Nombre, p.Tablero, p.Partida, p.Estado,
+                       j1.Puntuacion, j1.Ganadas, j1.Empatadas, j1.Perdidas,
+                       j2.Puntuacion, j2.Ganadas, j2.Empatadas, j2.Perdidas,
+                       {SQL_PENDIENTES}
+                FROM Partidas p
+                JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
+                JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
+                WHERE p.PartidaID = :pid
+            ''', {'pid': id_partida})
+            row = cursor.fetchone()
+        if not row:
+            return None
+        # Última foto del tablero más las jugadas registradas después de ella
+        snapshot = row[2] or row[3]
+        codigo = codigo_con_pendientes(snapshot, row[13]) if snapshot else None
+        return row[0], row[1], codigo, row[4], stats_desde_fila(*row[5:9]), stats_desde_fila(*row[9:13])
+
+    def cargar_partida(self, id_partida):
+        with self._cursor('cargar_partida') as cursor:
+            cursor.execute(f"""
+                SELECT p.Tablero, p.Partida, p.Estado, j1.Nombre, j2.Nombre, {SQL_PENDIENTES}
+                FROM Partidas p
+                JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
+                JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
+                WHERE p.PartidaID = :pid
+            """, {'pid': id_partida})
+            row = cursor.fetchone()
+        if not row:
+            raise PartidaNoEncontrada('Partida no encontrada')
+        posicion = posicion_desde_snapshot(codigo_con_pendientes(row[0] or row[1], row[5]))
+        return posicion, row[2], row[3], row[4]
+
+    def _bloquear(self, cursor, id_partida):
+        cursor.execute(SQL_BLOQUEAR_PARTIDA, {'pid': id_partida})
+        return cargar_posicion(cursor, id_partida, _snapshot_bloqueado(cursor.fetchone()))
+
+    def jugar(self, id_partida, columna, jugador=None, esperada=None):
+        with self._cursor('jugar') as cursor:
+            posicion = self._bloquear(cursor, id_partida)
+            _validar_jugada(posicion, jugador, esperada)
+            fila = registrar_jugada(cursor, id_partida, posicion, columna)
+            return posicion, fila
+
+    def sincronizar(self, id_partida, partida):
+        with self._cursor('sincronizar') as cursor:
+            actual = self._bloquear(cursor, id_partida)
+            sincronizar_tablero(cursor, id_partida, actual, partida)
+
+    # Las mismas escrituras para los handlers async de asgi.py
+    async def _bloquear_async(self, cursor, id_partida):
+        await cursor.execute(SQL_BLOQUEAR_PARTIDA, {'pid': id_partida})
+        return await cargar_posicion_async(cursor, id_partida, _snapshot_bloqueado(await cursor.fetchone()))
+
+    async def jugar_async(self, id_partida, columna, jugador=None, esperada=None):
+        async with self._cursor_async('jugar_async') as cursor:
+            posicion = await self._bloquear_async(cursor, id_partida)
+            _validar_jugada(posicion, jugador, esperada)
+            fila = await registrar_jugada_async(cursor, id_partida, posicion, columna)
+            return posicion, fila
+
+    async def sincronizar_async(self, id_partida, partida):
+        async with self._cursor_async('sincronizar_async') as cursor:
+            actual = await self._bloquear_async(cursor, id_partida)
+            await sincronizar_tablero_async(cursor, id_partida, actual, partida)
+
+    def guardar_jugadas(self, lote):
+        # Jugadas de varias partidas y su foto nueva en dos executemany y un solo commit
+        jugadas = [{'pid': pid, 'n': numero, 'col': columna} for pid, pendientes, _ in lote
+                   for numero, columna in pendientes]
+        with self._cursor('guardar_jugadas') as cursor:
+            if jugadas:
+                cursor.executemany(SQL_INSERTAR_JUGADA, jugadas)
+            cursor.executemany(SQL_GUARDAR_SNAPSHOT, [{'tablero': codigo, 'pid': pid} for pid, _, codigo in lote])
+
+    def partida_en_progreso(self, jugador1, jugador2):
+        with self._cursor('partida_en_progreso') as cursor:
+            ids = resolver_ids(cursor, [jugador1, jugador2])
+            if jugador1 not in ids or jugador2 not in ids:
+                return None
+            cursor.execute('''
+                SELECT PartidaID FROM Partidas
+                WHERE Estado = 'En progreso'
+                  AND ((IDJUGADOR = :id1 AND IDRival = :id2) OR (IDJUGADOR = :id2 AND IDRival = :id1))
+                ORDER BY FechaCreacion DESC FETCH FIRST 1 ROWS ONLY
+            ''', {'id1': ids[jugador1], 'id2': ids[jugador2]})
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def terminar_partida(self, id_partida):
+        with self._cursor('terminar_partida') as cursor:
+            cursor.execute("""
+                UPDATE Partidas
+                SET Estado = 'Terminada'
+                WHERE PartidaID = :pid
+            """, {'pid': id_partida})
+
+    def registrar_resultado(self, id_partida, ganador):
+        with self._cursor('registrar_resultado') as cursor:
+            salida = {nombre: cursor.var(oracledb.NUMBER) for nombre in ('registrado', 'j1', 'j2', 'rating1', 'rating2')}
+            cursor.execute(SQL_REGISTRAR_RESULTADO, {'pid': id_partida, 'ganador': ganador, 'k': K_ELO, **salida})
+            valores = {nombre: var.getvalue() for nombre, var in salida.items()}
+        if valores['registrado'] < 0:
+            raise PartidaNoEncontrada('Partida no encontrada')
+        if valores['registrado'] == 0:
+            return None
+        return {int(valores['j1']): float(valores['rating1']), int(valores['j2']): float(valores['rating2'])}
+
+    def guardar_partidas_terminadas(self, partidas, sumas):
+        # Cuatro executemany y un commit por lote; los PartidaID vuelven por DML RETURNING
+        with self._cursor('guardar_partidas_terminadas') as cursor:
+            ids_var = cursor.var(oracledb.NUMBER, arraysize=len(partidas))
+            cursor.setinputsizes(pid=ids_var)
+            cursor.executemany(SQL_INSERTAR_TERMINADA, [
+                {'idj': partida['idj'], 'idr': partida['idr'], 'tablero': partida['tablero']} for partida in partidas
+            ])
+            ids = [int(ids_var.getvalue(i)[0]) for i in range(len(partidas))]
+            cursor.executemany(SQL_INSERTAR_JUGADA, [
+                {'pid': pid, 'n': numero, 'col': int(columna)}
+                for pid, partida in zip(ids, partidas) for numero, columna in enumerate(partida['jugadas'], 1)
+            ])
+            cursor.executemany("""
+                INSERT INTO Resultados (PartidaID, IDJUGADOR, IDRival, Ganador)
+                VALUES (:pid, :idj, :idr, :ganador)
+            """, [{'pid': pid, 'idj': partida['idj'], 'idr': partida['idr'], 'ganador': partida['ganador']}
+                  for pid, partida in zip(ids, partidas)])
+            cursor.executemany(SQL_SUMAR_JUGADOR, [
+                {'jid': jid, 'puntos': s[0], 'g': s[1], 'e': s[2], 'p': s[3], 'dr': s[4]} for jid, s in sumas.items()
+            ])
+        return ids
+
+    def reagregar_estadisticas(self):
+        with self._cursor('reagregar_estadisticas') as cursor:
+            cursor.execute(SQL_REAGREGAR)
+            return cursor.rowcount
+
+    def ratings(self):
+        with self._cursor('ratings') as cursor:
+            cursor.arraysize = 5000
+            cursor.execute("SELECT JugadorID, Nombre, Rating FROM Jugadores")
+            return cursor.fetchall()
+
+    def historial_resultados(self):
+        with self._cursor('historial_resultados') as cursor:
+            cursor.arraysize = 5000
+            cursor.execute("""
+                SELECT IDJUGADOR, IDRival, Ganador FROM Resultados ORDER BY FechaRegistro, PartidaID
+            """)
+            yield from cursor
+
+    def guardar_ratings(self, ratings, inicial):
+        with self._cursor('guardar_ratings') as cursor:
+            cursor.execute("UPDATE Jugadores SET Rating = :inicial", {'inicial': inicial})
+            cursor.executemany("UPDATE Jugadores SET Rating = :rating WHERE JugadorID = :jid",
+                               [{'jid': jugador_id, 'rating': rating} for jugador_id, rating in ratings.items()])
+
+    def partidas_terminadas(self, arraysize):
+        with self._cursor('partidas_terminadas') as cursor:
+            cursor.arraysize = arraysize
+            cursor.prefetchrows = arraysize + 1
+            cursor.execute(f"""
+                SELECT p.IDJUGADOR, p.IDRival, p.Tablero, p.Partida, {SQL_PENDIENTES},
+                       (SELECT jg.Columna FROM Jugadas jg WHERE jg.PartidaID = p.PartidaID AND jg.Numero = 1)
+                FROM Partidas p
+                WHERE p.Estado = 'Terminada'
+            """)
+            for row in cursor:
+                yield row[0], row[1], codigo_con_pendientes(row[2] or row[3], row[4]), row[5]
+
+    def guardar_estadisticas_globales(self, clave, datos):
+        with self._cursor('guardar_estadisticas_globales') as cursor:
+            cursor.setinputsizes(datos=oracledb.DB_TYPE_CLOB)
+            cursor.execute("""
+                MERGE INTO EstadisticasGlobales e
+                USING (SELECT :clave AS Clave FROM dual) n ON (e.Clave = n.Clave)
+                WHEN MATCHED THEN UPDATE SET e.Datos = :datos, e.FechaCalculo = SYSTIMESTAMP
+                WHEN NOT MATCHED THEN INSERT (Clave, Datos) VALUES (:clave, :datos)
+            """, {'clave': clave, 'datos': datos})
+
+    def estadisticas_globales(self, clave):
+        with self._cursor('estadisticas_globales') as cursor:
+            cursor.execute("SELECT Datos, FechaCalculo FROM EstadisticasGlobales WHERE Clave = :clave",
+                           {'clave': clave})
+            row = cursor.fetchone()
+            return (row[0].read(), row[1]) if row else None
+
+    def exportar(self, arraysize):
+        # Un cursor por tabla; el driver trae `arraysize` filas por viaje
+        with self._cursor('exportar') as cursor:
+            cursor.arraysize = arraysize
+            cursor.prefetchrows = arraysize + 1
+            cursor.execute("""
+                SELECT JugadorID, Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas, Rating
+                FROM Jugadores ORDER BY JugadorID
+            """)
+            for row in cursor:
+                yield {'tipo': 'jugador', 'JugadorID': row[0], 'Nombre': row[1], 'Identificacion': row[2],
+                       'Puntuacion': row[3], 'Ganadas': row[4], 'Empatadas': row[5], 'Perdidas': row[6],
+                       'Rating': row[7]}
+            cursor.execute(SQL_EXPORTAR_PARTIDAS)
+            for row in cursor:
+                snapshot = row[5] or row[6]
+                yield {'tipo': 'partida', 'PartidaID': row[0], 'IDJUGADOR': row[1], 'IDRival': row[2],
+                       'Estado': row[3], 'FechaCreacion': row[4],
+                       'Tablero': codigo_con_pendientes(snapshot, row[7]) if snapshot else None,
+                       'Jugadas': row[8] or ''}
+            cursor.execute("""
+                SELECT PartidaID, IDJUGADOR, IDRival, Ganador, FechaRegistro FROM Resultados ORDER BY PartidaID
+            """)
+            for row in cursor:
+                yield {'tipo': 'resultado', 'PartidaID': row[0], 'IDJUGADOR': row[1], 'IDRival': row[2],
+                       'Ganador': row[3], 'FechaRegistro': row[4]}
+
+    def importar_lote(self, tipo, filas, jugadas):
+        # batcherrors: las filas que fallan se informan y el resto se inserta igual
+        with self._cursor(f'importar_{tipo}') as cursor:
+            cursor.executemany(SQL_IMPORTAR[tipo], filas, batcherrors=True)
+            errores = {error.offset: error.message for error in cursor.getbatcherrors()}
+            jugadas = [(i, jugada) for i, jugada in jugadas if i not in errores]
+            if jugadas:
+                cursor.executemany(SQL_INSERTAR_JUGADA, [jugada for _, jugada in jugadas], batcherrors=True)
+                for error in cursor.getbatcherrors():
+                    errores.setdefault(jugadas[error.offset][0], error.message)
+        return list(errores.items())
+
+    def ajustar_identidades(self):
+        # El próximo ID generado sigue al mayor importado (DDL: hace commit solo)
+        with self._cursor('ajustar_identidades') as cursor:
+            for tabla, columna in (('Jugadores', 'JugadorID'), ('Partidas', 'PartidaID')):
+                cursor.execute(f'ALTER TABLE {tabla} MODIFY {columna} GENERATED BY DEFAULT AS IDENTITY '
+                               f'(START WITH LIMIT VALUE)')
+
+    def _filtros(self, cursor, estado, jugador):
+        jugador_id = resolver_ids(cursor, [jugador]).get(jugador) if jugador else None
+        return condiciones_partidas(estado, jugador, jugador_id)
+
+    def listar_partidas(self, estado, jugador, desde, limite):
+        with self._cursor('listar_partidas') as cursor:
+            condiciones, params = self._filtros(cursor, estado, jugador)
+            if desde:
+                params['fecha'], params['pid'] = desde
+                condiciones.append(CONDICION_CURSOR)
+            where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+            params['limite'] = limite
+            cursor.execute(sql_listar_partidas(where), params)
+            return cursor.fetchall()
+
+    def contar_partidas(self, estado, jugador):
+        # Mismos filtros, sin unir con Jugadores
+        with self._cursor('contar_partidas') as cursor:
+            condiciones, params = self._filtros(cursor, estado, jugador)
+            where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+            cursor.execute(f'SELECT COUNT(*) FROM Partidas p {where}', params)
+            return cursor.fetchone()[0]
+
+    def listar_jugadas(self, id_partida):
+        with self._cursor('listar_jugadas') as cursor:
+            return listar_jugadas(cursor, id_partida)
+
+    def novedades(self, id_partida, desde):
+        # Estado y jugadas posteriores a `desde` en una sola consulta
+        with self._cursor('novedades') as cursor:
+            cursor.execute("""
+                SELECT p.Estado, jg.Numero, jg.Columna
+                FROM Partidas p
+                LEFT JOIN Jugadas jg ON jg.PartidaID = p.PartidaID AND jg.Numero > :n
+                WHERE p.PartidaID = :pid
+                ORDER BY jg.Numero
+            """, {'pid': id_partida, 'n': desde})
+            filas = cursor.fetchall()
+        if not filas:
+            raise PartidaNoEncontrada('Partida no encontrada')
+        return filas[0][0], [(numero, columna) for _, numero, columna in filas if numero is not None]
@@ -0,0 +1,562 @@
+# Repositorio sobre SQLite con el mismo esquema que KUATRO.sql. Sirve para
+# correr y medir la aplicación en cualquier máquina sin Oracle. Las sentencias
+# de jugadas.py son SQL estándar y se usan tal cual.
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from jugadas import (cargar_posicion, registrar_jugada, sincronizar_tablero, listar_jugadas, posicion_desde_snapshot,
+                     codigo_con_pendientes, SQL_INSERTAR_JUGADA, SQL_GUARDAR_SNAPSHOT)
+from metricas import CursorMedido, SENTENCIAS
+from rango import RATING_INICIAL, deltas_resultado
+from repositorio import (Repositorio, JUGADOR_IA, JugadorDuplicado, JugadorNoEncontrado, PartidaNoEncontrada,
+                         PartidaNoEnProgreso, TurnoIncorrecto, PartidaCambio, stats_desde_fila, sumas_resultado)
+
+RUTA_SQLITE = os.environ.get('KUATRO_SQLITE', 'kuatro.sqlite3')
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS Jugadores (
+    JugadorID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Puntuacion INTEGER,
+    Identificacion TEXT,
+    Nombre TEXT,
+    Ganadas INTEGER,
+    Empatadas INTEGER,
+    Perdidas INTEGER,
+    Rating REAL NOT NULL DEFAULT 1500
+);
+CREATE TABLE IF NOT EXISTS Partidas (
+    PartidaID INTEGER PRIMARY KEY AUTOINCREMENT,
+    IDJUGADOR INTEGER REFERENCES Jugadores(JugadorID),
+    IDRival INTEGER REFERENCES Jugadores(JugadorID),
+    Estado TEXT,
+    Partida TEXT,
+    Tablero TEXT,
+    FechaCreacion TEXT
+);
+CREATE TABLE IF NOT EXISTS Jugadas (
+    PartidaID INTEGER REFERENCES Partidas(PartidaID),
+    Numero INTEGER,
+    Columna INTEGER,
+    PRIMARY KEY (PartidaID, Numero)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS Resultados (
+    PartidaID INTEGER PRIMARY KEY REFERENCES Partidas(PartidaID),
+    IDJUGADOR INTEGER,
+    IDRival INTEGER,
+    Ganador INTEGER,
+    FechaRegistro TEXT
+);
+CREATE TABLE IF NOT EXISTS EstadisticasGlobales (
+    Clave TEXT PRIMARY KEY,
+    Datos TEXT,
+    FechaCalculo TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_partidas_fecha ON Partidas (FechaCreacion, PartidaID);
+CREATE INDEX IF NOT EXISTS ix_partidas_estado_fecha ON Partidas (Estado, FechaCreacion, PartidaID);
+CREATE INDEX IF NOT EXISTS ix_partidas_jugador_fecha ON Partidas (IDJUGADOR, FechaCreacion, PartidaID);
+CREATE INDEX IF NOT EXISTS ix_partidas_rival_fecha ON Partidas (IDRival, FechaCreacion, PartidaID);
+CREATE INDEX IF NOT EXISTS ix_jugadores_nombre ON Jugadores (Nombre);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_jugadores_nombre ON Jugadores (LOWER(Nombre));
+CREATE UNIQUE INDEX IF NOT EXISTS ux_jugadores_identificacion ON Jugadores (Identificacion);
+"""
+
+# Jugadas posteriores a la foto como texto de columnas (igual que jugadas.SQL_PENDIENTES)
+SQL_PENDIENTES = """(
+    SELECT GROUP_CONCAT(Columna, '') FROM (
+        SELECT jg.Columna FROM Jugadas jg
+        WHERE jg.PartidaID = p.PartidaID
+          AND jg.Numero > LENGTH(REPLACE(COALESCE(p.Tablero, ''), '.', ''))
+        ORDER BY jg.Numero
+    )
+)"""
+
+SQL_IMPORTAR = {
+    'jugador': """
+        INSERT INTO Jugadores (JugadorID, Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas, Rating)
+        VALUES (:jid, :nombre, :identificacion, :puntuacion, :ganadas, :empatadas, :perdidas, :rating)
+    """,
+    'partida': """
+        INSERT INTO Partidas (PartidaID, IDJUGADOR, IDRival, Estado, Tablero, FechaCreacion)
+        VALUES (:pid, :idj, :idr, :estado, :tablero, :fecha)
+    """,
+    'resultado': """
+        INSERT INTO Resultados (PartidaID, IDJUGADOR, IDRival, Ganador, FechaRegistro)
+        VALUES (:pid, :idj, :idr, :ganador, :fecha)
+    """,
+}
+
+
+def _fecha(valor):
+    # FechaCreacion se guarda como texto ISO de ancho fijo para que ordene bien
+    return valor.isoformat(sep=' ', timespec='microseconds')
+
+
+def _leer_fecha(valor):
+    return datetime.fromisoformat(valor) if valor else None
+
+
+class RepositorioSQLite(Repositorio):
+    def __init__(self, ruta=RUTA_SQLITE):
+        self.ruta = ruta
+        self._local = threading.local()
+        conn = self._conexion()
+        conn.executescript(ESQUEMA)
+        # Archivos creados antes de que existiera la columna
+        if 'Rating' not in {fila[1] for fila in conn.execute('PRAGMA table_info(Jugadores)')}:
+            conn.execute(f'ALTER TABLE Jugadores ADD COLUMN Rating REAL NOT NULL DEFAULT {RATING_INICIAL}')
+        # Jugador reservado de la computadora, como el INSERT de KUATRO.sql
+        conn.execute('''
+            INSERT OR IGNORE INTO Jugadores (Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas)
+            VALUES (:nombre, '0', 0, 0, 0, 0)
+        ''', {'nombre': JUGADOR_IA})
+
+    def _conexion(self):
+        # Una conexión por hilo; las transacciones se abren a mano
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _cursor(self, etiqueta, escritura=False):
+        conn = self._conexion()
+        cursor = conn.cursor()
+        # BEGIN IMMEDIATE toma el candado de escritura de entrada (como FOR UPDATE)
+        with SENTENCIAS.medir(f'{etiqueta}:begin'):
+            cursor.execute('BEGIN IMMEDIATE' if escritura else 'BEGIN')
+        try:
+            yield CursorMedido(cursor, etiqueta)
+            with SENTENCIAS.medir(f'{etiqueta}:commit'):
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _lectura(self, etiqueta):
+        # Para los generadores, que cierran con _cerrar_lectura en su finally: así la
+        # transacción también termina con GeneratorExit si quien lee lo deja a medias
+        conn = self._conexion()
+        cursor = conn.cursor()
+        with SENTENCIAS.medir(f'{etiqueta}:begin'):
+            cursor.execute('BEGIN')
+        return conn, CursorMedido(cursor, etiqueta)
+
+    def _cerrar_lectura(self, conn, cursor, etiqueta, completa):
+        try:
+            if completa:
+                with SENTENCIAS.medir(f'{etiqueta}:commit'):
+                    conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            cursor.close()
+
+    def _ids(self, cursor, nombres):
+        marcas = ', '.join('?' for _ in nombres)
+        cursor.execute(f'SELECT Nombre, JugadorID FROM Jugadores WHERE Nombre IN ({marcas})', list(nombres))
+        return dict(cursor.fetchall())
+
+    # Jugadores
+    def registrar_jugador(self, nombre, identificacion):
+        # Los índices únicos ux_jugadores_* rechazan los duplicados
+        try:
+            with self._cursor('registrar_jugador', escritura=True) as cursor:
+                cursor.execute("""
+                    INSERT INTO Jugadores (Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas)
+                    VALUES (:nombre, :identificacion, 0, 0, 0, 0)
+                """, {'nombre': nombre, 'identificacion': str(identificacion)})
+                return cursor.lastrowid
+        except sqlite3.IntegrityError as e:
+            raise JugadorDuplicado('El nombre o identificación ya existen') from e
+
+    def registrar_victoria(self, ganador, perdedor):
+        with self._cursor('registrar_victoria', escritura=True) as cursor:
+            cursor.execute("""
+                UPDATE Jugadores SET Puntuacion = Puntuacion + 1, Ganadas = Ganadas + 1 WHERE Nombre = :nombre
+            """, {'nombre': ganador})
+            cursor.execute("""
+                UPDATE Jugadores SET Puntuacion = Puntuacion - 1, Perdidas = Perdidas + 1 WHERE Nombre = :nombre
+            """, {'nombre': perdedor})
+
+    def registrar_empate(self, jugador1, jugador2):
+        with self._cursor('registrar_empate', escritura=True) as cursor:
+            cursor.executemany("""
+                UPDATE Jugadores SET Empatadas = Empatadas + 1 WHERE Nombre = :nombre
+            """, [{'nombre': jugador1}, {'nombre': jugador2}])
+
+    def buscar_jugador(self, nombre):
+        with self._cursor('buscar_jugador') as cursor:
+            cursor.execute("SELECT JugadorID, Rating FROM Jugadores WHERE Nombre = :nombre", {'nombre': nombre})
+            return cursor.fetchone()
+
+    def escalafon(self):
+        with self._cursor('escalafon') as cursor:
+            cursor.execute("""
+                SELECT Identificacion, Nombre, Puntuacion, Ganadas, Empatadas, Perdidas
+                FROM Jugadores
+                WHERE Nombre <> :ia
+                ORDER BY Puntuacion DESC, Nombre ASC
+            """, {'ia': JUGADOR_IA})
+            return cursor.fetchall()
+
+    # Partidas
+    def crear_partida(self, jugador1, jugador2, tablero):
+        with self._cursor('crear_partida', escritura=True) as cursor:
+            ids = self._ids(cursor, {jugador1, jugador2})
+            if jugador1 not in ids or jugador2 not in ids:
+                raise JugadorNoEncontrado('Uno o ambos jugadores no existen')
+            cursor.execute("""
+                INSERT INTO Partidas (IDJUGADOR, IDRival, Estado, Tablero, FechaCreacion)
+                VALUES (:idj, :idr, 'En progreso', :tablero, :fecha)
+            """, {'idj': ids[jugador1], 'idr': ids[jugador2], 'tablero': tablero, 'fecha': _fecha(datetime.now())})
+            return cursor.lastrowid
+
+    def cargar_vista_partida(self, id_partida):
+        with self._cursor('cargar_vista_partida') as cursor:
+            cursor.execute(f'''
+                SELECT j1.Nombre, j2.Nombre, p.Tablero, p.Partida, p.Estado,
+                       j1.Puntuacion, j1.Ganadas, j1.Empatadas, j1.Perdidas,
+                       j2.Puntuacion, j2.Ganadas, j2.Empatadas, j2.Perdidas,
+                       {SQL_PENDIENTES}
+                FROM Partidas p
+                JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
+                JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
+                WHERE p.PartidaID = :pid
+            ''', {'pid': id_partida})
+            row = cursor.fetchone()
+        if not row:
+            return None
+        snapshot = row[2] or row[3]
+        codigo = codigo_con_pendientes(snapshot, row[13]) if snapshot else None
+        return row[0], row[1], codigo, row[4], stats_desde_fila(*row[5:9]), stats_desde_fila(*row[9:13])
+
+    def cargar_partida(self, id_partida):
+        with self._cursor('cargar_partida') as cursor:
+            cursor.execute(f"""
+                SELECT p.Tablero, p.Partida, p.Estado, j1.Nombre, j2.Nombre, {SQL_PENDIENTES}
+                FROM Partidas p
+                JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
+                JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
+                WHERE p.PartidaID = :pid
+            """, {'pid': id_partida})
+            row = cursor.fetchone()
+        if not row:
+            raise PartidaNoEncontrada('Partida no encontrada')
+        posicion = posicion_desde_snapshot(codigo_con_pendientes(row[0] or row[1], row[5]))
+        return posicion, row[2], row[3], row[4]
+
+    def _en_progreso(self, cursor, id_partida):
+        cursor.execute("SELECT Tablero, Partida, Estado FROM Partidas WHERE PartidaID = :pid", {'pid': id_partida})
+        row = cursor.fetchone()
+        if not row:
+            raise PartidaNoEncontrada('Partida no encontrada')
+        if row[2] != 'En progreso':
+            raise PartidaNoEnProgreso('La partida no está en progreso')
+        return cargar_posicion(cursor, id_partida, row[0] or row[1])
+
+    def jugar(self, id_partida, columna, jugador=None, esperada=None):
+        with self._cursor('jugar', escritura=True) as cursor:
+            posicion = self._en_progreso(cursor, id_partida)
+            if esperada is not None and posicion.piezas != list(esperada):
+                raise PartidaCambio('La partida cambió durante la búsqueda')
+            if jugador is not None and str(jugador) != str(posicion.turno):
+                raise TurnoIncorrecto(posicion.turno)
+            fila = registrar_jugada(cursor, id_partida, posicion, columna)
+            return posicion, fila
+
+    def sincronizar(self, id_partida, partida):
+        with self._cursor('sincronizar', escritura=True) as cursor:
+            actual = self._en_progreso(cursor, id_partida)
+            sincronizar_tablero(cursor, id_partida, actual, partida)
+
+    def guardar_jugadas(self, lote):
+        # Jugadas de varias partidas y su foto nueva en dos executemany y un solo commit
+        jugadas = [{'pid': pid, 'n': numero, 'col': columna} for pid, pendientes, _ in lote
+                   for numero, columna in pendientes]
+        with self._cursor('guardar_jugadas', escritura=True) as cursor:
+            if jugadas:
+                cursor.executemany(SQL_INSERTAR_JUGADA, jugadas)
+            cursor.executemany(SQL_GUARDAR_SNAPSHOT, [{'tablero': codigo, 'pid': pid} for pid, _, codigo in lote])
+
+    def partida_en_progreso(self, jugador1, jugador2):
+        with self._cursor('partida_en_progreso') as cursor:
+            ids = self._ids(cursor, {jugador1, jugador2})
+            if jugador1 not in ids or jugador2 not in ids:
+                return None
+            cursor.execute('''
+                SELECT PartidaID FROM Partidas
+                WHERE Estado = 'En progreso'
+                  AND ((IDJUGADOR = :id1 AND IDRival = :id2) OR (IDJUGADOR = :id2 AND IDRival = :id1))
+                ORDER BY FechaCreacion DESC LIMIT 1
+            ''', {'id1': ids[jugador1], 'id2': ids[jugador2]})
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def terminar_partida(self, id_partida):
+        with self._cursor('terminar_partida', escritura=True) as cursor:
+            cursor.execute("UPDATE Partidas SET Estado = 'Terminada' WHERE PartidaID = :pid", {'pid': id_partida})
+
+    def registrar_resultado(self, id_partida, ganador):
+        with self._cursor('registrar_resultado', escritura=True) as cursor:
+            cursor.execute("SELECT IDJUGADOR, IDRival FROM Partidas WHERE PartidaID = :pid", {'pid': id_partida})
+            row = cursor.fetchone()
+            if not row:
+                raise PartidaNoEncontrada('Partida no encontrada')
+            cursor.execute("""
+                INSERT OR IGNORE INTO Resultados (PartidaID, IDJUGADOR, IDRival, Ganador, FechaRegistro)
+                VALUES (:pid, :j1, :j2, :ganador, :fecha)
+            """, {'pid': id_partida, 'j1': row[0], 'j2': row[1], 'ganador': ganador, 'fecha': _fecha(datetime.now())})
+            if cursor.rowcount == 0:
+                return None
+            cursor.execute("SELECT JugadorID, Rating FROM Jugadores WHERE JugadorID IN (:j1, :j2)",
+                           {'j1': row[0], 'j2': row[1]})
+            ratings = dict(cursor.fetchall())
+            deltas = deltas_resultado(row[0], row[1], ratings[row[0]], ratings[row[1]], ganador)
+            cursor.executemany("""
+                UPDATE Jugadores
+                SET Puntuacion = Puntuacion + :puntos, Ganadas = Ganadas + :g, Empatadas = Empatadas + :e,
+                    Perdidas = Perdidas + :p, Rating = Rating + :dr
+                WHERE JugadorID = :jid
+            """, [{'jid': jid, 'puntos': s[0], 'g': s[1], 'e': s[2], 'p': s[3], 'dr': deltas[jid]}
+                  for jid, s in sumas_resultado(row[0], row[1], ganador).items()])
+            cursor.execute("UPDATE Partidas SET Estado = 'Terminada' WHERE PartidaID = :pid", {'pid': id_partida})
+            return {jid: ratings[jid] + delta for jid, delta in deltas.items()}
+
+    def ratings(self):
+        with self._cursor('ratings') as cursor:
+            cursor.execute("SELECT JugadorID, Nombre, Rating FROM Jugadores")
+            return cursor.fetchall()
+
+    def historial_resultados(self):
+        conn, cursor = self._lectura('historial_resultados')
+        completa = False
+        try:
+            cursor.execute("SELECT IDJUGADOR, IDRival, Ganador FROM Resultados ORDER BY FechaRegistro, PartidaID")
+            yield from cursor
+            completa = True
+        finally:
+            self._cerrar_lectura(conn, cursor, 'historial_resultados', completa)
+
+    def guardar_ratings(self, ratings, inicial):
+        with self._cursor('guardar_ratings', escritura=True) as cursor:
+            cursor.execute("UPDATE Jugadores SET Rating = :inicial", {'inicial': inicial})
+            cursor.executemany("UPDATE Jugadores SET Rating = :rating WHERE JugadorID = :jid",
+                               [{'jid': jugador_id, 'rating': rating} for jugador_id, rating in ratings.items()])
+
+    def guardar_partidas_terminadas(self, partidas, sumas):
+        with self._cursor('guardar_partidas_terminadas', escritura=True) as cursor:
+            # Con el candado de escritura tomado nadie más inserta: los IDs siguen al mayor
+            cursor.execute("""
+                SELECT MAX(COALESCE((SELECT MAX(PartidaID) FROM Partidas), 0),
+                           COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'Partidas'), 0))
+            """)
+            primero = cursor.fetchone()[0] + 1
+            ids = list(range(primero, primero + len(partidas)))
+            fecha = _fecha(datetime.now())
+            cursor.executemany("""
+                INSERT INTO Partidas (PartidaID, IDJUGADOR, IDRival, Estado, Tablero, FechaCreacion)
+                VALUES (:pid, :idj, :idr, 'Terminada', :tablero, :fecha)
+            """, [{'pid': pid, 'idj': partida['idj'], 'idr': partida['idr'], 'tablero': partida['tablero'],
+                   'fecha': fecha} for pid, partida in zip(ids, partidas)])
+            cursor.executemany(SQL_INSERTAR_JUGADA, [
+                {'pid': pid, 'n': numero, 'col': int(columna)}
+                for pid, partida in zip(ids, partidas) for numero, columna in enumerate(partida['jugadas'], 1)
+            ])
+            cursor.executemany("""
+                INSERT INTO Resultados (PartidaID, IDJUGADOR, IDRival, Ganador, FechaRegistro)
+                VALUES (:pid, :idj, :idr, :ganador, :fecha)
+            """, [{'pid': pid, 'idj': partida['idj'], 'idr': partida['idr'], 'ganador': partida['ganador'],
+                   'fecha': fecha} for pid, partida in zip(ids, partidas)])
+            cursor.executemany("""
+                UPDATE Jugadores
+                SET Puntuacion = Puntuacion + :puntos, Ganadas = Ganadas + :g, Empatadas = Empatadas + :e,
+                    Perdidas = Perdidas + :p, Rating = Rating + :dr
+                WHERE JugadorID = :jid
+            """, [{'jid': jid, 'puntos': s[0], 'g': s[1], 'e': s[2], 'p': s[3], 'dr': s[4]}
+                  for jid, s in sumas.items()])
+        return ids
+
+    def reagregar_estadisticas(self):
+        with self._cursor('reagregar_estadisticas', escritura=True) as cursor:
+            cursor.execute("""
+                WITH r AS (
+                    SELECT IDJUGADOR AS JugadorID, Ganador = 0 AS g, Ganador IS NULL AS e, Ganador = 1 AS p
+                    FROM Resultados
+                    UNION ALL
+                    SELECT IDRival, Ganador = 1, Ganador IS NULL, Ganador = 0 FROM Resultados
+                ), a AS (
+                    SELECT JugadorID, SUM(g) AS g, SUM(e) AS e, SUM(p) AS p FROM r GROUP BY JugadorID
+                )
+                UPDATE Jugadores SET
+                    Ganadas = COALESCE((SELECT g FROM a WHERE a.JugadorID = Jugadores.JugadorID), 0),
+                    Empatadas = COALESCE((SELECT e FROM a WHERE a.JugadorID = Jugadores.JugadorID), 0),
+                    Perdidas = COALESCE((SELECT p FROM a WHERE a.JugadorID = Jugadores.JugadorID), 0),
+                    Puntuacion = COALESCE((SELECT g - p FROM a WHERE a.JugadorID = Jugadores.JugadorID), 0)
+            """)
+            # rowcount no cuenta sentencias que empiezan con WITH
+            cursor.execute("SELECT changes()")
+            return cursor.fetchone()[0]
+
+    def partidas_terminadas(self, arraysize):
+        conn, cursor = self._lectura('partidas_terminadas')
+        completa = False
+        try:
+            cursor.arraysize = arraysize
+            cursor.execute(f"""
+                SELECT p.IDJUGADOR, p.IDRival, p.Tablero, p.Partida, {SQL_PENDIENTES},
+                       (SELECT jg.Columna FROM Jugadas jg WHERE jg.PartidaID = p.PartidaID AND jg.Numero = 1)
+                FROM Partidas p
+                WHERE p.Estado = 'Terminada'
+            """)
+            for row in cursor:
+                yield row[0], row[1], codigo_con_pendientes(row[2] or row[3], row[4]), row[5]
+            completa = True
+        finally:
+            self._cerrar_lectura(conn, cursor, 'partidas_terminadas', completa)
+
+    def guardar_estadisticas_globales(self, clave, datos):
+        with self._cursor('guardar_estadisticas_globales', escritura=True) as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO EstadisticasGlobales (Clave, Datos, FechaCalculo) VALUES (:clave, :datos, :fecha)
+            """, {'clave': clave, 'datos': datos, 'fecha': _fecha(datetime.now())})
+
+    def estadisticas_globales(self, clave):
+        with self._cursor('estadisticas_globales') as cursor:
+            cursor.execute("SELECT Datos, FechaCalculo FROM EstadisticasGlobales WHERE Clave = :clave",
+                           {'clave': clave})
+            row = cursor.fetchone()
+            return (row[0], _leer_fecha(row[1])) if row else None
+
+    def exportar(self, arraysize):
+        # Una transacción de lectura: las tres consultas ven la misma versión de la base
+        conn, cursor = self._lectura('exportar')
+        completa = False
+        try:
+            cursor.arraysize = arraysize
+            cursor.execute("""
+                SELECT JugadorID, Nombre, Identificacion, Puntuacion, Ganadas, Empatadas, Perdidas, Rating
+                FROM Jugadores ORDER BY JugadorID
+            """)
+            for row in cursor:
+                yield {'tipo': 'jugador', 'JugadorID': row[0], 'Nombre': row[1], 'Identificacion': row[2],
+                       'Puntuacion': row[3], 'Ganadas': row[4], 'Empatadas': row[5], 'Perdidas': row[6],
+                       'Rating': row[7]}
+            cursor.execute(f"""
+                SELECT p.PartidaID, p.IDJUGADOR, p.IDRival, p.Estado, p.FechaCreacion, p.Tablero, p.Partida,
+                       {SQL_PENDIENTES},
+                       (SELECT GROUP_CONCAT(Columna, '') FROM (
+                           SELECT jg.Columna FROM Jugadas jg WHERE jg.PartidaID = p.PartidaID ORDER BY jg.Numero))
+                FROM Partidas p
+                ORDER BY p.PartidaID
+            """)
+            for row in cursor:
+                snapshot = row[5] or row[6]
+                yield {'tipo': 'partida', 'PartidaID': row[0], 'IDJUGADOR': row[1], 'IDRival': row[2],
+                       'Estado': row[3], 'FechaCreacion': _leer_fecha(row[4]),
+                       'Tablero': codigo_con_pendientes(snapshot, row[7]) if snapshot else None,
+                       'Jugadas': row[8] or ''}
+            cursor.execute("""
+                SELECT PartidaID, IDJUGADOR, IDRival, Ganador, FechaRegistro FROM Resultados ORDER BY PartidaID
+            """)
+            for row in cursor:
+                yield {'tipo': 'resultado', 'PartidaID': row[0], 'IDJUGADOR': row[1], 'IDRival': row[2],
+                       'Ganador': row[3], 'FechaRegistro': _leer_fecha(row[4])}
+            completa = True
+        finally:
+            self._cerrar_lectura(conn, cursor, 'exportar', completa)
+
+    def _insertar_lote(self, cursor, sql, filas):
+        # Como batcherrors de Oracle: si el executemany falla se repite fila por
+        # fila dentro de un savepoint para saber cuáles fallaron
+        cursor.execute('SAVEPOINT lote')
+        try:
+            cursor.executemany(sql, filas)
+            cursor.execute('RELEASE lote')
+            return {}
+        except sqlite3.DatabaseError:
+            cursor.execute('ROLLBACK TO lote')
+            cursor.execute('RELEASE lote')
+        errores = {}
+        for i, fila in enumerate(filas):
+            try:
+                cursor.execute(sql, fila)
+            except sqlite3.DatabaseError as e:
+                errores[i] = str(e)
+        return errores
+
+    def importar_lote(self, tipo, filas, jugadas):
+        if tipo != 'jugador':
+            ahora = datetime.now()
+            filas = [dict(fila, fecha=_fecha(fila['fecha'] or ahora)) for fila in filas]
+        with self._cursor(f'importar_{tipo}', escritura=True) as cursor:
+            errores = self._insertar_lote(cursor, SQL_IMPORTAR[tipo], filas)
+            jugadas = [(i, jugada) for i, jugada in jugadas if i not in errores]
+            if jugadas:
+                for j, mensaje in self._insertar_lote(cursor, SQL_INSERTAR_JUGADA,
+                                                      [jugada for _, jugada in jugadas]).items():
+                    errores.setdefault(jugadas[j][0], mensaje)
+        return list(errores.items())
+
+    def _filtros(self, estado, jugador):
+        condiciones, params = [], {}
+        if estado:
+            condiciones.append('p.Estado = :estado')
+            params['estado'] = estado
+        if jugador:
+            condiciones.append('''
+                (p.IDJUGADOR = (SELECT JugadorID FROM Jugadores WHERE Nombre = :jugador)
+                 OR p.IDRival = (SELECT JugadorID FROM Jugadores WHERE Nombre = :jugador))''')
+            params['jugador'] = jugador
+        return condiciones, params
+
+    def listar_partidas(self, estado, jugador, desde, limite):
+        condiciones, params = self._filtros(estado, jugador)
+        if desde:
+            params['fecha'], params['pid'] = _fecha(desde[0]), desde[1]
+            condiciones.append('(p.FechaCreacion < :fecha OR (p.FechaCreacion = :fecha AND p.PartidaID < :pid))')
+        where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+        params['limite'] = limite
+        with self._cursor('listar_partidas') as cursor:
+            cursor.execute(f'''
+                SELECT p.PartidaID, j1.Nombre, j2.Nombre, p.Estado, SUBSTR(p.FechaCreacion, 1, 19), p.FechaCreacion
+                FROM Partidas p
+                JOIN Jugadores j1 ON p.IDJUGADOR = j1.JugadorID
+                JOIN Jugadores j2 ON p.IDRival = j2.JugadorID
+                {where}
+                ORDER BY p.FechaCreacion DESC, p.PartidaID DESC
+                LIMIT :limite
+            ''', params)
+            return [fila[:5] + (datetime.fromisoformat(fila[5]),) for fila in cursor.fetchall()]
+
+    def contar_partidas(self, estado, jugador):
+        condiciones, params = self._filtros(estado, jugador)
+        where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+        with self._cursor('contar_partidas') as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM Partidas p {where}', params)
+            return cursor.fetchone()[0]
+
+    def listar_jugadas(self, id_partida):
+        with self._cursor('listar_jugadas') as cursor:
+            return listar_jugadas(cursor, id_partida)
+
+    def novedades(self, id_partida, desde):
+        with self._cursor('novedades') as cursor:
+            cursor.execute("""
+                SELECT p.Estado, jg.Numero, jg.Columna
+                FROM Partidas p
+                LEFT JOIN Jugadas jg ON jg.PartidaID = p.PartidaID AND jg.Numero > :n
+                WHERE p.PartidaID = :pid
+                ORDER BY jg.Numero
+            """, {'pid': id_partida, 'n': desde})
+            filas = cursor.fetchall()
+        if not filas:
+            raise PartidaNoEncontrada('Partida no encontrada')
+        return filas[0][0], [(numero, columna) for _, numero, columna in filas if numero is not None]
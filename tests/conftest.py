@@ -0,0 +1,7 @@
+# Las pruebas corren con el backend en memoria: no hace falta Oracle
+import os
+import sys
+
+os.environ.setdefault('KUATRO_BACKEND', 'memoria')
+os.environ.setdefault('KUATRO_EXPORTAR_TOKEN', 'prueba')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
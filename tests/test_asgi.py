@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+import asgi
+from repositorio import obtener_repositorio
+
+
+async def _llamar(ruta, encabezados=()):
+    mensajes = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(mensaje):
+        mensajes.append(mensaje)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': ruta, 'query_string': b'',
+             'headers': [(k.encode(), v.encode()) for k, v in encabezados]}
+    await asgi.app(scope, receive, send)
+    return mensajes
+
+
+def test_export_se_envia_por_partes():
+    repositorio = obtener_repositorio()
+    for i in range(5):
+        repositorio.registrar_jugador(f'Exportado {i}', 9000 + i)
+
+    mensajes = asyncio.run(_llamar('/api/export', [('X-Kuatro-Token', 'prueba')]))
+
+    assert mensajes[0]['type'] == 'http.response.start'
+    assert mensajes[0]['status'] == 200
+    partes = [m for m in mensajes[1:] if m['body']]
+    assert len(partes) > 1
+    assert all(m.get('more_body') for m in partes)
+    assert not mensajes[-1].get('more_body')
+    lineas = b''.join(m['body'] for m in partes).decode().splitlines()
+    nombres = {json.loads(linea).get('Nombre') for linea in lineas}
+    assert {f'Exportado {i}' for i in range(5)} <= nombres
+
+
+def test_export_sin_token_no_autorizado():
+    mensajes = asyncio.run(_llamar('/api/export'))
+    assert mensajes[0]['status'] == 403
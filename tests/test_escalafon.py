@@ -0,0 +1,30 @@
+from app import app
+import ia
+from repositorio import obtener_repositorio
+
+
+def test_computadora_fuera_del_escalafon_y_del_rango():
+    cliente = app.test_client()
+    jugador_id = obtener_repositorio().registrar_jugador('Retador', 7001)
+    id_partida = cliente.post('/api/crear_partida',
+                              json={'jugador1': 'Retador', 'jugador2': ia.JUGADOR_IA}).get_json()['id_partida']
+
+    # El jugador tira siempre en la primera columna libre y la computadora contesta
+    respuesta = {'ganador': None, 'empate': False}
+    while respuesta['ganador'] is None and not respuesta['empate']:
+        for columna in range(7):
+            respuesta = cliente.post(f'/api/partida/{id_partida}/jugada', json={'columna': columna})
+            if respuesta.status_code == 200:
+                break
+        respuesta = respuesta.get_json()
+        if respuesta['ganador'] is None and not respuesta['empate']:
+            respuesta = cliente.post(f'/api/partida/{id_partida}/jugada_ia', json={'nivel': 'facil'}).get_json()
+    assert cliente.post(f'/api/partida/{id_partida}/resultado').get_json()['registrado']
+
+    jugadores = cliente.get('/api/escalafon').get_json()
+    assert 'Retador' in {j['Nombre'] for j in jugadores}
+    assert ia.JUGADOR_IA not in {j['Nombre'] for j in jugadores}
+
+    rango = cliente.get(f'/api/jugador/{jugador_id}/rango').get_json()
+    assert rango['success']
+    assert ia.JUGADOR_IA not in {j['Nombre'] for j in rango['alrededor']}
@@ -0,0 +1,213 @@
+# Torneos de la computadora contra sí misma, para llenar la base con partidas
+# realistas (pruebas de carga, calibrar el rating) sin jugadores humanos.
+#
+#   flask --app app torneo --formato suizo --jugadores 64 --niveles facil,normal
+#   flask --app app torneo --formato todos --jugadores 10 --vueltas 2 --procesos 8
+#
+# Cada participante es un jugador de verdad ("Torneo normal 3") que se
+# registra la primera vez y se reutiliza en torneos siguientes, así que su
+# rating se sigue calibrando. Las partidas se juegan en un pool de procesos
+# (una partida por tarea) con motor.Posicion y ia.elegir_jugada, lo mismo que
+# usa el servidor; las primeras `aleatorias` jugadas son al azar para que no
+# se repita siempre la misma partida. El proceso principal calcula el Elo en
+# orden y escribe de a `lote` partidas con guardar_partidas_terminadas:
+# partidas, jugadas, resultados y jugadores en unos pocos executemany y un
+# solo commit.
+#
+# Todos contra todos juega todas las partidas a la vez. El suizo va por
+# rondas: cada ronda empareja a jugadores con puntaje parecido que no se
+# enfrentaron todavía, así que las rondas se juegan de a una.
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from ia import NIVELES, elegir_jugada
+from motor import Posicion, codificar
+from rango import RATING_INICIAL, deltas_resultado
+from repositorio import obtener_repositorio, sumas_resultado
+
+TORNEO_LOTE = int(os.environ.get('KUATRO_TORNEO_LOTE', '500'))
+# Las Identificacion de los participantes son IDENTIFICACION_BASE + crc32(nombre)
+IDENTIFICACION_BASE = 10 ** 10
+
+
+def jugar_partida(nivel1, nivel2, semilla, aleatorias):
+    # Corre en los procesos del pool; devuelve (columnas, ganador, tablero final)
+    azar = random.Random(semilla)
+    niveles = (nivel1, nivel2)
+    posicion = Posicion()
+    columnas = []
+    while not posicion.terminada:
+        if posicion.jugadas < aleatorias:
+            columna = azar.choice(posicion.jugadas_legales())
+        else:
+            columna = elegir_jugada(posicion, niveles[posicion.turno])
+        posicion.jugar(columna)
+        columnas.append(columna)
+    return ''.join(map(str, columnas)), posicion.ganador, codificar(posicion)
+
+
+#################################################################
+def inscribir(repositorio, cantidad, niveles, prefijo):
+    # [(JugadorID, nombre, nivel, rating)]; el nivel va rotando entre participantes
+    participantes = []
+    numeros = Counter()
+    for i in range(cantidad):
+        nivel = niveles[i % len(niveles)]
+        numeros[nivel] += 1
+        nombre = f'{prefijo} {nivel} {numeros[nivel]}'
+        encontrado = repositorio.buscar_jugador(nombre)
+        if encontrado is None:
+            identificacion = IDENTIFICACION_BASE + zlib.crc32(nombre.encode())
+            encontrado = (repositorio.registrar_jugador(nombre, identificacion), RATING_INICIAL)
+        participantes.append((encontrado[0], nombre, nivel, float(encontrado[1])))
+    return participantes
+
+
+class Torneo:
+    def __init__(self, repositorio, participantes, lote=TORNEO_LOTE):
+        self.repositorio = repositorio
+        self.niveles = {jid: nivel for jid, _, nivel, _ in participantes}
+        self.nombres = {jid: nombre for jid, nombre, _, _ in participantes}
+        self.ratings = {jid: rating for jid, _, _, rating in participantes}
+        self.puntos = dict.fromkeys(self.niveles, 0.0)
+        self.enfrentados = Counter()        # frozenset({a, b}) -> partidas jugadas
+        self.primeros = Counter()           # JugadorID -> partidas en que movió primero
+        self.lote = lote
+        self._pendientes = []
+        self._sumas = {}
+        self.partidas = 0
+        self.jugadas = 0
+
+    def anotar(self, jugador1, jugador2, columnas, ganador, tablero):
+        # Elo en el orden de las partidas, igual que recalcular-ratings sobre Resultados
+        deltas = deltas_resultado(jugador1, jugador2, self.ratings[jugador1], self.ratings[jugador2], ganador)
+        for jugador_id, delta in deltas.items():
+            self.ratings[jugador_id] += delta
+        for jugador_id, suma in sumas_resultado(jugador1, jugador2, ganador).items():
+            acumulado = self._sumas.setdefault(jugador_id, [0, 0, 0, 0, 0.0])
+            for i, valor in enumerate(suma + [deltas[jugador_id]]):
+                acumulado[i] += valor
+        self.puntos[jugador1] += 0.5 if ganador is None else 1 - ganador
+        self.puntos[jugador2] += 0.5 if ganador is None else ganador
+        self.enfrentados[frozenset((jugador1, jugador2))] += 1
+        self.primeros[jugador1] += 1
+        self._pendientes.append({'idj': jugador1, 'idr': jugador2, 'tablero': tablero,
+                                 'jugadas': columnas, 'ganador': ganador})
+        self.partidas += 1
+        self.jugadas += len(columnas)
+        if len(self._pendientes) >= self.lote:
+            self.guardar()
+
+    def guardar(self):
+        if self._pendientes:
+            self.repositorio.guardar_partidas_terminadas(self._pendientes, self._sumas)
+            self._pendientes, self._sumas = [], {}
+
+    def con_colores(self, a, b):
+        # Mueve primero el que lo hizo menos veces
+        return (a, b) if (self.primeros[a], b) <= (self.primeros[b], a) else (b, a)
+
+    def emparejar_suizo(self):
+        # Por puntaje y luego rating; a cada uno le toca el siguiente que no enfrentó (o el siguiente)
+        libres = sorted(self.puntos, key=lambda j: (-self.puntos[j], -self.ratings[j]))
+        pares = []
+        while len(libres) > 1:
+            a = libres.pop(0)
+            b = next((otro for otro in libres if not self.enfrentados[frozenset((a, otro))]), libres[0])
+            libres.remove(b)
+            pares.append(self.con_colores(a, b))
+        return pares
+
+    def tabla(self):
+        # [(nombre, nivel, puntos, rating)] de mejor a peor
+        orden = sorted(self.puntos, key=lambda j: (-self.puntos[j], -self.ratings[j]))
+        return [(self.nombres[j], self.niveles[j], self.puntos[j], self.ratings[j]) for j in orden]
+
+
+def rondas_todos(torneo, vueltas):
+    # Una sola ronda con todas las partidas; en cada vuelta se invierten los colores
+    ids = list(torneo.niveles)
+    yield [(a, b) if vuelta % 2 == 0 else (b, a)
+           for vuelta in range(vueltas) for a, b in itertools.combinations(ids, 2)]
+
+
+def rondas_suizo(torneo, rondas):
+    for _ in range(rondas):
+        yield torneo.emparejar_suizo()
+
+
+def jugar_torneo(torneo, rondas, procesos, aleatorias, semilla, avisar=None):
+    # Devuelve los segundos que tardó; las partidas de cada ronda se reparten entre los procesos
+    procesos = procesos or os.cpu_count() or 1
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as ejecutor:
+        for numero, pares in enumerate(rondas, 1):
+            if not pares:
+                continue
+            comienzo = time.perf_counter()
+            semillas = [semilla * 1_000_003 + torneo.partidas + i for i in range(len(pares))]
+            resultados = ejecutor.map(
+                jugar_partida,
+                [torneo.niveles[a] for a, _ in pares],
+                [torneo.niveles[b] for _, b in pares],
+                semillas,
+                [aleatorias] * len(pares),
+                chunksize=max(1, len(pares) // (procesos * 8))
+            )
+            for (a, b), (columnas, ganador, tablero) in zip(pares, resultados):
+                torneo.anotar(a, b, columnas, ganador, tablero)
+            if avisar:
+                avisar(numero, len(pares), time.perf_counter() - comienzo)
+    torneo.guardar()
+    return time.perf_counter() - inicio
+
+
+#################################################################
+@click.command('torneo')
+@click.option('--formato', type=click.Choice(['suizo', 'todos']), default='suizo', show_default=True,
+              help='Suizo por rondas o todos contra todos')
+@click.option('--jugadores', default=16, show_default=True, help='Participantes')
+@click.option('--niveles', default='facil,normal', show_default=True,
+              help=f'Niveles de la computadora, separados por coma ({", ".join(NIVELES)})')
+@click.option('--rondas', default=None, type=int, help='Rondas del suizo (por defecto, log2(jugadores) + 2)')
+@click.option('--vueltas', default=2, show_default=True, help='Partidas de cada pareja en todos contra todos')
+@click.option('--aleatorias', default=4, show_default=True, help='Primeras jugadas al azar de cada partida')
+@click.option('--procesos', default=None, type=int, help='Procesos en paralelo (por defecto, todos los núcleos)')
+@click.option('--lote', default=TORNEO_LOTE, show_default=True, help='Partidas por cada escritura a la base')
+@click.option('--semilla', default=0, show_default=True, help='Semilla de las jugadas al azar')
+@click.option('--prefijo', default='Torneo', show_default=True, help='Comienzo del nombre de los participantes')
+def torneo_comando(formato, jugadores, niveles, rondas, vueltas, aleatorias, procesos, lote, semilla, prefijo):
+    """Juega un torneo de la computadora contra sí misma y guarda las partidas."""
+    niveles = [nivel.strip() for nivel in niveles.split(',') if nivel.strip()]
+    desconocidos = [nivel for nivel in niveles if nivel not in NIVELES]
+    if desconocidos or not niveles:
+        raise click.BadParameter(f'niveles desconocidos: {", ".join(desconocidos)}', param_hint='--niveles')
+    if jugadores < 2:
+        raise click.BadParameter('se necesitan al menos 2', param_hint='--jugadores')
+    repositorio = obtener_repositorio()
+    torneo = Torneo(repositorio, inscribir(repositorio, jugadores, niveles, prefijo), lote)
+    if formato == 'todos':
+        total_rondas = 1
+        calendario = rondas_todos(torneo, vueltas)
+    else:
+        total_rondas = rondas or math.ceil(math.log2(jugadores)) + 2
+        calendario = rondas_suizo(torneo, total_rondas)
+
+    def avisar(numero, partidas, segundos):
+        click.echo(f'Ronda {numero}/{total_rondas}: {partidas} partidas en {segundos:.1f} s '
+                   f'({partidas / segundos:.1f} partidas/s)', err=True)
+
+    segundos = jugar_torneo(torneo, calendario, procesos, aleatorias, semilla, avisar)
+    click.echo(f'Partidas: {torneo.partidas}, jugadas: {torneo.jugadas}, {segundos:.1f} s, '
+               f'{torneo.partidas / segundos:.1f} partidas/s, {torneo.jugadas / segundos:.0f} jugadas/s')
+    for lugar, (nombre, _, puntos, rating) in enumerate(torneo.tabla()[:10], 1):
+        click.echo(f'{lugar:>3}. {nombre:<24} {puntos:>5.1f} pts  rating {rating:7.1f}')
@@ -0,0 +1,296 @@
+# Transmisión en vivo de partidas para espectadores (Server-Sent Events).
+#
+# Hay un Canal por partida observada y proceso. El canal tiene un solo hilo
+# que lee de la base las jugadas nuevas y las reparte a las colas de todos sus
+# espectadores, así N espectadores cuestan una consulta y no N. Las rutas que
+# registran jugadas en este proceso llaman a notificar() para que el hilo lea
+# enseguida; las jugadas hechas en otros procesos llegan en el siguiente sondeo.
+import asyncio
+import logging
+import os
+import queue
+import threading
+
+from flask import json
+
+from motor import codificar
+from repositorio import obtener_repositorio, PartidaNoEncontrada, SinConexion
+
+SONDEO = float(os.environ.get('KUATRO_STREAM_SONDEO', '1.0'))
+LATIDO = float(os.environ.get('KUATRO_STREAM_LATIDO', '15'))
+# Eventos que un espectador puede tener sin leer antes de cortarle la conexión
+MAX_PENDIENTES = int(os.environ.get('KUATRO_STREAM_COLA', '64'))
+
+log = logging.getLogger(__name__)
+
+_canales = {}
+_lock = threading.Lock()
+
+
+def evento_sse(tipo, datos, id_evento=None):
+    lineas = []
+    if id_evento is not None:
+        lineas.append(f'id: {id_evento}')
+    lineas.append(f'event: {tipo}')
+    lineas.append(f'data: {json.dumps(datos)}')
+    return '\n'.join(lineas) + '\n\n'
+
+
+def _leer_posicion(id_partida):
+    try:
+        posicion, estado, _, _ = obtener_repositorio().cargar_partida(id_partida)
+    except PartidaNoEncontrada:
+        return None, None
+    return posicion, estado
+
+
+def _foto(posicion, estado):
+    return {
+        'tablero': codificar(posicion),
+        'turno': posicion.turno,
+        'jugadas': posicion.jugadas,
+        'estado': estado,
+    }
+
+
+def _entregar(cola, evento):
+    try:
+        cola.put_nowait(evento)
+        return True
+    except queue.Full:
+        return False
+
+
+def _cortar(cola):
+    # None le indica al generador que termine; si la cola está llena se vacía antes
+    while not _entregar(cola, None):
+        try:
+            cola.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class Canal:
+    def __init__(self, id_partida, posicion, estado):
+        self.id_partida = id_partida
+        self.posicion = posicion
+        self.estado = estado
+        self.suscriptores = set()
+        self.aviso = threading.Event()
+        self.cerrado = False
+        self._hilo = threading.Thread(target=self._sondear, name=f'canal-{id_partida}', daemon=True)
+
+    def foto(self):
+        return _foto(self.posicion, self.estado)
+
+    def _repartir(self, evento):
+        for suscriptor in list(self.suscriptores):
+            if not _entregar(suscriptor, evento):
+                # Espectador que no lee: se le cierra el stream
+                self.suscriptores.discard(suscriptor)
+                _cortar(suscriptor)
+
+    def _leer_novedades(self, desde):
+        # Estado y jugadas posteriores a `desde` en una sola lectura
+        try:
+            estado, jugadas = obtener_repositorio().novedades(self.id_partida, desde)
+        except PartidaNoEncontrada:
+            return (None, None), None, []
+        if jugadas and jugadas[0][0] != desde + 1:
+            # El historial se reinició (tablero reemplazado): hace falta la foto completa
+            return _leer_posicion(self.id_partida), None, []
+        return None, estado, jugadas
+
+    def _aplicar(self, reinicio, estado, jugadas):
+        # Se llama con _lock tomado
+        if reinicio is not None:
+            self.posicion, self.estado = reinicio
+            if self.posicion is None:
+                self.estado = None
+                return
+            self._repartir(evento_sse('estado', self.foto(), self.posicion.jugadas))
+        if estado is not None:
+            self.estado = estado
+        for numero, columna in jugadas:
+            jugador = self.posicion.turno
+            fila = self.posicion.jugar(columna)
+            self._repartir(evento_sse('jugada', {
+                'numero': numero,
+                'columna': columna,
+                'fila': fila,
+                'jugador': jugador,
+                'ganador': self.posicion.ganador,
+                'empate': self.posicion.empate,
+            }, numero))
+
+    def _terminada(self):
+        return self.posicion is None or self.estado == 'Terminada' or self.posicion.terminada
+
+    def _sondear(self):
+        while not self.cerrado:
+            self.aviso.wait(SONDEO)
+            self.aviso.clear()
+            with _lock:
+                if not self.suscriptores:
+                    self.cerrar()
+                    return
+                desde = self.posicion.jugadas
+            try:
+                reinicio, estado, jugadas = self._leer_novedades(desde)
+            except Exception:
+                log.warning('Error al leer jugadas de la partida %s', self.id_partida, exc_info=True)
+                continue
+            with _lock:
+                try:
+                    self._aplicar(reinicio, estado, jugadas)
+                    if self._terminada():
+                        self._repartir(evento_sse('fin', {'estado': self.estado}))
+                        self._cortar_todos()
+                except Exception:
+                    # La posición del canal pudo quedar a medias: se cierra sin 'fin' y los
+                    # espectadores se reconectan (retry) con una foto nueva de la base
+                    log.exception('Error al transmitir la partida %s', self.id_partida)
+                    self._cortar_todos()
+
+    def _cortar_todos(self):
+        # Se llama con _lock tomado
+        for suscriptor in self.suscriptores:
+            _cortar(suscriptor)
+        self.suscriptores.clear()
+        self.cerrar()
+
+    def cerrar(self):
+        # Se llama con _lock tomado
+        self.cerrado = True
+        if _canales.get(self.id_partida) is self:
+            del _canales[self.id_partida]
+
+
+class ColaAsync:
+    # Cola de un espectador atendido desde asyncio (asgi.py): el hilo del canal
+    # deja los eventos y despierta al event loop sin ocupar un hilo por espectador
+    def __init__(self, loop):
+        self._cola = queue.Queue(MAX_PENDIENTES)
+        self._loop = loop
+        self._hay = asyncio.Event()
+
+    def put_nowait(self, evento):
+        self._cola.put_nowait(evento)
+        try:
+            self._loop.call_soon_threadsafe(self._hay.set)
+        except RuntimeError:
+            pass
+
+    def get_nowait(self):
+        return self._cola.get_nowait()
+
+    async def get(self, timeout):
+        # Lanza asyncio.TimeoutError si no llega nada en `timeout` segundos
+        while True:
+            try:
+                return self._cola.get_nowait()
+            except queue.Empty:
+                pass
+            self._hay.clear()
+            if self._cola.empty():
+                await asyncio.wait_for(self._hay.wait(), timeout)
+
+
+def suscribir(id_partida, cola=None):
+    # Devuelve (cola, foto) o None si la partida no existe. Las partidas ya
+    # terminadas no abren canal y la cola es None.
+    if cola is None:
+        cola = queue.Queue(MAX_PENDIENTES)
+    with _lock:
+        canal = _canales.get(id_partida)
+        if canal is not None:
+            canal.suscriptores.add(cola)
+            return cola, canal.foto()
+    try:
+        posicion, estado = _leer_posicion(id_partida)
+    except SinConexion:
+        return None
+    if posicion is None:
+        return None
+    if estado == 'Terminada' or posicion.terminada:
+        return None, _foto(posicion, estado)
+    with _lock:
+        canal = _canales.get(id_partida)
+        nuevo = canal is None
+        if nuevo:
+            canal = _canales[id_partida] = Canal(id_partida, posicion, estado)
+        canal.suscriptores.add(cola)
+        foto = canal.foto()
+    if nuevo:
+        canal._hilo.start()
+    return cola, foto
+
+
+def desuscribir(id_partida, cola):
+    with _lock:
+        canal = _canales.get(id_partida)
+        if canal is not None:
+            canal.suscriptores.discard(cola)
+            if not canal.suscriptores:
+                canal.aviso.set()
+
+
+def notificar(id_partida):
+    # Llamar después del commit de una jugada o del fin de la partida
+    try:
+        canal = _canales.get(int(id_partida))
+    except (TypeError, ValueError):
+        return
+    if canal is not None:
+        canal.aviso.set()
+
+
+def transmitir(id_partida, cola, foto):
+    # Generador del cuerpo text/event-stream
+    try:
+        yield f'retry: {int(SONDEO * 1000)}\n\n'
+        yield evento_sse('estado', foto, foto['jugadas'])
+        if cola is None:
+            yield evento_sse('fin', {'estado': foto['estado']})
+            return
+        while True:
+            try:
+                evento = cola.get(timeout=LATIDO)
+            except queue.Empty:
+                # Si el cliente se fue, escribir el latido falla y el servidor cierra el generador
+                yield ': latido\n\n'
+                continue
+            if evento is None:
+                return
+            yield evento
+    finally:
+        desuscribir(id_partida, cola)
+
+
+async def transmitir_async(id_partida, cola, foto):
+    # Igual que transmitir, con una ColaAsync
+    try:
+        yield f'retry: {int(SONDEO * 1000)}\n\n'
+        yield evento_sse('estado', foto, foto['jugadas'])
+        if cola is None:
+            yield evento_sse('fin', {'estado': foto['estado']})
+            return
+        while True:
+            try:
+                evento = await cola.get(LATIDO)
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            if evento is None:
+                return
+            yield evento
+    finally:
+        desuscribir(id_partida, cola)
+
+
+def estadisticas_transmision():
+    with _lock:
+        return {
+            'canales': len(_canales),
+            'espectadores': sum(len(c.suscriptores) for c in _canales.values()),
+        }